@@ -1,30 +1,90 @@
 from google.adk.agents import LlmAgent
 from google.adk.models.lite_llm import LiteLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
 from litellm import *
 from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
 import os
+import time
 #from dp.agent.adapter.adk import CalculationMCPToolset
 from google.adk.tools.mcp_tool.mcp_session_manager import SseServerParams
 
-from better_aim.tool_modify_guardrail import tool_modify_guardrail
+from better_aim.llm_limiter import llm_limiter
+from better_aim.metrics import errors_total, llm_first_token_seconds, llm_request_seconds, llm_tokens_total
+from better_aim.mcp_pool import mcp_connection_pool
+from better_aim.parallel_tools import parallel_tools
+from better_aim.tool_cache import tool_result_cache
+from better_aim.tool_modify_guardrail import record_tool_latency, tool_modify_guardrail
+from better_aim.tracing import tracer
+from better_aim.usage import token_usage
+
+
+class AdmittedLiteLlm(LiteLlm):
+    """每次模型调用前先检查会话token预算并经过全局准入控制，流式输出期间一直占用名额"""
+
+    admission_key: str = ""
+
+    def __init__(self, admission_key: str = "", **kwargs):
+        super().__init__(**kwargs)
+        self.admission_key = admission_key
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        rejection = token_usage.check_budget(self.admission_key)
+        if rejection is not None:
+            # 以一条不含工具调用的模型回复结束本轮，agent循环随之停止
+            print(f"--- {rejection} ---")
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=rejection)]),
+                              error_code="TOKEN_BUDGET_EXCEEDED",
+                              error_message=rejection)
+            return
+        with tracer.span(self.admission_key, "llm.request", model=self.model, stream=stream) as span:
+            queued = time.perf_counter()
+            async with llm_limiter.slot(self.admission_key):
+                started = time.perf_counter()
+                span.set_attribute("admission_wait_ms", round((started - queued) * 1000, 3))
+                first = True
+                try:
+                    async for response in super().generate_content_async(llm_request, stream=stream):
+                        if first:
+                            llm_first_token_seconds.observe(time.perf_counter() - started)
+                            span.set_attribute("first_token_ms", round((time.perf_counter() - started) * 1000, 3))
+                            first = False
+                        usage = response.usage_metadata
+                        if usage is not None and not response.partial:
+                            prompt_tokens = usage.prompt_token_count or 0
+                            completion_tokens = usage.candidates_token_count or 0
+                            cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+                            llm_tokens_total.inc(prompt_tokens, type="prompt")
+                            llm_tokens_total.inc(completion_tokens, type="completion")
+                            llm_tokens_total.inc(cached_tokens, type="cached")
+                            token_usage.record(self.admission_key, prompt_tokens, completion_tokens, cached_tokens)
+                            span.set_attribute("prompt_tokens", prompt_tokens)
+                            span.set_attribute("completion_tokens", completion_tokens)
+                        yield response
+                except Exception:
+                    errors_total.inc(source="llm")
+                    raise
+                finally:
+                    llm_request_seconds.observe(time.perf_counter() - started)
 
 
 def mcp_tools(mcp_tools_url):
-    return MCPToolset(
-        connection_params=SseServerParams(url=mcp_tools_url)
-    )
+    """返回进程级共享的MCP toolset，所有agent复用连接池中的连接；白名单中的工具经过结果缓存"""
+    return tool_result_cache.wrap(mcp_connection_pool.toolset(mcp_tools_url))
 
 
 def create_llm_agent(session_id: str, mcp_tools_url: str, agent_info: dict, model_config: dict) -> LlmAgent:
     """根据用户信息创建LlmAgent"""
 
     agent = LlmAgent(
-        model=LiteLlm(**model_config),
+        model=AdmittedLiteLlm(admission_key=session_id, **model_config),
         name=f"{agent_info['name'].replace('-','_')}_{session_id}",
         description=agent_info['description'],
         instruction=agent_info['instruction'] + "when calling mcp tools, do not use named submit_*** tools.",
         tools=[mcp_tools(mcp_tools_url=mcp_tools_url)],
-        before_tool_callback=tool_modify_guardrail
+        before_tool_callback=tool_modify_guardrail,
+        after_tool_callback=record_tool_latency,
+        after_model_callback=parallel_tools.after_model_callback
     )
 
     return agent
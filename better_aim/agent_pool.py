@@ -0,0 +1,202 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Any
+
+from google.adk.agents import LlmAgent
+
+
+class AgentPool:
+    """
+    有容量上限的agent池，取代原来只增不减的 active_agents 字典
+
+    - 超过 max_size 时按LRU淘汰最久未使用的agent
+    - 空闲超过 idle_ttl 秒的agent会在下一次访问池时被淘汰
+    - 被淘汰的会话再次请求时通过 factory 透明重建（ADK会话保存在session_service中，不受影响）
+    - 正在运行一轮对话或保持WebSocket连接的会话通过 pinned 固定，固定期间不会被淘汰（池可暂时超出 max_size）
+    - 统计命中/未命中/淘汰次数，供监控使用
+    """
+
+    def __init__(self,
+                 factory: Optional[Callable[[str], LlmAgent]] = None,
+                 max_size: int = 256,
+                 idle_ttl: float = 3600):
+        self._factory = factory
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._agents: "OrderedDict[str, LlmAgent]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._pins: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._eviction_listeners: List[Callable[[str, str], Any]] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions_lru = 0
+        self.evictions_ttl = 0
+
+    def configure(self,
+                  factory: Optional[Callable[[str], LlmAgent]] = None,
+                  max_size: Optional[int] = None,
+                  idle_ttl: Optional[float] = None):
+        """在启动时补充配置（模块导入时尚不知道agent的创建参数）"""
+        with self._lock:
+            if factory is not None:
+                self._factory = factory
+            if max_size is not None:
+                self.max_size = max_size
+            if idle_ttl is not None:
+                self.idle_ttl = idle_ttl
+            self._evict_expired()
+            self._evict_overflow()
+
+    def add_eviction_listener(self, listener: Callable[[str, str], Any]):
+        """注册淘汰回调 listener(session_id, reason)，reason 为 "lru" / "ttl" / "removed" """
+        self._eviction_listeners.append(listener)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            self._evict_expired()
+            return session_id in self._agents
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def __getitem__(self, session_id: str) -> LlmAgent:
+        return self.get(session_id)
+
+    def __setitem__(self, session_id: str, agent: LlmAgent):
+        self.put(session_id, agent)
+
+    def get(self, session_id: str) -> LlmAgent:
+        """获取agent，不存在（或已被淘汰）时通过factory重建"""
+        with self._lock:
+            self._evict_expired()
+            agent = self._agents.get(session_id)
+            if agent is not None:
+                self.hits += 1
+                self._touch(session_id)
+                return agent
+
+            self.misses += 1
+            if self._factory is None:
+                raise KeyError(session_id)
+
+        # 创建agent可能较慢，不持锁；并发创建时以先写入的为准
+        agent = self._factory(session_id)
+        with self._lock:
+            existing = self._agents.get(session_id)
+            if existing is not None:
+                self._touch(session_id)
+                return existing
+            self._insert(session_id, agent)
+        return agent
+
+    def put(self, session_id: str, agent: LlmAgent):
+        """放入（或替换）一个agent"""
+        with self._lock:
+            self._evict_expired()
+            self._insert(session_id, agent)
+
+    def pop(self, session_id: str) -> Optional[LlmAgent]:
+        """主动移除agent（例如用户登出）"""
+        with self._lock:
+            agent = self._remove(session_id)
+        if agent is not None:
+            self._notify(session_id, "removed")
+        return agent
+
+    def pin(self, session_id: str):
+        """固定会话（可嵌套），固定期间不会被LRU或空闲超时淘汰"""
+        with self._lock:
+            self._pins[session_id] = self._pins.get(session_id, 0) + 1
+
+    def unpin(self, session_id: str):
+        with self._lock:
+            count = self._pins.get(session_id, 0) - 1
+            if count > 0:
+                self._pins[session_id] = count
+                return
+            self._pins.pop(session_id, None)
+            # 空闲时间从解除固定时算起
+            if session_id in self._agents:
+                self._touch(session_id)
+            self._evict_overflow()
+
+    @contextmanager
+    def pinned(self, session_id: str) -> Iterator[None]:
+        self.pin(session_id)
+        try:
+            yield
+        finally:
+            self.unpin(session_id)
+
+    def evict_expired(self) -> int:
+        """清理所有空闲超时的agent，返回清理数量"""
+        with self._lock:
+            return self._evict_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回池的监控指标"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._agents),
+                "max_size": self.max_size,
+                "idle_ttl": self.idle_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions_lru": self.evictions_lru,
+                "evictions_ttl": self.evictions_ttl,
+                "pinned": len(self._pins),
+            }
+
+    def _touch(self, session_id: str):
+        self._agents.move_to_end(session_id)
+        self._last_used[session_id] = time.monotonic()
+
+    def _insert(self, session_id: str, agent: LlmAgent):
+        self._agents[session_id] = agent
+        self._touch(session_id)
+        self._evict_overflow()
+
+    def _remove(self, session_id: str) -> Optional[LlmAgent]:
+        self._last_used.pop(session_id, None)
+        return self._agents.pop(session_id, None)
+
+    def _evict_expired(self) -> int:
+        if not self.idle_ttl or self.idle_ttl <= 0:
+            return 0
+        deadline = time.monotonic() - self.idle_ttl
+        expired = []
+        # OrderedDict按最近使用排序，队首即最久未使用
+        for session_id in self._agents:
+            if self._last_used.get(session_id, 0) > deadline:
+                break
+            if session_id not in self._pins:
+                expired.append(session_id)
+        for session_id in expired:
+            self._remove(session_id)
+            self.evictions_ttl += 1
+            self._notify(session_id, "ttl")
+        return len(expired)
+
+    def _evict_overflow(self):
+        if not self.max_size or len(self._agents) <= self.max_size:
+            return
+        # 从最久未使用的开始淘汰，跳过固定的会话
+        victims = [session_id for session_id in self._agents if session_id not in self._pins]
+        for session_id in victims[:len(self._agents) - self.max_size]:
+            self._remove(session_id)
+            self.evictions_lru += 1
+            self._notify(session_id, "lru")
+
+    def _notify(self, session_id: str, reason: str):
+        print(f"♻️  回收agent: {session_id[:4]}*** ({reason})")
+        for listener in self._eviction_listeners:
+            try:
+                listener(session_id, reason)
+            except Exception as e:
+                print(f"agent淘汰回调失败: {e}")
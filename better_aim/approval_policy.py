@@ -0,0 +1,209 @@
+import fnmatch
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+# 单个参数的检查函数：参数值 -> 是否满足
+ArgCheck = Callable[[Any], bool]
+
+_MISSING = object()
+
+
+class PolicyDecision(NamedTuple):
+    approved: bool
+    reason: str  # rule / unchanged / trusted / ask
+    rule: Optional[str] = None
+
+
+class _CompiledRule:
+    """编译后的规则：所有参数检查都通过才匹配"""
+
+    def __init__(self, name: str, checks: List[Tuple[str, ArgCheck]]):
+        self.name = name
+        self.checks = checks
+
+    def matches(self, args: Dict[str, Any]) -> bool:
+        return all(check(args.get(arg_name, _MISSING)) for arg_name, check in self.checks)
+
+
+def _compile_check(tool_name: str, arg_name: str, spec: Any) -> ArgCheck:
+    """
+    把参数约束编译为检查函数
+
+    支持：{"in": [...]} 允许列表，{"min": x, "max": y} 数值范围，{"equals": v} 固定值，
+    {"pattern": "*.json"} 通配符，{"regex": "..."} 正则；非字典的值等价于 {"equals": 值}。
+    同一约束中的多个条件需同时满足，参数缺失时不匹配。
+    """
+    if not isinstance(spec, dict):
+        spec = {"equals": spec}
+    if not spec:
+        # 空约束会放行该参数的任意取值，多半是配置错误
+        raise ValueError(f"工具 '{tool_name}' 参数 '{arg_name}' 的约束为空")
+    unknown = set(spec) - {"in", "min", "max", "equals", "pattern", "regex"}
+    if unknown:
+        raise ValueError(f"工具 '{tool_name}' 参数 '{arg_name}' 的约束不支持: {sorted(unknown)}")
+
+    checks: List[ArgCheck] = []
+    if "in" in spec:
+        allowed = list(spec["in"])
+        checks.append(lambda value: value in allowed)
+    if "equals" in spec:
+        expected = spec["equals"]
+        checks.append(lambda value: value == expected)
+    if "min" in spec or "max" in spec:
+        low = spec.get("min", float("-inf"))
+        high = spec.get("max", float("inf"))
+
+        def in_range(value) -> bool:
+            try:
+                return low <= float(value) <= high
+            except (TypeError, ValueError):
+                return False
+
+        checks.append(in_range)
+    if "pattern" in spec:
+        regex = re.compile(fnmatch.translate(spec["pattern"]))
+        checks.append(lambda value: isinstance(value, str) and regex.match(value) is not None)
+    if "regex" in spec:
+        regex = re.compile(spec["regex"])
+        checks.append(lambda value: isinstance(value, str) and regex.fullmatch(value) is not None)
+
+    return lambda value: value is not _MISSING and all(check(value) for check in checks)
+
+
+class _ToolPolicy:
+    def __init__(self, rules: List[_CompiledRule], auto_approve_unchanged: bool):
+        self.rules = rules
+        self.auto_approve_unchanged = auto_approve_unchanged
+
+
+class ApprovalPolicy:
+    """
+    工具参数的自动确认策略，在 tool_modify_guardrail 中于拦截之前评估
+
+    配置示例（JSON）：
+        {
+          "tools": {
+            "run_training": {
+              "auto_approve_unchanged": true,
+              "rules": [
+                {"name": "small-cpu-job", "args": {"device": {"in": ["cpu"]}, "epochs": {"min": 1, "max": 50}}}
+              ]
+            }
+          }
+        }
+
+    任一规则匹配、参数与该会话上一次确认的参数相同（需开启 auto_approve_unchanged）、
+    或该工具已被会话设为信任时直接放行，否则交给用户确认。规则在 configure 时编译一次。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tools: Dict[str, _ToolPolicy] = {}
+        self._last_approved: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._trusted: Dict[str, Set[str]] = {}
+        self._decisions: Dict[Tuple[str, str], int] = {}
+
+    def configure(self, config: Optional[Dict[str, Any]]):
+        """编译策略配置，配置有误时抛出ValueError"""
+        tools: Dict[str, _ToolPolicy] = {}
+        for tool_name, tool_config in ((config or {}).get("tools") or {}).items():
+            rules = []
+            for i, rule in enumerate(tool_config.get("rules", [])):
+                rule_name = rule.get("name") or f"{tool_name}#{i}"
+                if not rule.get("args"):
+                    # 没有参数约束的规则会放行该工具的所有调用
+                    raise ValueError(f"工具 '{tool_name}' 的规则 '{rule_name}' 没有参数约束")
+                checks = [(arg_name, _compile_check(tool_name, arg_name, spec))
+                          for arg_name, spec in rule["args"].items()]
+                rules.append(_CompiledRule(rule_name, checks))
+            tools[tool_name] = _ToolPolicy(rules, bool(tool_config.get("auto_approve_unchanged", False)))
+        self._tools = tools
+        if tools:
+            print(f"✅ 已加载 {len(tools)} 个工具的自动确认策略")
+
+    def evaluate(self, session_id: str, tool_name: str, args: Dict[str, Any]) -> PolicyDecision:
+        with self._lock:
+            trusted = tool_name in self._trusted.get(session_id, ())
+            last_approved = self._last_approved.get((session_id, tool_name))
+        policy = self._tools.get(tool_name)
+
+        if trusted:
+            decision = PolicyDecision(True, "trusted")
+        elif policy is not None and policy.auto_approve_unchanged and last_approved == args:
+            decision = PolicyDecision(True, "unchanged")
+        else:
+            decision = PolicyDecision(False, "ask")
+            for rule in policy.rules if policy is not None else []:
+                if rule.matches(args):
+                    decision = PolicyDecision(True, "rule", rule.name)
+                    break
+        self._count(tool_name, decision.reason)
+        return decision
+
+    def record_approved(self, session_id: str, tool_name: str, args: Dict[str, Any], by_user: bool = False):
+        """记录会话中该工具最近一次确认执行的参数，by_user 表示由用户手动确认"""
+        with self._lock:
+            self._last_approved[(session_id, tool_name)] = dict(args)
+        if by_user:
+            self._count(tool_name, "user_approved")
+
+    def record_rejected(self, tool_name: str):
+        self._count(tool_name, "rejected")
+
+    def trust(self, session_id: str, tool_name: str):
+        with self._lock:
+            self._trusted.setdefault(session_id, set()).add(tool_name)
+
+    def untrust(self, session_id: str, tool_name: str):
+        with self._lock:
+            trusted = self._trusted.get(session_id)
+            if trusted is not None:
+                trusted.discard(tool_name)
+                if not trusted:
+                    del self._trusted[session_id]
+
+    def trusted_tools(self, session_id: str) -> List[str]:
+        with self._lock:
+            return sorted(self._trusted.get(session_id, ()))
+
+    def discard(self, session_id: str):
+        """清理会话的信任列表与最近确认记录（会话被回收时调用）"""
+        with self._lock:
+            self._trusted.pop(session_id, None)
+            for key in [key for key in self._last_approved if key[0] == session_id]:
+                del self._last_approved[key]
+
+    def _count(self, tool_name: str, outcome: str):
+        with self._lock:
+            key = (tool_name, outcome)
+            self._decisions[key] = self._decisions.get(key, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decisions = dict(self._decisions)
+            trusted_sessions = len(self._trusted)
+        totals: Dict[str, int] = {}
+        per_tool: Dict[str, Dict[str, int]] = {}
+        for (tool_name, outcome), count in decisions.items():
+            totals[outcome] = totals.get(outcome, 0) + count
+            per_tool.setdefault(tool_name, {})[outcome] = count
+        return {
+            "policy_tools": sorted(self._tools),
+            "decisions": totals,
+            "tools": per_tool,
+            "trusted_sessions": trusted_sessions,
+        }
+
+
+def load_approval_policy(path: Optional[str]) -> Optional[Dict[str, Any]]:
+    """读取JSON格式的策略文件，未指定路径时返回None"""
+    if not path:
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# 全局自动确认策略
+approval_policy = ApprovalPolicy()
@@ -0,0 +1,158 @@
+import asyncio
+import gzip
+import os
+import queue
+import tarfile
+import threading
+import zipfile
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from better_aim.file_index import EXCLUDED_DIRS, is_excluded_file, resolve_session_path
+
+ARCHIVE_FORMATS = {
+    "zip": ("application/zip", ".zip"),
+    "tar.gz": ("application/gzip", ".tar.gz"),
+}
+
+def resolve_archive_roots(session_dir: str, paths: Optional[List[str]] = None) -> List[str]:
+    """把请求的相对路径解析为会话目录内的绝对路径，未指定时打包整个会话目录"""
+    base = os.path.realpath(session_dir)
+    if not paths:
+        return [base]
+    roots = []
+    for path in paths:
+        full_path = resolve_session_path(base, path)
+        if not os.path.exists(full_path):
+            raise FileNotFoundError(path)
+        roots.append(full_path)
+    return roots
+
+
+def iter_archive_files(session_dir: str, roots: List[str]) -> Iterator[Tuple[str, str]]:
+    """递归列出要打包的文件，产出 (绝对路径, 包内路径)，不跟随指向会话目录之外的符号链接"""
+    base = os.path.realpath(session_dir)
+    for root in roots:
+        if os.path.isfile(root):
+            yield root, os.path.relpath(root, base)
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if d not in EXCLUDED_DIRS)
+            for name in sorted(filenames):
+                if is_excluded_file(name):
+                    continue
+                path = os.path.join(dirpath, name)
+                real_path = os.path.realpath(path)
+                if os.path.commonpath([base, real_path]) != base or not os.path.isfile(real_path):
+                    continue
+                yield path, os.path.relpath(path, base)
+
+
+class _ArchiveAborted(Exception):
+    pass
+
+
+class _QueueWriter:
+    """
+    不可seek的只写文件对象，按块投递到有界队列
+
+    队列满时阻塞打包线程，从而把内存占用限制在 max_chunks * chunk_size 左右；
+    消费方放弃（客户端断开）后，下一次写入抛出 _ArchiveAborted 让打包线程退出。
+    """
+
+    def __init__(self, chunks: queue.Queue, aborted: threading.Event, chunk_size: int):
+        self._chunks = chunks
+        self._aborted = aborted
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        if len(self._buffer) >= self._chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _put(self, item):
+        while True:
+            if self._aborted.is_set():
+                raise _ArchiveAborted()
+            try:
+                self._chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+def _write_archive(writer: _QueueWriter, files: Iterator[Tuple[str, str]], fmt: str, compresslevel: int):
+    if fmt == "zip":
+        # 输出不可seek，zipfile会自动改用数据描述符，无需临时文件
+        with zipfile.ZipFile(writer, mode="w", compression=zipfile.ZIP_DEFLATED,
+                             compresslevel=compresslevel, allowZip64=True) as archive:
+            for path, arcname in files:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, "rb") as src, archive.open(info, "w") as dst:
+                    while True:
+                        data = src.read(1024 * 1024)
+                        if not data:
+                            break
+                        dst.write(data)
+    else:
+        with gzip.GzipFile(fileobj=writer, mode="wb", compresslevel=compresslevel) as gz, \
+                tarfile.open(fileobj=gz, mode="w|") as archive:
+            for path, arcname in files:
+                archive.add(path, arcname=arcname, recursive=False)
+    writer.flush()
+
+
+async def stream_archive(session_dir: str,
+                         roots: List[str],
+                         fmt: str = "zip",
+                         compresslevel: int = 6,
+                         chunk_size: int = 64 * 1024,
+                         max_chunks: int = 16) -> AsyncIterator[bytes]:
+    """边打包边产出压缩包数据块，打包在后台线程中进行，内存占用有界"""
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"不支持的压缩格式: {fmt}")
+    chunks: queue.Queue = queue.Queue(maxsize=max_chunks)
+    aborted = threading.Event()
+    done = object()
+
+    def produce():
+        writer = _QueueWriter(chunks, aborted, chunk_size)
+        try:
+            _write_archive(writer, iter_archive_files(session_dir, roots), fmt, compresslevel)
+            writer._put(done)
+        except _ArchiveAborted:
+            # 唤醒可能仍在等待数据的读取线程
+            try:
+                chunks.put_nowait(done)
+            except queue.Full:
+                pass
+        except Exception as e:
+            print(f"打包会话目录失败: {e}")
+            try:
+                writer._put(e)
+            except _ArchiveAborted:
+                try:
+                    chunks.put_nowait(done)
+                except queue.Full:
+                    pass
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = await asyncio.to_thread(chunks.get)
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                # 响应头已发出，只能中断连接让客户端感知下载失败
+                raise item
+            yield item
+    finally:
+        aborted.set()
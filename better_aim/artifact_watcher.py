@@ -0,0 +1,276 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from better_aim.file_index import EXCLUDED_DIRS, FileEntry, SessionFileIndex
+
+FileEventCallback = Callable[[List[Dict[str, Any]]], Awaitable[Any]]
+
+# inotify 常量（linux/inotify.h）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+               IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_libc()
+
+
+def inotify_available() -> bool:
+    return _libc is not None
+
+
+class _Inotify:
+    """基于ctypes的最小inotify封装，递归监听目录，记录事件涉及的文件（相对路径）供下一次扫描使用"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches: Dict[int, str] = {}
+        self.changed: Set[str] = set()
+        self.overflowed = False  # 事件队列溢出，变化的文件未知
+        self.add_tree(root)
+
+    def add_tree(self, path: str):
+        for dirpath, dirnames, _ in os.walk(path):
+            dirnames[:] = [d for d in dirnames if d not in EXCLUDED_DIRS]
+            self._add_watch(dirpath)
+
+    def _add_watch(self, path: str):
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd >= 0:
+            self._watches[wd] = path
+
+    def take_changed(self) -> Tuple[Set[str], bool]:
+        """取出自上次调用以来变化的文件与是否发生过溢出"""
+        changed, overflowed = self.changed, self.overflowed
+        self.changed, self.overflowed = set(), False
+        return changed, overflowed
+
+    def read_events(self) -> bool:
+        """读取并处理所有待读事件（为新建的子目录添加监听），返回是否需要重新扫描"""
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            if not data:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + _EVENT_HEADER.size: offset + _EVENT_HEADER.size + name_len].rstrip(b"\0")
+                offset += _EVENT_HEADER.size + name_len
+                changed = True
+                if mask & IN_Q_OVERFLOW:
+                    self.overflowed = True
+                elif mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                elif name:
+                    name = os.fsdecode(name)
+                    parent = self._watches.get(wd)
+                    if parent is None:
+                        continue
+                    if not mask & IN_ISDIR:
+                        # 新增与删除会改变目录 mtime，这里记录的主要是原地写入
+                        self.changed.add(os.path.relpath(os.path.join(parent, name), self.root))
+                    elif mask & (IN_CREATE | IN_MOVED_TO) and name not in EXCLUDED_DIRS:
+                        self.add_tree(os.path.join(parent, name))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ArtifactWatcher:
+    """
+    监听会话目录，把文件的新增/修改/删除推送给回调
+
+    Linux上使用inotify唤醒（另以 safety_interval 低频兜底扫描），否则每 poll_interval 秒轮询一次。
+    变化通过会话文件索引的前后快照比较得出，索引只重新扫描 mtime 变化的目录，因此轮询的开销也很小。
+    inotify 报告的文件通过 mark_changed 交给索引，只重新 stat 这些文件，原地追加（IN_MODIFY）也能得到 file_modified；
+    事件队列溢出时才重新 stat 全部文件。轮询时平时只检查 hot_window 内修改过的文件，
+    每 safety_interval 秒重新 stat 全部文件一次，空闲后又被原地追加的文件最迟在这时发现。
+    事件在 debounce 秒内合并后一次性回调。
+    """
+
+    def __init__(self,
+                 session_dir: str,
+                 on_events: FileEventCallback,
+                 index: Optional[SessionFileIndex] = None,
+                 poll_interval: float = 2.0,
+                 safety_interval: float = 30.0,
+                 debounce: float = 0.3,
+                 use_inotify: bool = True):
+        self.session_dir = session_dir
+        self.on_events = on_events
+        self.index = index or SessionFileIndex(session_dir)
+        self.poll_interval = poll_interval
+        self.safety_interval = safety_interval
+        self.debounce = debounce
+        self.use_inotify = use_inotify and inotify_available()
+        self._task: Optional[asyncio.Task] = None
+        self._snapshot: Dict[str, Tuple[int, float]] = {}
+
+    @property
+    def backend(self) -> str:
+        return "inotify" if self.use_inotify else "polling"
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _take_snapshot(self, changed: Optional[Set[str]] = None, full: bool = False) -> Dict[str, Tuple[int, float]]:
+        if changed:
+            self.index.mark_changed(changed)
+        return {entry.path: (entry.size, entry.mtime) for entry in self.index.refresh(force=full)}
+
+    def _diff(self, snapshot: Dict[str, Tuple[int, float]]) -> List[Dict[str, Any]]:
+        events = []
+        for path, (size, mtime) in snapshot.items():
+            previous = self._snapshot.get(path)
+            if previous is None:
+                events.append(self._event("file_created", FileEntry(path, size, mtime)))
+            elif previous != (size, mtime):
+                events.append(self._event("file_modified", FileEntry(path, size, mtime)))
+        for path in self._snapshot.keys() - snapshot.keys():
+            events.append({"type": "file_deleted", "file": {"name": path, "path": os.path.join(self.session_dir, path)}})
+        return events
+
+    def _event(self, event_type: str, entry: FileEntry) -> Dict[str, Any]:
+        return {
+            "type": event_type,
+            "file": {
+                "name": entry.path,
+                "path": os.path.join(self.session_dir, entry.path),
+                "size": entry.size,
+                "mtime": entry.mtime,
+            },
+        }
+
+    async def _scan(self, changed: Optional[Set[str]] = None, full: bool = False):
+        snapshot = await asyncio.to_thread(self._take_snapshot, changed, full)
+        events = self._diff(snapshot)
+        self._snapshot = snapshot
+        if events:
+            try:
+                await self.on_events(events)
+            except Exception as e:
+                print(f"推送文件变化失败: {e}")
+
+    async def _run(self):
+        os.makedirs(self.session_dir, exist_ok=True)
+        self._snapshot = await asyncio.to_thread(self._take_snapshot, None, True)
+
+        inotify = None
+        wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        if self.use_inotify:
+            try:
+                inotify = _Inotify(self.session_dir)
+
+                def on_readable():
+                    if inotify.read_events():
+                        wakeup.set()
+
+                loop.add_reader(inotify.fd, on_readable)
+            except OSError as e:
+                print(f"inotify不可用，改为轮询: {e}")
+                inotify = None
+                self.use_inotify = False
+
+        try:
+            full_scan_at = loop.time() + self.safety_interval
+            while True:
+                timeout = self.safety_interval if inotify is not None else self.poll_interval
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=timeout)
+                    # 合并短时间内的连续事件（如大文件写入）
+                    await asyncio.sleep(self.debounce)
+                except asyncio.TimeoutError:
+                    pass
+                wakeup.clear()
+                if inotify is not None:
+                    changed, overflowed = inotify.take_changed()
+                    await self._scan(changed, full=overflowed)
+                else:
+                    full = loop.time() >= full_scan_at
+                    if full:
+                        full_scan_at = loop.time() + self.safety_interval
+                    await self._scan(full=full)
+        finally:
+            if inotify is not None:
+                loop.remove_reader(inotify.fd)
+                inotify.close()
+
+
+class ArtifactWatcherRegistry:
+    """按会话管理目录监听，WebSocket连接时启动，断开时停止"""
+
+    def __init__(self, poll_interval: float = 2.0, use_inotify: bool = True):
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self._watchers: Dict[str, ArtifactWatcher] = {}
+
+    def configure(self, poll_interval: Optional[float] = None, use_inotify: Optional[bool] = None):
+        if poll_interval is not None:
+            self.poll_interval = poll_interval
+        if use_inotify is not None:
+            self.use_inotify = use_inotify
+
+    def watch(self, session_id: str, session_dir: str, on_events: FileEventCallback,
+              index: Optional[SessionFileIndex] = None) -> ArtifactWatcher:
+        self.unwatch(session_id)
+        watcher = ArtifactWatcher(session_dir, on_events, index=index,
+                                  poll_interval=self.poll_interval, use_inotify=self.use_inotify)
+        watcher.start()
+        self._watchers[session_id] = watcher
+        return watcher
+
+    def unwatch(self, session_id: str):
+        watcher = self._watchers.pop(session_id, None)
+        if watcher is not None:
+            watcher.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        backends = [watcher.backend for watcher in self._watchers.values()]
+        return {
+            "watched_sessions": len(backends),
+            "inotify": backends.count("inotify"),
+            "polling": backends.count("polling"),
+        }
+
+
+# 全局产物目录监听
+artifact_watchers = ArtifactWatcherRegistry()
@@ -0,0 +1,224 @@
+import fnmatch
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+SESSION_ID_LENGTH = 32
+
+# 不对用户展示的内部文件：未完成的分块上传与上传临时文件
+EXCLUDED_DIRS = {".uploads"}
+
+
+def is_excluded_file(name: str) -> bool:
+    return name.startswith(".") and name.endswith(".part")
+
+
+def resolve_session_path(session_dir: str, relative_path: str) -> str:
+    """把相对路径解析为会话目录内的绝对路径，越界时抛出ValueError"""
+    base = os.path.realpath(session_dir)
+    full_path = os.path.realpath(os.path.join(base, relative_path))
+    if os.path.commonpath([base, full_path]) != base:
+        raise ValueError(f"路径超出会话目录: {relative_path}")
+    return full_path
+
+
+def is_valid_session_id(session_id: str) -> bool:
+    """会话ID为32位字母或数字（与登录时的规则一致），因此可以直接作为会话目录名"""
+    return len(session_id) == SESSION_ID_LENGTH and session_id.isascii() and session_id.isalnum()
+
+
+def resolve_session_dir(work_path: str, session_id: str) -> str:
+    """校验会话ID并返回其会话目录的绝对路径，会话ID不合法时抛出ValueError"""
+    if not is_valid_session_id(session_id):
+        raise ValueError(f"无效的会话ID: {session_id!r}")
+    return resolve_session_path(work_path, session_id)
+
+
+class FileEntry(NamedTuple):
+    path: str  # 相对会话目录的路径，使用 "/" 分隔
+    size: int
+    mtime: float
+
+
+class _DirState:
+    __slots__ = ("mtime_ns", "files", "subdirs")
+
+    def __init__(self, mtime_ns: int, files: Dict[str, Tuple[int, float]], subdirs: List[str]):
+        self.mtime_ns = mtime_ns
+        self.files = files
+        self.subdirs = subdirs
+
+
+class SessionFileIndex:
+    """
+    单个会话目录的递归文件索引
+
+    用 os.scandir 扫描并缓存每个目录的文件大小与修改时间。刷新时目录的 mtime 未变则复用缓存的列表，
+    只对最近 hot_window 秒内修改过的文件重新 stat（它们可能仍在被写入，而原地写入不会改变目录 mtime）；
+    强制刷新与 invalidate 之后的刷新会重新 stat 全部缓存的文件，以发现空闲一段时间后又被原地追加的文件（如训练日志）；
+    已知变化的文件（如inotify报告的路径）通过 mark_changed 登记，下一次刷新只额外 stat 这些文件。
+    两次刷新间隔小于 min_refresh_interval 时直接使用缓存。
+    """
+
+    SORT_KEYS = {
+        "name": lambda entry: entry.path.lower(),
+        "size": lambda entry: entry.size,
+        "mtime": lambda entry: entry.mtime,
+    }
+
+    def __init__(self, root: str, min_refresh_interval: float = 1.0, hot_window: float = 120.0):
+        self.root = root
+        self.min_refresh_interval = min_refresh_interval
+        self.hot_window = hot_window
+        self._dirs: Dict[str, _DirState] = {}
+        self._entries: List[FileEntry] = []
+        self._refreshed_at = 0.0
+        self._restat_all = False
+        self._changed: Set[str] = set()
+        self._lock = threading.Lock()
+        self.scanned_dirs = 0  # 最近一次刷新实际重新扫描的目录数
+        self.restatted_files = 0  # 最近一次刷新在未变化的目录中重新 stat 的文件数
+
+    def invalidate(self):
+        """下一次查询时重新检查全部文件（文件写入后调用，跳过 min_refresh_interval 节流）"""
+        self._refreshed_at = 0.0
+        self._restat_all = True
+
+    def mark_changed(self, paths: Iterable[str]):
+        """登记内容可能变化的文件（相对路径），下一次刷新跳过节流并重新 stat 它们"""
+        with self._lock:
+            self._changed.update(paths)
+            self._refreshed_at = 0.0
+
+    def refresh(self, force: bool = False) -> List[FileEntry]:
+        with self._lock:
+            now = time.time()
+            if not force and now - self._refreshed_at < self.min_refresh_interval:
+                return self._entries
+            restat_all = force or self._restat_all
+            self._restat_all = False
+            changed, self._changed = self._changed, set()
+            dirs: Dict[str, _DirState] = {}
+            entries: List[FileEntry] = []
+            self.scanned_dirs = 0
+            self.restatted_files = 0
+            stack = [""]
+            while stack:
+                rel_dir = stack.pop()
+                state = self._scan_dir(rel_dir, now, restat_all, changed)
+                if state is None:
+                    continue
+                dirs[rel_dir] = state
+                prefix = f"{rel_dir}/" if rel_dir else ""
+                for name, (size, mtime) in state.files.items():
+                    entries.append(FileEntry(prefix + name, size, mtime))
+                stack.extend(prefix + name for name in state.subdirs)
+            self._dirs = dirs
+            self._entries = entries
+            self._refreshed_at = now
+            return entries
+
+    def _scan_dir(self, rel_dir: str, now: float, restat_all: bool = False,
+                  changed: Optional[Set[str]] = None) -> Optional[_DirState]:
+        dir_path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            return None
+
+        cached = self._dirs.get(rel_dir)
+        if cached is not None and cached.mtime_ns == mtime_ns:
+            # 目录项未变化，只更新可能被写入的文件（stat 远比 scandir 便宜）
+            prefix = f"{rel_dir}/" if rel_dir else ""
+            for name, (size, mtime) in list(cached.files.items()):
+                if restat_all or now - mtime < self.hot_window or (changed and prefix + name in changed):
+                    self.restatted_files += 1
+                    try:
+                        stat_result = os.stat(os.path.join(dir_path, name))
+                        cached.files[name] = (stat_result.st_size, stat_result.st_mtime)
+                    except OSError:
+                        del cached.files[name]
+            return cached
+
+        self.scanned_dirs += 1
+        files: Dict[str, Tuple[int, float]] = {}
+        subdirs: List[str] = []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in EXCLUDED_DIRS:
+                                subdirs.append(entry.name)
+                        elif entry.is_file() and not is_excluded_file(entry.name):
+                            stat_result = entry.stat()
+                            files[entry.name] = (stat_result.st_size, stat_result.st_mtime)
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        return _DirState(mtime_ns, files, subdirs)
+
+    def query(self,
+              offset: int = 0,
+              limit: Optional[int] = None,
+              sort: str = "name",
+              order: str = "asc",
+              pattern: Optional[str] = None,
+              directory: Optional[str] = None) -> Tuple[int, List[FileEntry]]:
+        """
+        过滤、排序并分页，返回 (过滤后的总数, 当前页)
+
+        pattern 为大小写不敏感的通配符（如 "*.pth"），不含通配符时按子串匹配；directory 只列出该子目录下的文件。
+        """
+        entries = self.refresh()
+        if directory:
+            prefix = directory.strip("/") + "/"
+            entries = [entry for entry in entries if entry.path.startswith(prefix)]
+        if pattern:
+            pattern = pattern.lower()
+            if not any(ch in pattern for ch in "*?["):
+                pattern = f"*{pattern}*"
+            entries = [entry for entry in entries if fnmatch.fnmatchcase(entry.path.lower(), pattern)]
+        key = self.SORT_KEYS.get(sort, self.SORT_KEYS["name"])
+        entries = sorted(entries, key=key, reverse=(order == "desc"))
+        total = len(entries)
+        end = None if limit is None else offset + limit
+        return total, entries[offset:end]
+
+
+class FileIndexRegistry:
+    """按会话目录缓存文件索引，最多保留 max_sessions 个（LRU）"""
+
+    def __init__(self, max_sessions: int = 256):
+        self.max_sessions = max_sessions
+        self._indexes: "OrderedDict[str, SessionFileIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_dir: str) -> SessionFileIndex:
+        with self._lock:
+            index = self._indexes.get(session_dir)
+            if index is None:
+                index = self._indexes[session_dir] = SessionFileIndex(session_dir)
+                while len(self._indexes) > self.max_sessions:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(session_dir)
+            return index
+
+    def discard(self, session_dir: str):
+        with self._lock:
+            self._indexes.pop(session_dir, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._indexes),
+                "files": sum(len(index._entries) for index in self._indexes.values()),
+            }
+
+
+# 全局文件索引缓存
+file_indexes = FileIndexRegistry()
@@ -0,0 +1,260 @@
+import asyncio
+import mimetypes
+import os
+import stat
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+from urllib.parse import quote
+
+from starlette.responses import Response
+
+
+class TransferStats:
+    """
+    按会话统计的传输流量
+
+    下载按实际发出的字节计数（中断的下载只记已发送部分），上传按写入磁盘的字节计数。
+    配置 is_active 后只统计活跃的会话（会话被回收时调用 discard），避免任意会话ID使统计无限增长。
+    """
+
+    def __init__(self, is_active: Optional[Callable[[str], bool]] = None):
+        self.is_active = is_active
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+
+    def configure(self, is_active: Optional[Callable[[str], bool]] = None):
+        if is_active is not None:
+            self.is_active = is_active
+
+    @staticmethod
+    def _new_entry() -> Dict[str, Any]:
+        return {
+            "bytes_downloaded": 0,
+            "bytes_uploaded": 0,
+            "downloads": 0,
+            "partial_downloads": 0,
+            "not_modified": 0,
+            "uploads": 0,
+            "last_active": 0.0,
+        }
+
+    def _entry(self, session_id: str) -> Dict[str, Any]:
+        return self._sessions.setdefault(session_id, self._new_entry())
+
+    def _tracked(self, session_id: str) -> bool:
+        # 不持锁调用：判断活跃时可能触发回收，进而回调 discard
+        return self.is_active is None or self.is_active(session_id)
+
+    def record_download(self, session_id: str, status_code: int):
+        if not self._tracked(session_id):
+            return
+        with self._lock:
+            entry = self._entry(session_id)
+            entry["downloads"] += 1
+            if status_code == 206:
+                entry["partial_downloads"] += 1
+            elif status_code == 304:
+                entry["not_modified"] += 1
+            entry["last_active"] = time.time()
+
+    def add_downloaded(self, session_id: str, nbytes: int):
+        if not self._tracked(session_id):
+            return
+        with self._lock:
+            self._entry(session_id)["bytes_downloaded"] += nbytes
+
+    def add_uploaded(self, session_id: str, nbytes: int, files: int = 1):
+        """files 为本次完成的文件数，分块上传的中间分块传0"""
+        if not self._tracked(session_id):
+            return
+        with self._lock:
+            entry = self._entry(session_id)
+            entry["bytes_uploaded"] += nbytes
+            entry["uploads"] += files
+            entry["last_active"] = time.time()
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return dict(entry) if entry is not None else self._new_entry()
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def top(self, limit: int = 20) -> Dict[str, Any]:
+        """按总流量排序的会话列表与全局合计"""
+        with self._lock:
+            rows = [dict(entry, session_id=session_id) for session_id, entry in self._sessions.items()]
+        rows.sort(key=lambda row: row["bytes_downloaded"] + row["bytes_uploaded"], reverse=True)
+        return {
+            "sessions": len(rows),
+            "bytes_downloaded": sum(row["bytes_downloaded"] for row in rows),
+            "bytes_uploaded": sum(row["bytes_uploaded"] for row in rows),
+            "top_sessions": rows[:limit],
+        }
+
+
+# 全局传输统计
+transfer_stats = TransferStats()
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段 Range 头，返回闭区间 (start, end)
+
+    无Range头、多段范围或语法错误时返回None（按RFC 7233忽略Range，返回完整内容），
+    范围无法满足时抛出ValueError（416）。
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec:
+        return None
+    start_text, sep, end_text = (part.strip() for part in spec.partition("-"))
+    if not sep or not (start_text or end_text) or \
+            not all(text.isascii() and text.isdigit() for text in (start_text, end_text) if text):
+        return None
+    if not start_text:
+        # 后缀范围：最后N个字节
+        length = int(end_text)
+        if length == 0 or size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if end_text and end < start:
+        return None
+    if start >= size:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+class SessionFileResponse(Response):
+    """
+    支持条件请求与断点续传的文件响应
+
+    - ETag / Last-Modified，If-None-Match / If-Modified-Since 命中时返回304
+    - 单段 Range 请求返回206，If-Range 校验失败时退回完整内容，无法满足的范围返回416
+    - 文件的 stat / open 与 pread 分块读取都在线程池中进行，不阻塞事件循环
+      （uvicorn 不提供 sendfile 扩展，ASGI应用也拿不到socket，因此不做零拷贝发送）
+    - on_sent(nbytes) 在每块发送后调用，用于流量统计
+
+    在事件循环中应通过 create 构造，直接构造时会同步 stat 文件。
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self,
+                 path: str,
+                 request_headers: Mapping[str, str],
+                 filename: Optional[str] = None,
+                 on_sent: Optional[Callable[[int], Any]] = None,
+                 stat_result: Optional[os.stat_result] = None):
+        self.path = path
+        self.on_sent = on_sent
+        self.background = None
+        if stat_result is None:
+            stat_result = os.stat(path)
+        size = stat_result.st_size
+        etag = make_etag(stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+        }
+        self.range: Optional[Tuple[int, int]] = None
+
+        if self._not_modified(request_headers, etag, stat_result.st_mtime):
+            status_code = 304
+        else:
+            try:
+                requested = parse_range(request_headers.get("range"), size)
+            except ValueError:
+                requested = None
+                status_code = 416
+                headers["content-range"] = f"bytes */{size}"
+            else:
+                if_range = request_headers.get("if-range")
+                if requested is not None and if_range and if_range not in (etag, last_modified):
+                    requested = None
+                if requested is not None:
+                    status_code = 206
+                    self.range = requested
+                    headers["content-range"] = f"bytes {requested[0]}-{requested[1]}/{size}"
+                else:
+                    status_code = 200
+                    self.range = (0, size - 1)
+
+        if status_code in (200, 206):
+            media_type = mimetypes.guess_type(filename or path)[0] or "application/octet-stream"
+            headers["content-type"] = media_type
+            headers["content-length"] = str(self.range[1] - self.range[0] + 1)
+            headers["content-disposition"] = content_disposition(filename or os.path.basename(path))
+        elif status_code == 416:
+            headers["content-length"] = "0"
+
+        self.status_code = status_code
+        self.raw_headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+
+    @classmethod
+    async def create(cls, path: str, request_headers: Mapping[str, str], **kwargs) -> "SessionFileResponse":
+        """在线程池中 stat 文件后构造响应，不是普通文件时抛出FileNotFoundError"""
+        stat_result = await asyncio.to_thread(os.stat, path)
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise FileNotFoundError(path)
+        return cls(path, request_headers, stat_result=stat_result, **kwargs)
+
+    @staticmethod
+    def _not_modified(request_headers: Mapping[str, str], etag: str, mtime: float) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.range is None or scope.get("method") == "HEAD" or self.range[1] < self.range[0]:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        start, end = self.range
+        f = await asyncio.to_thread(open, self.path, "rb")
+        with f:
+            offset = start
+            while offset <= end:
+                chunk = await asyncio.to_thread(os.pread, f.fileno(), min(self.chunk_size, end - offset + 1), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": offset <= end})
+                self._count(len(chunk))
+            if offset <= end:
+                # 文件在发送过程中被截断
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    def _count(self, nbytes: int):
+        if self.on_sent is not None:
+            self.on_sent(nbytes)
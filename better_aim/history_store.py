@@ -0,0 +1,381 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class HistoryStore(ABC):
+    """聊天历史存储接口，gradio与React两个前端共用"""
+
+    @abstractmethod
+    def load(self, session_id: str) -> List[Any]:
+        """加载完整的聊天历史"""
+
+    @abstractmethod
+    def page(self, session_id: str, before: Optional[int] = None, limit: int = 50) -> Tuple[List[Tuple[int, Any]], bool]:
+        """
+        游标分页读取聊天历史
+
+        Args:
+            session_id: 会话ID
+            before: 只返回序号小于before的记录，为空时从最新一条开始
+            limit: 最多返回条数
+
+        Returns:
+            ([(序号, 记录), ...] 按时间正序, 是否还有更早的记录)
+        """
+
+    @abstractmethod
+    def append(self, session_id: str, entry: Any) -> int:
+        """追加一条聊天记录，返回其序号"""
+
+    @abstractmethod
+    def clear(self, session_id: str):
+        """清空聊天历史"""
+
+
+class JsonlHistoryStore(HistoryStore):
+    """
+    追加写的JSONL聊天历史
+
+    每个会话一个 chat_history/{id}.jsonl 文件，每行一条操作记录：{"entry": ...} 追加、{"op": "clear"} 清空。
+    - 每次写入只追加一行，不再重写整个文件
+    - 崩溃导致的残缺行在读取时被忽略，下次写入前被截断
+    - 失效记录过多时原子地压缩文件（写临时文件后重命名）
+    - 分页从文件末尾反向读取，只解析所需的行
+    """
+
+    def __init__(self, work_path: str, compact_threshold: int = 256, fsync: bool = False):
+        self.history_path = os.path.join(work_path, "chat_history")
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        # session_id -> {"lines": 文件总行数, "live": 有效记录数}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def get_file_path(self, session_id: str) -> str:
+        os.makedirs(self.history_path, exist_ok=True)
+        return os.path.join(self.history_path, f"{session_id}.jsonl")
+
+    def load(self, session_id: str) -> List[Any]:
+        with self._lock:
+            path = self._prepare(session_id)
+            if not os.path.exists(path):
+                return []
+            return self._fold(self._read_lines(path))
+
+    def page(self, session_id: str, before: Optional[int] = None, limit: int = 50) -> Tuple[List[Tuple[int, Any]], bool]:
+        # 序号即记录在有效历史中的位置（从1开始），与 append 的返回值一致
+        with self._lock:
+            path = self._prepare(session_id)
+            live = self._stats[session_id]["live"]
+            end = live if before is None else max(0, min(before - 1, live))
+            start = max(0, end - limit)
+            if start == end:
+                return [], start > 0
+            tail = self._fold_tail(path, live - start)
+        return [(start + i + 1, entry) for i, entry in enumerate(tail[:end - start])], start > 0
+
+    def append(self, session_id: str, entry: Any) -> int:
+        self._write(session_id, {"entry": entry}, live_delta=1)
+        return self._stats.get(session_id, {}).get("live", 0)
+
+    def clear(self, session_id: str):
+        self._write(session_id, {"op": "clear"}, live_delta=None)
+
+    def _write(self, session_id: str, record: Dict[str, Any], live_delta: Optional[int]):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        try:
+            with self._lock:
+                path = self._prepare(session_id)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+
+                stats = self._stats[session_id]
+                stats["lines"] += 1
+                stats["live"] = 0 if live_delta is None else stats["live"] + live_delta
+                if stats["lines"] - stats["live"] > self.compact_threshold:
+                    self._rewrite(session_id, path, self._fold(self._read_lines(path)))
+        except Exception as e:
+            print(f"保存聊天历史失败: {e}")
+
+    def _prepare(self, session_id: str) -> str:
+        """首次访问会话时：迁移旧版json文件、截断残缺行、统计行数"""
+        path = self.get_file_path(session_id)
+        if session_id in self._stats:
+            return path
+
+        legacy_path = os.path.join(self.history_path, f"{session_id}.json")
+        if not os.path.exists(path) and os.path.exists(legacy_path):
+            try:
+                with open(legacy_path, "r", encoding="utf-8") as f:
+                    self._rewrite(session_id, path, json.load(f))
+                os.remove(legacy_path)
+            except Exception as e:
+                print(f"迁移旧版聊天历史失败: {e}")
+
+        lines = live = 0
+        if os.path.exists(path):
+            self._truncate_partial_line(path)
+            records = list(self._read_lines(path))
+            lines, live = len(records), len(self._fold(records))
+        self._stats[session_id] = {"lines": lines, "live": live}
+        return path
+
+    def _rewrite(self, session_id: str, path: str, history: List[Any]):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in history:
+                f.write(json.dumps({"entry": entry}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._stats[session_id] = {"lines": len(history), "live": len(history)}
+
+    @staticmethod
+    def _truncate_partial_line(path: str):
+        """崩溃时最后一行可能只写了一半，截断到最后一个完整行"""
+        with open(path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b"\n":
+                return
+            pos = end
+            while pos > 0:
+                step = min(4096, pos)
+                pos -= step
+                f.seek(pos)
+                newline = f.read(step).rfind(b"\n")
+                if newline != -1:
+                    f.truncate(pos + newline + 1)
+                    return
+            f.truncate(0)
+
+    @staticmethod
+    def _parse(line: bytes) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    def _read_lines(self, path: str) -> Iterator[Dict[str, Any]]:
+        with open(path, "rb") as f:
+            for line in f:
+                record = self._parse(line)
+                if record is not None:
+                    yield record
+
+    def _read_lines_reversed(self, path: str, block_size: int = 65536) -> Iterator[Dict[str, Any]]:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            remainder = b""
+            while pos > 0:
+                step = min(block_size, pos)
+                pos -= step
+                f.seek(pos)
+                lines = (f.read(step) + remainder).split(b"\n")
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    record = self._parse(line) if line else None
+                    if record is not None:
+                        yield record
+            if remainder:
+                record = self._parse(remainder)
+                if record is not None:
+                    yield record
+
+    @staticmethod
+    def _fold(records) -> List[Any]:
+        history = []
+        for record in records:
+            if record.get("op") == "clear":
+                history = []
+            else:
+                history.append(record["entry"])
+        return history
+
+    def _fold_tail(self, path: str, limit: int) -> List[Any]:
+        """从文件末尾反向折叠，只解析最后limit条有效记录所需的行"""
+        tail = []
+        for record in self._read_lines_reversed(path):
+            if len(tail) >= limit or record.get("op") == "clear":
+                break
+            tail.append(record["entry"])
+        tail.reverse()
+        return tail
+
+
+class SqliteHistoryStore(HistoryStore):
+    """
+    SQLite聊天历史，每条记录一行，以 (session_id, seq) 为主键索引
+
+    分页查询只读取需要的行，旧会话不占用内存。
+    首次访问某个会话时会自动导入该会话已有的JSONL/JSON历史文件。
+    """
+
+    def __init__(self, work_path: str):
+        self.history_path = os.path.join(work_path, "chat_history")
+        os.makedirs(self.history_path, exist_ok=True)
+        self._legacy = JsonlHistoryStore(work_path)
+        self._migrated = set()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.history_path, "history.sqlite3"),
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                entry TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+
+    def load(self, session_id: str) -> List[Any]:
+        with self._lock:
+            self._migrate(session_id)
+            rows = self._conn.execute(
+                "SELECT entry FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def page(self, session_id: str, before: Optional[int] = None, limit: int = 50) -> Tuple[List[Tuple[int, Any]], bool]:
+        with self._lock:
+            self._migrate(session_id)
+            rows = self._conn.execute(
+                "SELECT seq, entry FROM messages WHERE session_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (session_id, before if before is not None else 2 ** 62, limit + 1)
+            ).fetchall()
+        has_more = len(rows) > limit
+        return [(seq, json.loads(entry)) for seq, entry in reversed(rows[:limit])], has_more
+
+    def append(self, session_id: str, entry: Any) -> int:
+        try:
+            with self._lock:
+                self._migrate(session_id)
+                seq = self._last_seq(session_id) + 1
+                with self._conn:
+                    self._conn.execute("INSERT INTO messages (session_id, seq, entry) VALUES (?, ?, ?)",
+                                       (session_id, seq, json.dumps(entry, ensure_ascii=False)))
+                return seq
+        except Exception as e:
+            print(f"保存聊天历史失败: {e}")
+            return 0
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._migrated.add(session_id)
+            with self._conn:
+                self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+
+    def _last_seq(self, session_id: str) -> int:
+        row = self._conn.execute("SELECT MAX(seq) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] or 0
+
+    def _migrate(self, session_id: str):
+        """导入该会话在JSONL/JSON文件中的历史（每个会话只检查一次）"""
+        if session_id in self._migrated:
+            return
+        self._migrated.add(session_id)
+        if self._last_seq(session_id):
+            return
+        jsonl_path = os.path.join(self.history_path, f"{session_id}.jsonl")
+        json_path = os.path.join(self.history_path, f"{session_id}.json")
+        if not (os.path.exists(jsonl_path) or os.path.exists(json_path)):
+            return
+        history = self._legacy.load(session_id)
+        with self._conn:
+            self._conn.executemany("INSERT INTO messages (session_id, seq, entry) VALUES (?, ?, ?)",
+                                   [(session_id, seq, json.dumps(entry, ensure_ascii=False))
+                                    for seq, entry in enumerate(history, 1)])
+        if os.path.exists(jsonl_path):
+            os.replace(jsonl_path, f"{jsonl_path}.migrated")
+
+
+class RecentHistoryCache:
+    """
+    有上限的最近聊天记录缓存，取代保存全部历史的 history_pool
+
+    最多缓存 max_sessions 个会话（LRU淘汰），每个会话只保留最近 max_turns 条 (序号, 记录)。
+    """
+
+    def __init__(self, max_sessions: int = 128, max_turns: int = 20):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self._sessions: "OrderedDict[str, List[Tuple[int, Any]]]" = OrderedDict()
+        self._complete: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[List[Tuple[int, Any]]]:
+        with self._lock:
+            rows = self._sessions.get(session_id)
+            if rows is not None:
+                self._sessions.move_to_end(session_id)
+                return list(rows)
+            return None
+
+    def put(self, session_id: str, rows: List[Tuple[int, Any]], complete: bool):
+        """写入会话最近的记录，complete表示rows已包含该会话的全部历史"""
+        with self._lock:
+            self._sessions[session_id] = list(rows[-self.max_turns:])
+            self._complete[session_id] = complete and len(rows) <= self.max_turns
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                self._complete.pop(evicted, None)
+
+    def append(self, session_id: str, seq: int, entry: Any):
+        with self._lock:
+            rows = self._sessions.get(session_id)
+            if rows is None:
+                return
+            rows.append((seq, entry))
+            if len(rows) > self.max_turns:
+                del rows[:len(rows) - self.max_turns]
+                self._complete[session_id] = False
+
+    def clear(self, session_id: str):
+        self.put(session_id, [], complete=True)
+
+    def page(self, session_id: str, limit: int) -> Optional[Tuple[List[Tuple[int, Any]], bool]]:
+        """能由缓存满足最新一页时直接返回，否则返回None"""
+        with self._lock:
+            rows = self._sessions.get(session_id)
+            if rows is None:
+                return None
+            if limit <= len(rows):
+                return list(rows[-limit:]), len(rows) > limit or not self._complete[session_id]
+            if self._complete[session_id]:
+                return list(rows), False
+            return None
+
+
+# gradio与React两个前端的默认存储必须一致：sqlite首次访问会话时导入并重命名该会话的JSONL文件
+DEFAULT_HISTORY_BACKEND = "sqlite"
+
+_stores: Dict[Tuple[str, str], HistoryStore] = {}
+
+
+def get_history_store(work_path: str, backend: str = DEFAULT_HISTORY_BACKEND) -> HistoryStore:
+    """获取work_path对应的历史存储（进程内共享），backend可选 "jsonl" 或 "sqlite" """
+    key = (work_path, backend)
+    if key not in _stores:
+        if backend == "sqlite":
+            _stores[key] = SqliteHistoryStore(work_path)
+        elif backend == "jsonl":
+            _stores[key] = JsonlHistoryStore(work_path)
+        else:
+            raise ValueError(f"不支持的聊天历史存储: {backend}")
+    return _stores[key]
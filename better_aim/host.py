@@ -9,50 +9,28 @@ from typing import Dict, List, Tuple, Any, AsyncGenerator
 from gradio.components.chatbot import ExampleMessage
 
 from better_aim.agent import create_llm_agent
+from better_aim.file_index import file_indexes, is_valid_session_id
+from better_aim.history_store import get_history_store
+from better_aim.interceptions import interceptions
+from better_aim.llm_limiter import llm_queue_notifier
+from better_aim.metrics import agent_events_total, turn_seconds
+from better_aim.notifications import interception_notifier
+from better_aim.tracing import tracer
+from better_aim.usage import token_usage
 from better_aim.adjustable_session_service import pop_event
 from google.adk.agents import LlmAgent
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
 from google.genai import types
 import asyncio
 
-from better_aim.tool_modify_guardrail import collect_inputs
+from better_aim.tool_modify_guardrail import collect_inputs, tool_calls_turn
+from better_aim.uploads import UploadTooLargeError, copy_file_atomic
 
 from better_aim.utils import generate_random_string, hash_dict
 
 
-def get_chat_history_file_path(sha_id: str, work_path: str) -> str:
-    """获取聊天历史文件路径"""
-    # 确保文件路径存在
-    history_file_path = os.path.join(work_path, "chat_history")
-    os.makedirs(history_file_path, exist_ok=True)
-    return os.path.join(history_file_path, f"{sha_id}.json")
-
-
-def load_chat_history(sha_id: str, work_path: str) -> List[List[str]]:
-    """加载聊天历史记录"""
-    history_file = get_chat_history_file_path(sha_id, work_path)
-
-    if os.path.exists(history_file):
-        try:
-            with open(history_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
-
-
-def save_chat_history(sha_id: str, history: List[List[str]], work_path: str):
-    """保存聊天历史记录"""
-    history_file = get_chat_history_file_path(sha_id, work_path)
-
-    try:
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"保存聊天历史失败: {e}")
-
-
 def login(session_id: str,
           mcp_tools_url: str,
           agent_info: dict,
@@ -65,8 +43,8 @@ def login(session_id: str,
 
     if not session_id:
         return gr.update(visible=True), gr.update(visible=False), "请填写或自动生成会话ID", []
-    elif len(session_id) != 32:
-        return gr.update(visible=True), gr.update(visible=False), f"会话ID需要为长度为32的任意字符，目前长度：{len(session_id)}", []
+    elif not is_valid_session_id(session_id):
+        return gr.update(visible=True), gr.update(visible=False), f"会话ID需要为32位字母或数字，目前长度：{len(session_id)}", []
 
     # 生成SHA ID
     sha_id = session_id
@@ -83,10 +61,12 @@ def login(session_id: str,
         except Exception as e:
             return gr.update(visible=True), gr.update(visible=False), f"创建Agent失败: {str(e)}", []
     else:
-        agent = active_agents[sha_id]
+        agent = active_agents.get(sha_id)
 
-    # 加载聊天历史
-    chat_history = load_chat_history(sha_id, work_path)
+    # 加载最近的聊天历史，登录后由聊天框读取
+    from better_aim.main import history_pool
+    rows, has_more = get_history_store(work_path).page(sha_id, limit=history_pool.max_turns)
+    history_pool.put(sha_id, rows, complete=not has_more)
 
     # 返回更新后的界面和状态
     return (
@@ -96,18 +76,37 @@ def login(session_id: str,
     )
 
 # modified from https://google.github.io/adk-docs/tutorials/agent-team/#step-1-your-first-agent-basic-weather-lookup
-async def call_agent_async(query: str, runner, user_id, session_id, tools_info: List[Dict[str, Any]]):
-    """Sends a query to the agent and prints the final response."""
+async def call_agent_async(query: str, runner, user_id, session_id, tools_info: List[Dict[str, Any]],
+                           streaming: bool = False):
+    """Sends a query to the agent and yields (text, is_final, is_delta).
+
+    With streaming enabled, partial LLM output is yielded as deltas (is_delta=True)
+    before the complete message is yielded as usual."""
     #print(f"\n>>> User Query: {query}")
 
     # Prepare the user's message in ADK format
     content = types.Content(role='user', parts=[types.Part(text=query)])
 
     final_response_text = "Agent did not produce a final response." # Default
+    run_config = RunConfig(streaming_mode=StreamingMode.SSE if streaming else StreamingMode.NONE)
+
+    # Each non-partial event is traced as a runner.step span covering the time since the previous one
+    step_started = time.time_ns()
+    partial_events = 0
 
     # Key Concept: run_async executes the agent logic and yields Events.
     # We iterate through events to find the final answer.
-    async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=content):
+    async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=content,
+                                        run_config=run_config):
+        # Partial events carry incremental text chunks when streaming is enabled
+        if event.partial:
+            partial_events += 1
+            if event.content and event.content.parts and event.content.parts[0].text:
+                yield event.content.parts[0].text, False, True
+            continue
+        tracer.span(session_id, "runner.step", start_time_ns=step_started, author=event.author,
+                    partial_events=partial_events, final=event.is_final_response()).end()
+        step_started, partial_events = time.time_ns(), 0
         # You can uncomment the line below to see *all* events during execution
         #print(f"  [Event] Author: {event.author}, Type: {type(event).__name__}, Final: {event.is_final_response()}, Content: {event.content}, a:{event.content.parts}")
         """
@@ -158,14 +157,14 @@ async def call_agent_async(query: str, runner, user_id, session_id, tools_info:
         if event.is_final_response():
             if event.content and event.content.parts:
                 # Assuming text response in the first part
-                yield event.content.parts[0].text, True
+                yield event.content.parts[0].text, True, False
             elif event.actions and event.actions.escalate: # Handle potential errors/escalations
-                yield f"Agent escalated: {event.error_message or 'No specific message.'}", True
+                yield f"Agent escalated: {event.error_message or 'No specific message.'}", True, False
             # Add more checks here if needed (e.g., specific error codes)
             break # Stop processing events once the final response is found
         else:
             if event.content and event.content.parts:
-                yield event.content.parts[0].text, False
+                yield event.content.parts[0].text, False, False
 
     #print(f"<<< Agent Response: {final_response_text}")
 
@@ -176,51 +175,74 @@ async def chat_with_agent(message: str,
                           agent_info: dict,
                           work_path: str,
                           tools_info: List[Dict[str, Any]]) -> \
-AsyncGenerator[tuple[list[list[str]], str, bool], Any]:
-    """处理与agent的聊天"""
+AsyncGenerator[tuple[list[list[str]], str, bool, bool], Any]:
+    """处理与agent的聊天，产出 (聊天记录, 状态, 是否结束, 是否为流式增量)；增量中的最后一条记录尚未完整"""
     from better_aim.main import active_agents
-    if session_id not in active_agents:
-        yield history, "Agent未找到，请重新登录", True
+    # agent可能已被池回收，此时会透明重建
+    try:
+        agent = active_agents.get(session_id)
+    except Exception as e:
+        yield history, f"Agent未找到，请重新登录: {e}", True, False
         return
+    from better_aim.main import runner_registry
+    runner = await runner_registry.get(session_id, agent)
 
-    agent = active_agents[session_id]
-    from better_aim.main import session_service
-    session = await session_service.create_session(app_name=agent_info["name"],
-                                   user_id=session_id[:4],
-                                   session_id=session_id)
-
-    runner = Runner(agent=agent,
-                    app_name=agent_info["name"],
-                    session_service=session_service)
-
+    from better_aim.main import history_pool, streaming_enabled
     responses = []
     last_yielded_history = None
-
-    async for response, is_final in call_agent_async(query=message,
-                                                             runner=runner,
-                                                             user_id=session_id[:4],
-                                                             session_id=session_id,
-                                                             tools_info=tools_info):
-        # 更新聊天历史
-        if response:
-            if len(responses) == 0:
-                responses.append([message, response])
+    history_store = get_history_store(work_path)
+    partial_text = ""
+
+    # 本轮进行中固定会话，agent池不会回收它
+    with active_agents.pinned(session_id), turn_seconds.time(transport="gradio"), \
+            tracer.start_turn(session_id, transport="gradio"), token_usage.turn(session_id), \
+            tool_calls_turn(session_id):
+        async for response, is_final, is_delta in call_agent_async(query=message,
+                                                                 runner=runner,
+                                                                 user_id=session_id[:4],
+                                                                 session_id=session_id,
+                                                                 tools_info=tools_info,
+                                                                 streaming=streaming_enabled):
+            agent_events_total.inc(type="delta" if is_delta else ("final_response" if is_final else "event"))
+            # 流式增量只用于显示，不写入历史；完整消息到达后再保存
+            if is_delta:
+                partial_text += response
+                partial_entry = [message, partial_text] if len(responses) == 0 else [None, partial_text]
+                yield history + responses + [partial_entry], "正在接收LLM回复……", False, True
+                continue
+            partial_text = ""
+
+            # 更新聊天历史
+            if response:
+                if len(responses) == 0:
+                    responses.append([message, response])
+                else:
+                    responses.append([None, response])
+                new_history = history + responses
+                # 只追加新产生的记录，不再重写整个历史文件
+                with tracer.span(session_id, "history.append"):
+                    seq = history_store.append(session_id, responses[-1])
+                history_pool.append(session_id, seq, responses[-1])
             else:
-                responses.append([None, response])
-            new_history = history + responses
-        else:
-            new_history = history
+                new_history = history
 
-        # 保存聊天历史
-        save_chat_history(session_id, new_history, work_path)
+            # 只有当历史记录发生变化时才yield，避免重复发送相同数据
+            if new_history != last_yielded_history:
+                last_yielded_history = new_history
+                if is_final:
+                    yield new_history, "待机中。", True, False
+                else:
+                    yield new_history, "正在等待LLM回复……", False, False
 
-        # 只有当历史记录发生变化时才yield，避免重复发送相同数据
-        if new_history != last_yielded_history:
-            last_yielded_history = new_history
-            if is_final:
-                yield new_history, "待机中。", True
-            else:
-                yield new_history, "正在等待LLM回复……", False
+
+def recent_history(work_path: str, session_id: str) -> List[Any]:
+    """会话最近的聊天记录（界面只显示这些），不在缓存中时从历史存储读取最新一页"""
+    from better_aim.main import history_pool
+    rows = history_pool.get(session_id)
+    if rows is None:
+        rows, has_more = get_history_store(work_path).page(session_id, limit=history_pool.max_turns)
+        history_pool.put(session_id, rows, complete=not has_more)
+    return [entry for _, entry in rows]
 
 
 def logout() -> Tuple[gr.update, gr.update, str, str]:
@@ -232,17 +254,34 @@ def logout() -> Tuple[gr.update, gr.update, str, str]:
         ""# 清空登录表单
     )
 
-def handle_refresh(work_path: str, session_id):
+# gradio文件组件一次最多列出的文件数
+MAX_LISTED_FILES = 1000
+
+
+def list_session_files(session_dir: str, pattern: str = "", limit: int = MAX_LISTED_FILES) -> Tuple[List[str], gr.update]:
+    """
+    从文件索引中取出会话目录下的文件（递归，绝对路径），返回 (文件列表, 提示信息的更新)
+
+    pattern 为文件名或通配符；文件数超过 limit 时只列出最近修改的 limit 个，并提示总数与筛选方法。
+    """
+    index = file_indexes.get(session_dir)
+    total, entries = index.query(limit=limit, sort="mtime", order="desc", pattern=pattern or None)
+    files = sorted(os.path.join(session_dir, entry.path) for entry in entries)
+    if total > len(entries):
+        notice = gr.update(value=f"共 {total} 个文件，仅列出最近修改的 {len(entries)} 个，请输入文件名或通配符筛选查看其余文件",
+                           visible=True)
+    else:
+        notice = gr.update(value="", visible=False)
+    return files, notice
+
+
+def handle_refresh(work_path: str, session_id, pattern: str = ""):
     session_dir = os.path.join(work_path, session_id)
     os.makedirs(session_dir, exist_ok=True)
-    # 返回更新后的文件列表（绝对路径）
-    all_files = sorted([
-        os.path.join(session_dir, f) for f in os.listdir(session_dir)
-        if os.path.isfile(os.path.join(session_dir, f))
-    ])
-    return all_files
-
-def handle_upload(files, work_path: str, session_id):
+    # 返回更新后的文件列表（绝对路径）与截断提示
+    return list_session_files(session_dir, pattern)
+
+def handle_upload(files, work_path: str, session_id, pattern: str = "", max_upload_bytes: int = 10 * 1024 * 1024):
     session_dir = os.path.join(work_path, session_id)
     os.makedirs(session_dir, exist_ok=True)
     saved_files = []
@@ -252,21 +291,16 @@ def handle_upload(files, work_path: str, session_id):
     # 处理每个上传文件
     for file_obj in files:
         file_path = file_obj.name  # 上传后 Gradio 存储的临时文件路径
-        # 检查文件大小 (最大 10MB)
-        if os.path.getsize(file_path) > 10 * 1024 * 1024:
-            continue  # 跳过超限文件，可改为报错提示
-        filename = os.path.basename(file_path)
-        dest_path = os.path.join(session_dir, filename)
-        # 复制文件到会话目录（覆盖同名文件）
-        with open(file_path, "rb") as src, open(dest_path, "wb") as dst:
-            dst.write(src.read())
+        dest_path = os.path.join(session_dir, os.path.basename(file_path))
+        # 分块复制到会话目录（原子覆盖同名文件），超限文件跳过
+        try:
+            copy_file_atomic(file_path, dest_path, max_upload_bytes)
+        except UploadTooLargeError:
+            continue
         saved_files.append(dest_path)
-    # 返回更新后的文件列表（绝对路径）
-    all_files = sorted([
-        os.path.join(session_dir, f) for f in os.listdir(session_dir)
-        if os.path.isfile(os.path.join(session_dir, f))
-    ])
-    return all_files
+    file_indexes.get(session_dir).invalidate()
+    # 返回更新后的文件列表（绝对路径）与截断提示
+    return list_session_files(session_dir, pattern)
 
 
 def update_interface(selected_value):
@@ -337,35 +371,41 @@ def update_executor_storage_state(mode, username, password, project_id):
 def create_interface(mcp_server_url: str,
                      agent_info: dict,
                      work_path: str,
-                     tools_info: List[Dict[str, Any]],
                      model_config: dict,
-                     mcp_server_mode: str):
+                     mcp_server_mode: str,
+                     schema_poll_interval: float = 10,
+                     max_upload_bytes: int = 10 * 1024 * 1024):
     # 发送消息事件
-    async def handle_send_message(message, _session_id, _tools_info):
-        from better_aim.main import history_pool
-        history = history_pool[_session_id]
+    async def handle_send_message(message, _session_id):
+        # 每次发送时读取当前工具目录，后台刷新后的热替换立即生效
+        from better_aim.main import tool_catalog
+        history = recent_history(work_path, _session_id)
         if not message.strip():
-            yield history, "消息不能为空", {}, True
-        else:
-            # 使用一个累积变量来存储所有响应
-            accumulated_history = history.copy() if history else []
-
-            async for new_history, status, finish in chat_with_agent(message,
-                                                                     history,
-                                                                     session_id=_session_id,
-                                                                     agent_info=agent_info,
-                                                                     work_path=work_path,
-                                                                     tools_info=tools_info):
-                # 更新累积的历史记录
-                if new_history and len(new_history) > 0:
-                    accumulated_history.append(new_history)
-
-                print(accumulated_history)
-
-                history_pool[_session_id] = accumulated_history
+            yield history, "消息不能为空", True
+            return
+
+        # 完整消息在写入历史存储时同时追加到最近对话缓存
+        async for new_history, status, finish, is_delta in chat_with_agent(message,
+                                                                           history,
+                                                                           session_id=_session_id,
+                                                                           agent_info=agent_info,
+                                                                           work_path=work_path,
+                                                                           tools_info=tool_catalog):
+            yield new_history, status, finish
+
+    def load_chat_history(_session_id):
+        if not _session_id:
+            return []
+        return recent_history(work_path, _session_id)
 
-                # 每次都yield最新的状态，确保Gradio能接收到所有更新
-                yield status, finish
+    async def clear_chat(_session_id):
+        from better_aim.main import history_pool, runner_registry
+        if not _session_id:
+            return [], "请先登录"
+        get_history_store(work_path).clear(_session_id)
+        history_pool.clear(_session_id)
+        await runner_registry.reset(_session_id)
+        return [], "对话已清空"
 
     """创建Gradio界面"""
     with (gr.Blocks(title=agent_info["name"], theme=gr.themes.Soft()) as demo):
@@ -375,7 +415,6 @@ def create_interface(mcp_server_url: str,
         agent_info_state = gr.State(agent_info)
         model_config_state = gr.State(model_config)
         work_path_state = gr.State(work_path)
-        tools_info_state = gr.State(tools_info)
         finish_state = gr.State(True)
         task_submit_mode_state = gr.State("None")
         executor_state = gr.State()
@@ -454,6 +493,8 @@ def create_interface(mcp_server_url: str,
                     with gr.Row(equal_height=True):
                         with gr.Column():
                             file_list = gr.File(label="您的专属工作区（在线模式）", file_count="multiple")
+                            file_notice = gr.Markdown(visible=False)
+                            file_filter = gr.Textbox(label="筛选文件", placeholder="文件名或通配符，如 *.pth，回车或刷新后生效")
 
                             with gr.Row():
                                 refresh_btn = gr.Button("刷新目录")
@@ -461,14 +502,19 @@ def create_interface(mcp_server_url: str,
 
                                 refresh_btn.click(
                                     fn=handle_refresh,
-                                    inputs=[work_path_state, session_id_state],
-                                    outputs=[file_list]
+                                    inputs=[work_path_state, session_id_state, file_filter],
+                                    outputs=[file_list, file_notice]
+                                )
+                                file_filter.submit(
+                                    fn=handle_refresh,
+                                    inputs=[work_path_state, session_id_state, file_filter],
+                                    outputs=[file_list, file_notice]
                                 )
 
                                 upload_btn.upload(
-                                    fn=handle_upload,
-                                    inputs=[upload_btn, work_path_state, session_id_state],
-                                    outputs=[file_list]
+                                    fn=functools.partial(handle_upload, max_upload_bytes=max_upload_bytes),
+                                    inputs=[upload_btn, work_path_state, session_id_state, file_filter],
+                                    outputs=[file_list, file_notice]
                                 )
 
                 with gr.Column(scale=3) as main_column:
@@ -482,30 +528,22 @@ def create_interface(mcp_server_url: str,
                         current_info = gr.Textbox(label="当前会话信息", interactive=False, value="", scale=2)
                         chat_status = gr.Textbox(label="聊天状态", interactive=False, scale=2)
 
-                    from better_aim.main import history_pool
-
-                    @gr.render(inputs=session_id_state)
-                    def render_chatbot(_session_id):
-                        if _session_id:
-                            if not history_pool[session_id]:
-                                history_pool[session_id] = {"role": "assistant",
-                                                            "content": "I am happy to provide you that report and plot."}
-                            chatbot = gr.Chatbot(
-                                value=history_pool[session_id],
-                                label="聊天记录",
-                                height=700,
-                                show_copy_button=True,
-                                examples=[
-                                    {"text":'请帮我生成碳的训练输入配置文件，基组为{"C":"2s1p"}，截断半径{"C":6.0}，训练数据路径"my_data"，前缀"C16"，其余按默认配置',
-                                     "display_text":"生成训练输入配置文件"},
-                                    {"text":"使用poly4基准模型绘制能带图，结构文件为xxx",
-                                     "display_text":"使用基准模型绘制能带图"},
-                                    {"text":"请帮我生成sp轨道的Si的ploy4基准模型",
-                                     "display_text":"生成基准模型"},
-                                    {"text":"请使用我的模型预测并绘制能带图",
-                                     "display_text":"使用模型预测并绘制能带图"}
-                                ]
-                            )
+                    chatbot = gr.Chatbot(
+                        value=[],
+                        label="聊天记录",
+                        height=700,
+                        show_copy_button=True,
+                        examples=[
+                            {"text":'请帮我生成碳的训练输入配置文件，基组为{"C":"2s1p"}，截断半径{"C":6.0}，训练数据路径"my_data"，前缀"C16"，其余按默认配置',
+                             "display_text":"生成训练输入配置文件"},
+                            {"text":"使用poly4基准模型绘制能带图，结构文件为xxx",
+                             "display_text":"使用基准模型绘制能带图"},
+                            {"text":"请帮我生成sp轨道的Si的ploy4基准模型",
+                             "display_text":"生成基准模型"},
+                            {"text":"请使用我的模型预测并绘制能带图",
+                             "display_text":"使用模型预测并绘制能带图"}
+                        ]
+                    )
 
                     with gr.Row(equal_height=True):
                         example = gr.Dropdown(
@@ -531,8 +569,8 @@ def create_interface(mcp_server_url: str,
 
                         send_btn.click(
                             fn=handle_send_message,
-                            inputs=[msg, session_id_state, tools_info_state],
-                            outputs=[chat_status, finish_state]
+                            inputs=[msg, session_id_state],
+                            outputs=[chatbot, chat_status, finish_state]
                         ).then(
                             lambda: "",  # 清空输入框
                             outputs=msg
@@ -541,7 +579,7 @@ def create_interface(mcp_server_url: str,
                         # 回车发送消息
                         """msg.submit(
                             fn=handle_send_message,
-                            inputs=[msg, chatbot, session_id_state, tools_info_state],
+                            inputs=[msg, chatbot, session_id_state],
                             outputs=[chatbot, chat_status, schema_state]
                         ).then(
                             lambda: "",  # 清空输入框
@@ -561,18 +599,39 @@ def create_interface(mcp_server_url: str,
                     # 尝试更新
                     def check_update_schema(_session_id, hash_store):
                         print("Checking update...")
-                        from better_aim.main import unmodified_schema_store
-                        if _session_id not in unmodified_schema_store.keys():
-                            return {_: ""}
-                        new_hash = hash_dict(unmodified_schema_store[_session_id])
+                        interception = interceptions.first_pending(_session_id)
+                        schema = interception.schema if interception is not None else ""
+                        new_hash = hash_dict(schema)
                         if _session_id not in hash_store.keys() or new_hash != hash_store[_session_id]:
                             hash_store[_session_id] = new_hash
-                            return {schema_state: unmodified_schema_store[_session_id]}
+                            return {schema_state: schema}
                         return {_: ""}  # 无变化时跳过更新
 
+                    # 订阅拦截事件，由 tool_modify_guardrail 推送驱动表单更新
+                    async def watch_schema_updates(_session_id, hash_store):
+                        if not _session_id:
+                            return
+                        async for event in interception_notifier.subscribe(_session_id):
+                            # 并行调用时逐个确认：总是展示最早的待确认调用
+                            interception = interceptions.first_pending(_session_id)
+                            schema = interception.schema if interception is not None else ""
+                            # 同步更新哈希，避免兜底轮询重复渲染
+                            hash_store[_session_id] = hash_dict(schema)
+                            yield schema
+
+                    async def watch_llm_queue(_session_id):
+                        if not _session_id:
+                            return
+                        async for event in llm_queue_notifier.subscribe(_session_id, replay_latest=False):
+                            if event["type"] == "llm_queued":
+                                yield f"LLM繁忙，排队中（第{event['position']}位，已等待{event['wait']:.1f}秒）……"
+                            elif event["wait"] > 0:
+                                yield f"正在等待LLM回复……（排队{event['wait']:.1f}秒）"
+
                     _ = gr.State()
 
-                    timer = gr.Timer(1)
+                    # 定时轮询仅作为推送失效时的兜底
+                    timer = gr.Timer(schema_poll_interval)
                     timer.tick(fn=check_update_schema,
                                inputs=[session_id_state, schema_hash_store_state],
                                outputs=[schema_state, _])
@@ -592,6 +651,7 @@ def create_interface(mcp_server_url: str,
                                                      outputs=output_json)
 
                             submit_normal_button = gr.Button("修改各个参数提交")
+                            trust_button = gr.Button("提交并信任该工具（本会话内不再确认）")
 
                         if not schema:
                             gr.Markdown("**当调用工具时，此处会显示工具的各种函数。**")
@@ -661,6 +721,10 @@ def create_interface(mcp_server_url: str,
                                                        outputs=output_json
                             )
 
+                        trust_button.click(lambda _session_id, *vals: collect_inputs(schema, _session_id, *vals, trust=True),
+                                           inputs=[session_id_state, *inputs],
+                                           outputs=output_json)
+
         def on_generate_click():
             """当生成按钮被点击时的回调函数"""
             return generate_random_string()
@@ -676,7 +740,7 @@ def create_interface(mcp_server_url: str,
             return "未登录"
 
         # 登录按钮事件
-        login_btn.click(
+        login_event = login_btn.click(
             fn=login,
             inputs=[session_id, mcp_server_url_state, agent_info_state, work_path_state, model_config_state],
             outputs=[login_section, chat_section, status_msg]
@@ -686,13 +750,29 @@ def create_interface(mcp_server_url: str,
              f"会话ID: {_session_id}"),
             inputs=[session_id],
             outputs=[session_id_state, current_info]
+        ).then(
+            fn=load_chat_history,
+            inputs=[session_id_state],
+            outputs=[chatbot]
+        )
+        watch_event = login_event.then(
+            fn=watch_schema_updates,
+            inputs=[session_id_state, schema_hash_store_state],
+            outputs=[schema_state],
+            concurrency_limit=None  # 每个标签页一个长连接订阅，不占用默认的单并发队列
+        )
+        llm_queue_event = login_event.then(
+            fn=watch_llm_queue,
+            inputs=[session_id_state],
+            outputs=[chat_status],
+            concurrency_limit=None
         )
 
         # 清空对话
         clear_btn.click(
-            fn=lambda sha: ("对话已清空"),
+            fn=clear_chat,
             inputs=[session_id_state],
-            outputs=[chat_status]
+            outputs=[chatbot, chat_status]
         )
 
         # 登出按钮事件
@@ -702,7 +782,8 @@ def create_interface(mcp_server_url: str,
                 login_section,
                 chat_section,
                 status_msg
-            ]
+            ],
+            cancels=[watch_event, llm_queue_event]
         ).then(
             lambda: ("", "", "", "", "未登录"),  # 清空状态
             outputs=[session_id_state, current_info]
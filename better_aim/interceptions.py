@@ -0,0 +1,173 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from better_aim.metrics import approval_wait_seconds, pending_approvals_gauge
+from better_aim.notifications import SessionNotifier, interception_notifier
+from better_aim.tracing import tracer
+
+APPROVE = "approve"
+REJECT = "reject"
+
+
+class Interception:
+    """一次等待用户确认参数的工具调用"""
+
+    def __init__(self, session_id: str, call_id: str, tool_name: str, schema: Dict[str, Any], args: Dict[str, Any]):
+        self.session_id = session_id
+        self.call_id = call_id
+        self.tool_name = tool_name
+        self.schema = schema
+        self.args = dict(args)
+        self.created_at = time.time()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "call_id": self.call_id,
+            "tool_name": self.tool_name,
+            "schema": self.schema,
+            "created_at": self.created_at,
+        }
+
+
+class InterceptionRegistry:
+    """
+    按 function call ID 管理待确认的工具调用
+
+    模型在一轮中并行发起多个需要确认的调用时，每个调用各自等待、各自确认，互不覆盖。
+    超过 timeout 秒无人确认时执行 default_action：approve 按模型给出的原参数执行，reject 取消本次调用；
+    会话被回收时其所有待确认调用按 reject 处理，避免协程一直挂起。
+    """
+
+    def __init__(self, timeout: float = 600, default_action: str = REJECT,
+                 notifier: Optional[SessionNotifier] = None):
+        self.timeout = timeout
+        self.default_action = default_action
+        self.notifier = notifier or interception_notifier
+        self.target_tools: List[str] = []
+        self.tool_catalog = None
+        self._pending: Dict[str, "OrderedDict[str, Interception]"] = {}
+        self.timeouts = 0
+
+    def configure(self,
+                  target_tools: Optional[List[str]] = None,
+                  tool_catalog=None,
+                  timeout: Optional[float] = None,
+                  default_action: Optional[str] = None):
+        if target_tools is not None:
+            self.target_tools = list(target_tools)
+        if tool_catalog is not None:
+            self.tool_catalog = tool_catalog
+        if timeout is not None:
+            self.timeout = timeout
+        if default_action is not None:
+            if default_action not in (APPROVE, REJECT):
+                raise ValueError(f"未知的默认动作: {default_action}")
+            self.default_action = default_action
+
+    def should_intercept(self, tool_name: str) -> bool:
+        return tool_name in self.target_tools
+
+    def pending(self, session_id: str) -> List[Interception]:
+        """会话中按发起顺序排列的待确认调用"""
+        return list(self._pending.get(session_id, {}).values())
+
+    def first_pending(self, session_id: str) -> Optional[Interception]:
+        pending = self._pending.get(session_id)
+        if not pending:
+            return None
+        return next(iter(pending.values()))
+
+    async def request(self,
+                      session_id: str,
+                      call_id: str,
+                      tool_name: str,
+                      schema: Dict[str, Any],
+                      args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        登记拦截并等待确认，返回最终使用的参数；调用被拒绝（或超时且默认拒绝）时返回None
+        """
+        interception = Interception(session_id, call_id, tool_name, schema, args)
+        span = tracer.span(session_id, "approval.wait", tool=tool_name, call_id=call_id)
+        self._pending.setdefault(session_id, OrderedDict())[call_id] = interception
+        self.notifier.publish(session_id, {
+            "type": "tool_modify_required",
+            "call_id": call_id,
+            "schema": schema,
+            "tool_name": tool_name,
+            "pending": len(self._pending[session_id]),
+        })
+        status = "cancelled"
+        try:
+            timeout = self.timeout if self.timeout and self.timeout > 0 else None
+            try:
+                result = await asyncio.wait_for(asyncio.shield(interception.future), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                print(f"--- 工具 '{tool_name}' ({call_id}) 等待确认超时，执行默认动作: {self.default_action} ---")
+                result = interception.args if self.default_action == APPROVE else None
+                status = "timeout"
+            else:
+                status = "approved" if result is not None else "rejected"
+        finally:
+            self._remove(session_id, call_id)
+            approval_wait_seconds.observe(time.time() - interception.created_at, outcome=status)
+            span.end(outcome=status)
+            # 等待被取消（如本轮结束）时也要通知客户端关闭确认界面
+            self.notifier.publish(session_id, {
+                "type": "tool_modify_resolved",
+                "call_id": call_id,
+                "tool_name": tool_name,
+                "status": status,
+                "pending": len(self._pending.get(session_id, {})),
+            })
+        return result
+
+    def resolve(self, session_id: str, call_id: Optional[str], args: Optional[Dict[str, Any]]) -> bool:
+        """确认（args为修改后的参数）或拒绝（args为None）一个待确认调用；call_id为空时作用于最早的一个"""
+        pending = self._pending.get(session_id)
+        if not pending:
+            return False
+        if call_id is None:
+            interception = next(iter(pending.values()))
+        else:
+            interception = pending.get(call_id)
+        if interception is None or interception.future.done():
+            return False
+        interception.future.set_result(None if args is None else dict(args))
+        return True
+
+    def cancel_session(self, session_id: str):
+        """拒绝会话的全部待确认调用（会话被回收时调用）"""
+        for interception in self.pending(session_id):
+            if not interception.future.done():
+                interception.future.get_loop().call_soon_threadsafe(self._reject, interception)
+
+    @staticmethod
+    def _reject(interception: Interception):
+        if not interception.future.done():
+            interception.future.set_result(None)
+
+    def _remove(self, session_id: str, call_id: str):
+        pending = self._pending.get(session_id)
+        if pending is None:
+            return
+        pending.pop(call_id, None)
+        if not pending:
+            del self._pending[session_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": sum(len(pending) for pending in self._pending.values()),
+            "sessions": len(self._pending),
+            "timeout": self.timeout,
+            "default_action": self.default_action,
+            "timeouts": self.timeouts,
+        }
+
+
+# 全局工具调用拦截表
+interceptions = InterceptionRegistry()
+pending_approvals_gauge.set_function(lambda: interceptions.stats()["pending"])
@@ -0,0 +1,154 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from better_aim.notifications import SessionNotifier
+
+# LLM排队事件通道：llm_queued / llm_admitted
+llm_queue_notifier = SessionNotifier()
+
+
+class _Waiter:
+    def __init__(self, session_id: str, future: asyncio.Future):
+        self.session_id = session_id
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class LlmAdmissionController:
+    """
+    进程级LLM请求准入控制
+
+    同时在途的模型请求不超过 max_in_flight，超出的请求排队。
+    排队采用按会话的加权公平队列（WFQ）：每个请求的虚拟完成时间为
+    max(当前虚拟时间, 该会话上一个请求的虚拟完成时间) + 1/weight，按其从小到大放行，
+    因此连续发起大量请求的会话只会排在自己的请求后面，不会饿死其它会话。
+    max_in_flight 为0表示不限制。
+    """
+
+    def __init__(self, max_in_flight: int = 8, notifier: Optional[SessionNotifier] = None):
+        self.max_in_flight = max_in_flight
+        self.notifier = notifier or llm_queue_notifier
+        self.weights: Dict[str, float] = {}
+        self._in_flight = 0
+        self._virtual_time = 0.0
+        self._finish_tags: Dict[str, float] = {}
+        self._queue: List[Tuple[float, int, _Waiter]] = []
+        self._seq = itertools.count()
+        # 指标
+        self.admitted = 0
+        self.queued = 0  # 进入过队列的请求数
+        self.waited = 0  # 排队后被放行的请求数
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def configure(self, max_in_flight: Optional[int] = None):
+        if max_in_flight is not None:
+            self.max_in_flight = max_in_flight
+            self._dispatch()
+
+    def set_weight(self, session_id: str, weight: float):
+        """调整会话权重，权重越大分到的并发份额越多"""
+        self.weights[session_id] = weight
+
+    def discard(self, session_id: str):
+        """会话被回收时清理其权重与虚拟时间"""
+        self.weights.pop(session_id, None)
+        if not any(waiter.session_id == session_id for _, _, waiter in self._queue):
+            self._finish_tags.pop(session_id, None)
+
+    def current_wait(self, session_id: str) -> float:
+        """该会话最早一个排队请求已等待的秒数，未排队时为0"""
+        waits = [time.monotonic() - waiter.enqueued_at
+                 for _, _, waiter in self._queue if waiter.session_id == session_id]
+        return max(waits, default=0.0)
+
+    @asynccontextmanager
+    async def slot(self, session_id: str):
+        """占用一个在途名额，退出时释放并放行下一个排队请求"""
+        await self._acquire(session_id)
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "queue_length": len(self._queue),
+            "queued_sessions": len({waiter.session_id for _, _, waiter in self._queue}),
+            "oldest_wait_seconds": max((now - waiter.enqueued_at for _, _, waiter in self._queue), default=0.0),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "avg_wait_seconds": self.wait_seconds_total / self.waited if self.waited else 0.0,
+            "max_wait_seconds": self.wait_seconds_max,
+        }
+
+    def _has_capacity(self) -> bool:
+        return not self.max_in_flight or self._in_flight < self.max_in_flight
+
+    async def _acquire(self, session_id: str):
+        if self._has_capacity() and not self._queue:
+            self._in_flight += 1
+            self.admitted += 1
+            return
+
+        weight = self.weights.get(session_id, 1.0)
+        tag = max(self._virtual_time, self._finish_tags.get(session_id, 0.0)) + 1.0 / weight
+        self._finish_tags[session_id] = tag
+        waiter = _Waiter(session_id, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, (tag, next(self._seq), waiter))
+        self.queued += 1
+        self._notify_positions()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已获得名额但调用方取消了，归还名额
+                self._in_flight -= 1
+            else:
+                self._queue = [item for item in self._queue if item[2] is not waiter]
+                heapq.heapify(self._queue)
+            self._dispatch()
+            raise
+
+    def _dispatch(self):
+        admitted = False
+        while self._queue and self._has_capacity():
+            tag, _, waiter = heapq.heappop(self._queue)
+            if waiter.future.done():
+                continue
+            self._virtual_time = tag
+            self._in_flight += 1
+            self.admitted += 1
+            waited = time.monotonic() - waiter.enqueued_at
+            self.waited += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            waiter.future.set_result(None)
+            self.notifier.publish(waiter.session_id, {"type": "llm_admitted", "wait": round(waited, 1)})
+            admitted = True
+        if admitted:
+            self._notify_positions()
+
+    def _notify_positions(self):
+        # 每个会话只通报其最靠前的请求位置
+        first: Dict[str, Tuple[int, _Waiter]] = {}
+        for position, (_, _, waiter) in enumerate(sorted(self._queue), 1):
+            first.setdefault(waiter.session_id, (position, waiter))
+        for session_id, (position, waiter) in first.items():
+            self.notifier.publish(session_id, {
+                "type": "llm_queued",
+                "position": position,
+                "wait": round(time.monotonic() - waiter.enqueued_at, 1),
+            })
+
+
+# 全局LLM准入控制器，所有agent的模型调用共享
+llm_limiter = LlmAdmissionController()
@@ -2,7 +2,22 @@ from google.adk.agents import LlmAgent
 from google.adk.sessions import InMemorySessionService
 from litellm.experimental_mcp_client import load_mcp_tools
 
+from better_aim.agent import create_llm_agent
+from better_aim.agent_pool import AgentPool
+from better_aim.approval_policy import approval_policy, load_approval_policy
+from better_aim.history_store import RecentHistoryCache
 from better_aim.host import create_interface
+from better_aim.interceptions import interceptions
+from better_aim.llm_limiter import llm_limiter
+from better_aim.mcp_pool import mcp_connection_pool
+from better_aim.metrics import active_agents_gauge, mount_metrics
+from better_aim.parallel_tools import parallel_tools
+from better_aim.runner_registry import RunnerRegistry
+from better_aim.session_cleanup import add_session_eviction_listeners
+from better_aim.tool_cache import tool_result_cache
+from better_aim.tracing import tracer
+from better_aim.usage import token_usage
+from better_aim.tool_catalog import ToolCatalog, load_tool_catalog
 import os
 import argparse
 import sys
@@ -14,20 +29,26 @@ from better_aim.load_mcp_tools import get_mcp_server_tools
 
 # 存储需要进行变量检查的工具
 target_tools = []
-tools_info = {}
+tool_catalog = ToolCatalog()
+streaming_enabled = True  # 是否逐token推送LLM输出
 session_service = InMemorySessionService()
+# 每个会话的Runner与ADK会话只创建一次，之后复用
+runner_registry = RunnerRegistry(session_service)
 
-# 全局变量存储活跃的agents
-active_agents: Dict[str, LlmAgent] = {}
+# 全局agent池，按LRU与空闲超时回收（在launch中配置创建方式与容量）
+active_agents: AgentPool = AgentPool()
 
-# 全局存储历史记录
-history_pool = {}
+# 各会话最近几轮对话的缓存（完整历史在历史存储中）
+history_pool: RecentHistoryCache = RecentHistoryCache()
+
+
+
+def set_tool_catalog(catalog: ToolCatalog):
+    """热替换全局工具目录"""
+    global tool_catalog
+    tool_catalog = catalog
+    interceptions.configure(tool_catalog=catalog)
 
-# 全局事件池，用于控制暂停与恢复
-pending_events = {}  # session_id -> asyncio.Event
-unmodified_schema_store = {}  # 临时存储未修改前的参数
-modified_schema_store = {}  # 临时存储修改后的参数
-modified_args_store = {}  # 临时存储修改后的参数
 
 def parse_arguments():
     """解析命令行参数"""
@@ -84,9 +105,30 @@ def launch(agent_info: dict,
            mcp_server_mode: str="bohr-agent-sdk",
            api_key: str=None,
            work_path: str='/tmp',
-           tools_need_modify=None):
+           tools_need_modify=None,
+           max_agents: int=256,
+           agent_idle_ttl: float=3600,
+           mcp_max_connections: int=4,
+           schema_poll_interval: float=10,
+           streaming: bool=True,
+           llm_max_concurrency: int=8,
+           max_upload_mb: float=10,
+           approval_timeout: float=600,
+           approval_default: str="reject",
+           approval_policy_path: str=None,
+           tool_cache_tools=None,
+           tool_cache_ttl: float=86400,
+           tool_cache_memory_mb: float=64,
+           tool_cache_disk_mb: float=1024,
+           parallel_tool_calls: bool=False,
+           max_parallel_tools: int=4,
+           trace: bool=False,
+           trace_sample_rate: float=1.0,
+           trace_max_mb: float=64,
+           trace_backups: int=5,
+           session_token_budget: int=0):
     # 设置API密钥（命令行参数优先）
-    global target_tools, tools_info
+    global target_tools, tool_catalog, streaming_enabled
     if api_key:
         os.environ["API_KEY"] = api_key
         model_config["api_key"] = api_key
@@ -98,18 +140,56 @@ def launch(agent_info: dict,
 
     if tools_need_modify:
         target_tools = tools_need_modify
-
-    # 加载 mcp server 工具信息
-    tools_info = asyncio.run(get_mcp_server_tools(mcp_server_url))
-    #print(tools_info)
+    streaming_enabled = streaming
+
+    # 配置agent池：被回收的会话在下一次请求时自动重建
+    active_agents.configure(
+        factory=lambda session_id: create_llm_agent(session_id=session_id,
+                                                    mcp_tools_url=mcp_server_url,
+                                                    agent_info=agent_info,
+                                                    model_config=model_config),
+        max_size=max_agents,
+        idle_ttl=agent_idle_ttl
+    )
+    # 会话被回收时丢弃其全部会话状态
+    add_session_eviction_listeners(active_agents, runner_registry.discard)
+    runner_registry.configure(app_name=agent_info["name"])
+    mcp_connection_pool.configure(max_connections=mcp_max_connections)
+    llm_limiter.configure(max_in_flight=llm_max_concurrency)
+    # 确定性工具的结果缓存（仅白名单中的工具）
+    tool_result_cache.configure(tools=tool_cache_tools or [],
+                                work_path=work_path,
+                                ttl=tool_cache_ttl,
+                                max_memory_bytes=int(tool_cache_memory_mb * 1024 * 1024),
+                                max_disk_bytes=int(tool_cache_disk_mb * 1024 * 1024))
+    # 同一回复中的多个工具调用并发执行
+    parallel_tools.configure(enabled=parallel_tool_calls, max_per_session=max_parallel_tools)
+    # 按轮采样的追踪，写入 work_path/traces 下按大小轮转的JSONL文件
+    tracer.configure(path=os.path.join(work_path, "traces", "spans.jsonl") if trace else None,
+                     sample_rate=trace_sample_rate,
+                     max_bytes=int(trace_max_mb * 1024 * 1024),
+                     backups=trace_backups)
+    # token用量随聊天记录持久化；每个会话的预算在模型调用前检查，0表示不限制
+    token_usage.configure(session_budget=session_token_budget, work_path=work_path)
+
+    # 加载 mcp server 工具信息，构建只读工具目录
+    tool_catalog = load_tool_catalog(mcp_server_url, work_path, on_update=set_tool_catalog)
+    # 参数确认：超过 approval_timeout 秒无人处理时按 approval_default 放行或取消
+    interceptions.configure(target_tools=target_tools,
+                            tool_catalog=tool_catalog,
+                            timeout=approval_timeout,
+                            default_action=approval_default)
+    # 自动确认策略：匹配规则的调用无需等待用户确认
+    approval_policy.configure(load_approval_policy(approval_policy_path))
 
     # 创建并启动界面
     demo = create_interface(mcp_server_url=mcp_server_url,
                             agent_info=agent_info,
                             work_path=work_path,
-                            tools_info=tools_info,
                             model_config=model_config,
-                            mcp_server_mode=mcp_server_mode)
+                            mcp_server_mode=mcp_server_mode,
+                            schema_poll_interval=schema_poll_interval,
+                            max_upload_bytes=int(max_upload_mb * 1024 * 1024))
     os.chdir(work_path)
 
     print(f"启动参数: 主机={host}, 端口={port}, 分享={share_mode}, 调试={debug_mode}, 工作路径={work_path}")
@@ -119,8 +199,14 @@ def launch(agent_info: dict,
             server_name=host,
             server_port=port,
             share=share_mode,
-            debug=debug_mode
+            debug=debug_mode,
+            max_file_size=f"{max_upload_mb}mb",  # gradio在接收过程中即拒绝超限文件
+            prevent_thread_lock=True
         )
+        # gradio的FastAPI应用在launch时才创建；路由按请求逐个匹配，启动后追加的 /metrics 同样生效
+        mount_metrics(demo.app)
+        active_agents_gauge.set_function(lambda: len(active_agents))
+        demo.block_thread()
     except Exception as e:
         print(f"启动失败: {e}")
         sys.exit(1)
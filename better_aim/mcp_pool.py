@@ -0,0 +1,314 @@
+import asyncio
+import itertools
+import time
+from typing import Dict, List, Optional, Any
+
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
+from google.adk.tools.mcp_tool.mcp_session_manager import SseServerParams
+
+
+def _resolve(future: asyncio.Future, error: Optional[BaseException] = None):
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
+        future.exception()  # 等待者可能已超时离开，避免未取回异常的警告
+
+
+class _Connection:
+    """
+    连接池中的一条MCP连接（一个MCPToolset即一条SSE连接）
+
+    MCP会话绑定创建它的task（anyio cancel scope），跨task关闭会出错，
+    因此连接的建立、工具列表的获取与关闭都在连接自己的后台task中完成，其它task只通过队列发出请求。
+    工具列表在连接建立时获取并缓存，健康检查时刷新。
+    """
+
+    def __init__(self, url: str, index: int):
+        self.url = url
+        self.index = index
+        self.tools: Dict[str, BaseTool] = {}
+        self.healthy = False
+        self.failures = 0
+        self.reconnects = 0
+        self.calls = 0
+        self.next_retry = 0.0
+        self.last_ok = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Future] = None
+        self._requests: Optional[asyncio.Queue] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def open(self, timeout: float):
+        """建立连接并获取工具列表，已建立时直接返回"""
+        if not self.is_open:
+            if self.last_ok:
+                self.reconnects += 1
+            loop = asyncio.get_running_loop()
+            self._ready = loop.create_future()
+            self._requests = asyncio.Queue()
+            self._task = loop.create_task(self._serve(self._ready, self._requests))
+        try:
+            await asyncio.wait_for(asyncio.shield(self._ready), timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise
+
+    async def refresh(self, timeout: float):
+        """在连接自己的task中重新获取工具列表（同时检查连接是否可用）"""
+        if not self.is_open:
+            return await self.open(timeout)
+        request = asyncio.get_running_loop().create_future()
+        self._requests.put_nowait(request)
+        await asyncio.wait_for(asyncio.shield(request), timeout)
+
+    async def close(self):
+        task, self._task = self._task, None
+        self.healthy = False
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.wait([task])
+
+    async def _serve(self, ready: asyncio.Future, requests: asyncio.Queue):
+        toolset = MCPToolset(connection_params=SseServerParams(url=self.url))
+        error: Optional[BaseException] = None
+        try:
+            self.tools = await self._list_tools(toolset)
+            _resolve(ready)
+            while True:
+                request = await requests.get()
+                self.tools = await self._list_tools(toolset)
+                _resolve(request)
+        except Exception as e:
+            error = e
+        finally:
+            if self._task in (None, asyncio.current_task()):
+                # 关闭期间可能已建立新的连接，不能清掉新连接的工具
+                self.tools = {}
+                self.healthy = False
+            closed = error or ConnectionError(f"MCP连接#{self.index} 已关闭")
+            _resolve(ready, closed)
+            while not requests.empty():
+                _resolve(requests.get_nowait(), closed)
+            try:
+                await toolset.close()
+            except Exception as e:
+                print(f"关闭MCP连接失败: {e}")
+
+    @staticmethod
+    async def _list_tools(toolset: MCPToolset) -> Dict[str, BaseTool]:
+        return {tool.name: tool for tool in await toolset.get_tools()}
+
+
+class MCPConnectionPool:
+    """
+    进程级MCP连接池，按服务器URL划分
+
+    所有agent共享同一组连接（每个URL最多 max_connections 条），
+    后台定期做健康检查保持连接，连接失效时按指数退避重连。
+    agent取到的是池级工具（PooledMCPTool），工具列表缓存在池中，模型每一步取工具不访问网络；
+    每次工具调用按轮询选择一条可用连接执行。
+    """
+
+    def __init__(self,
+                 max_connections: int = 4,
+                 keepalive_interval: float = 30,
+                 health_check_timeout: float = 10,
+                 backoff_base: float = 1,
+                 backoff_max: float = 60):
+        self.max_connections = max_connections
+        self.keepalive_interval = keepalive_interval
+        self.health_check_timeout = health_check_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._connections: Dict[str, List[_Connection]] = {}
+        self._round_robin: Dict[str, Any] = {}
+        self._tools: Dict[str, List["PooledMCPTool"]] = {}
+        self._toolsets: Dict[str, "PooledMCPToolset"] = {}
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    def configure(self, max_connections: Optional[int] = None, keepalive_interval: Optional[float] = None):
+        if max_connections is not None:
+            self.max_connections = max_connections
+        if keepalive_interval is not None:
+            self.keepalive_interval = keepalive_interval
+
+    def toolset(self, url: str) -> "PooledMCPToolset":
+        """获取指定URL的共享toolset，所有agent复用同一个实例"""
+        if url not in self._toolsets:
+            self._toolsets[url] = PooledMCPToolset(self, url)
+        return self._toolsets[url]
+
+    async def get_tools(self, url: str, readonly_context: Optional[ReadonlyContext] = None) -> List[BaseTool]:
+        """返回缓存的池级工具列表，尚无缓存时先建立一条连接"""
+        self._ensure_keepalive()
+        tools = self._tools.get(url)
+        if tools is None:
+            last_error = None
+            for conn in self._candidates(url):
+                try:
+                    await self._open(conn)
+                    break
+                except Exception as e:
+                    last_error = e
+                    await self._mark_failed(conn, e)
+            else:
+                raise ConnectionError(f"MCP服务器不可用: {url}") from last_error
+            tools = self._tools[url]
+        return tools
+
+    async def call_tool(self, url: str, name: str, args: Dict[str, Any], tool_context) -> Any:
+        """按轮询选择一条可用连接执行工具；连接建立失败时换下一条，工具调用本身不重试（工具未必幂等）"""
+        last_error = None
+        for conn in self._candidates(url):
+            if not conn.is_open:
+                try:
+                    await self._open(conn)
+                except Exception as e:
+                    last_error = e
+                    await self._mark_failed(conn, e)
+                    continue
+            tool = conn.tools.get(name)
+            if tool is None:
+                raise ValueError(f"MCP服务器 {url} 上没有工具 {name}")
+            conn.calls += 1
+            try:
+                return await tool.run_async(args=args, tool_context=tool_context)
+            except Exception as e:
+                await self._mark_failed(conn, e)
+                raise
+        raise ConnectionError(f"MCP服务器不可用: {url}") from last_error
+
+    async def health_check(self):
+        """对所有已打开或等待重连的连接做一次健康检查，同时刷新工具列表"""
+        now = time.monotonic()
+        for conns in self._connections.values():
+            for conn in conns:
+                if not conn.is_open and (now < conn.next_retry or not conn.failures):
+                    continue  # 退避中或从未使用过的连接不主动建立
+                try:
+                    await conn.refresh(self.health_check_timeout)
+                    self._mark_ok(conn)
+                    self._update_tools(conn)
+                except Exception as e:
+                    await self._mark_failed(conn, e)
+
+    async def close(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        for conns in self._connections.values():
+            for conn in conns:
+                await conn.close()
+        self._tools.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            url: [{
+                "index": conn.index,
+                "open": conn.is_open,
+                "healthy": conn.healthy,
+                "tools": len(conn.tools),
+                "calls": conn.calls,
+                "failures": conn.failures,
+                "reconnects": conn.reconnects,
+            } for conn in conns]
+            for url, conns in self._connections.items()
+        }
+
+    def _candidates(self, url: str) -> List[_Connection]:
+        """按轮询顺序返回可尝试的连接，处于退避期的连接排在最后"""
+        if url not in self._connections:
+            self._connections[url] = [_Connection(url, i) for i in range(max(1, self.max_connections))]
+            self._round_robin[url] = itertools.cycle(range(len(self._connections[url])))
+        conns = self._connections[url]
+        start = next(self._round_robin[url])
+        ordered = conns[start:] + conns[:start]
+        now = time.monotonic()
+        ready = [c for c in ordered if c.healthy or now >= c.next_retry]
+        backing_off = [c for c in ordered if c not in ready]
+        return ready + backing_off
+
+    async def _open(self, conn: _Connection):
+        await conn.open(self.health_check_timeout)
+        self._mark_ok(conn)
+        self._update_tools(conn)
+
+    def _update_tools(self, conn: _Connection):
+        """连接的工具列表变化时重建池级工具（工具名称不变时沿用原列表）"""
+        current = self._tools.get(conn.url)
+        if current is not None and sorted(tool.name for tool in current) == sorted(conn.tools):
+            return
+        self._tools[conn.url] = [PooledMCPTool(self, conn.url, tool) for tool in conn.tools.values()]
+
+    def _mark_ok(self, conn: _Connection):
+        conn.healthy = True
+        conn.failures = 0
+        conn.next_retry = 0.0
+        conn.last_ok = time.monotonic()
+
+    async def _mark_failed(self, conn: _Connection, error: Exception):
+        conn.failures += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (conn.failures - 1))
+        conn.next_retry = time.monotonic() + delay
+        print(f"⚠️  MCP连接#{conn.index} 失效 ({error})，{delay:.0f}秒后重连")
+        await conn.close()
+
+    def _ensure_keepalive(self):
+        if not self.keepalive_interval:
+            return
+        if self._keepalive_task is not None and not self._keepalive_task.done():
+            return
+        self._keepalive_task = asyncio.get_running_loop().create_task(self._keepalive_loop())
+
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            try:
+                await self.health_check()
+            except Exception as e:
+                print(f"MCP健康检查失败: {e}")
+
+
+class PooledMCPTool(BaseTool):
+    """连接池中的MCP工具，声明取自建立连接时获取的工具，每次调用由连接池选择连接执行"""
+
+    def __init__(self, pool: MCPConnectionPool, url: str, tool: BaseTool):
+        super().__init__(name=tool.name, description=tool.description, is_long_running=tool.is_long_running)
+        self._pool = pool
+        self._url = url
+        self._declaration = tool._get_declaration()
+
+    def _get_declaration(self):
+        return self._declaration
+
+    async def run_async(self, *, args: Dict[str, Any], tool_context) -> Any:
+        return await self._pool.call_tool(self._url, self.name, args, tool_context)
+
+
+class PooledMCPToolset(BaseToolset):
+    """挂在agent上的轻量toolset，返回连接池缓存的工具，工具调用复用连接池中的共享连接"""
+
+    def __init__(self, pool: MCPConnectionPool, url: str):
+        super().__init__()
+        self._pool = pool
+        self.url = url
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> List[BaseTool]:
+        return await self._pool.get_tools(self.url, readonly_context)
+
+    async def close(self):
+        # 连接归连接池所有，agent被回收时不关闭共享连接
+        pass
+
+
+# 进程级共享连接池
+mcp_connection_pool = MCPConnectionPool()
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+
+class SessionNotifier:
+    """
+    按会话划分的通知通道
+
+    发布方（如 tool_modify_guardrail）调用 publish，订阅方（如gradio界面）通过 subscribe 异步等待事件，
+    不再需要定时轮询。publish 线程安全，可跨事件循环投递。
+    每个会话会保留最后一条事件，晚到的订阅者会先收到它。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._latest: Dict[str, Dict[str, Any]] = {}
+
+    def publish(self, session_id: str, event: Dict[str, Any]):
+        with self._lock:
+            self._latest[session_id] = event
+            subscribers = list(self._subscribers.get(session_id, []))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # 订阅方的事件循环已关闭
+                self._unsubscribe(session_id, loop, queue)
+
+    def discard(self, session_id: str):
+        """丢弃会话保留的最后一条事件（会话被回收时调用）"""
+        with self._lock:
+            self._latest.pop(session_id, None)
+
+    def latest(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self._latest.get(session_id)
+
+    def subscriber_count(self, session_id: str) -> int:
+        return len(self._subscribers.get(session_id, []))
+
+    async def subscribe(self, session_id: str, replay_latest: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        """订阅某个会话的事件，调用方退出迭代（或被取消）时自动退订"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(session_id, []).append((loop, queue))
+            if replay_latest and session_id in self._latest:
+                queue.put_nowait(self._latest[session_id])
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._unsubscribe(session_id, loop, queue)
+
+    def _unsubscribe(self, session_id: str, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(session_id, [])
+            if (loop, queue) in subscribers:
+                subscribers.remove((loop, queue))
+            if not subscribers:
+                self._subscribers.pop(session_id, None)
+
+
+# 参数拦截事件通道：tool_modify_required / tool_modify_resolved
+interception_notifier = SessionNotifier()
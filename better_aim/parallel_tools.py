@@ -0,0 +1,147 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.models.llm_response import LlmResponse
+from google.adk.tools.tool_context import ToolContext
+
+from better_aim.metrics import tool_call_seconds
+from better_aim.tool_cache import is_error_result, normalize_tool_result
+from better_aim.tracing import tracer
+
+
+class ParallelToolDispatcher:
+    """
+    并发执行同一条模型回复中的多个工具调用
+
+    同一回复中的调用彼此独立（模型无法在同一回复里使用另一调用的结果）。开启后在 after_model_callback 中
+    为每个调用立即启动任务：先走参数确认（多个确认可同时弹出），再在会话并发上限 max_per_session 内执行工具。
+    ADK仍按原顺序逐个处理这些调用，tool_modify_guardrail 通过 claim 取回对应任务的结果直接作为工具响应，
+    因此写回会话的顺序与模型给出的顺序一致，而总耗时约等于最慢的一个调用。
+    """
+
+    def __init__(self, enabled: bool = False, max_per_session: int = 4):
+        self.enabled = enabled
+        self.max_per_session = max_per_session
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.metrics = {
+            "batches": 0,
+            "dispatched_calls": 0,
+            "claimed_calls": 0,
+            "cancelled_calls": 0,
+            "max_batch_size": 0,
+        }
+
+    def configure(self, enabled: Optional[bool] = None, max_per_session: Optional[int] = None):
+        if enabled is not None:
+            self.enabled = enabled
+        if max_per_session is not None:
+            self.max_per_session = max(1, max_per_session)
+            self._semaphores.clear()
+
+    async def after_model_callback(self, callback_context: CallbackContext,
+                                   llm_response: LlmResponse) -> Optional[LlmResponse]:
+        """模型回复中有多个函数调用时立即并发启动，返回None表示不修改回复"""
+        if not self.enabled or llm_response.partial or not llm_response.content or not llm_response.content.parts:
+            return None
+        calls = [part.function_call for part in llm_response.content.parts if part.function_call]
+        if len(calls) < 2:
+            return None
+
+        invocation_context = callback_context._invocation_context
+        agent = invocation_context.agent
+        session_id = agent.name[-32:]
+        tools = {tool.name: tool for tool in await agent.canonical_tools(ReadonlyContext(invocation_context))}
+
+        dispatched = 0
+        for call in calls:
+            tool = tools.get(call.name)
+            if tool is None:
+                continue  # 未知工具交给ADK按原流程报错
+            if not call.id:
+                # 预先分配调用ID（ADK只为缺少ID的调用生成），以便之后按ID取回结果
+                call.id = f"adk-{uuid.uuid4()}"
+            tool_context = ToolContext(invocation_context, function_call_id=call.id)
+            task = asyncio.get_running_loop().create_task(
+                self._execute(session_id, tool, dict(call.args or {}), tool_context))
+            self._tasks[(session_id, call.id)] = task
+            dispatched += 1
+
+        if dispatched:
+            self.metrics["batches"] += 1
+            self.metrics["dispatched_calls"] += dispatched
+            self.metrics["max_batch_size"] = max(self.metrics["max_batch_size"], dispatched)
+            print(f"--- 并发执行 {dispatched} 个工具调用（会话上限 {self.max_per_session}）---")
+        return None
+
+    async def _execute(self, session_id: str, tool, args: Dict[str, Any], tool_context: ToolContext) -> Dict[str, Any]:
+        from better_aim.tool_modify_guardrail import approve_tool_call
+        # 参数确认不占用执行名额，用户可同时确认多个调用
+        rejected = await approve_tool_call(tool, args, tool_context)
+        if rejected is not None:
+            return rejected
+        span = tracer.span(session_id, "tool.call", tool=tool.name, call_id=tool_context.function_call_id,
+                           parallel=True)
+        with span:
+            queued = time.monotonic()
+            async with self._semaphore(session_id):
+                started = time.monotonic()
+                span.set_attribute("slot_wait_ms", round((started - queued) * 1000, 3))
+                result = await tool.run_async(args=args, tool_context=tool_context)
+                elapsed = time.monotonic() - started
+                print(f"--- 工具 '{tool.name}' 执行完成，用时 {elapsed:.1f} 秒 ---")
+            tool_call_seconds.observe(elapsed, tool=tool.name)
+            result = normalize_tool_result(result)
+            # 出错次数由取回结果后的 after_tool_callback 统一计数
+            if is_error_result(result):
+                span.set_attribute("is_error", True)
+        return result
+
+    def _semaphore(self, session_id: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(session_id)
+        if semaphore is None:
+            semaphore = self._semaphores[session_id] = asyncio.Semaphore(self.max_per_session)
+        return semaphore
+
+    def claim(self, session_id: str, call_id: Optional[str]) -> Optional[asyncio.Task]:
+        """取走已提前启动的调用任务，没有时返回None（按常规流程执行）"""
+        if not call_id:
+            return None
+        task = self._tasks.pop((session_id, call_id), None)
+        if task is not None:
+            self.metrics["claimed_calls"] += 1
+        return task
+
+    def cancel_unclaimed(self, session_id: str) -> int:
+        """
+        取消会话中未被取走的任务，返回取消的数量
+
+        本轮被取消或出错时ADK不会再处理剩余的调用，这些任务若继续运行会一直占用执行名额、
+        保持参数确认弹窗直到超时，因此每轮结束时调用。
+        """
+        keys = [key for key in self._tasks if key[0] == session_id]
+        for key in keys:
+            self._tasks.pop(key).cancel()
+        self.metrics["cancelled_calls"] += len(keys)
+        return len(keys)
+
+    def discard(self, session_id: str):
+        """取消会话中未被取走的任务（会话被回收时调用）"""
+        self.cancel_unclaimed(session_id)
+        self._semaphores.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            self.metrics,
+            enabled=self.enabled,
+            max_per_session=self.max_per_session,
+            pending_calls=len(self._tasks),
+        )
+
+
+# 全局并发工具调度
+parallel_tools = ParallelToolDispatcher()
@@ -1,49 +1,86 @@
 import asyncio
 import json
 import os
+import time
 import uuid
 from typing import Dict, List, Optional, Any, AsyncGenerator
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, WebSocket, WebSocketDisconnect, Request, \
+    Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel
 import uvicorn
 
 from better_aim.agent import create_llm_agent
+from better_aim.agent_pool import AgentPool
+from better_aim.approval_policy import approval_policy, load_approval_policy
+from better_aim.history_store import HistoryStore, RecentHistoryCache, get_history_store
+from better_aim.mcp_pool import mcp_connection_pool
+from better_aim.metrics import active_agents_gauge, agent_events_total, errors_total, mount_metrics, \
+    open_websockets_gauge, turn_seconds
 from better_aim.adjustable_session_service import pop_event
-from better_aim.tool_modify_guardrail import zip_tool_schema, extract_arguments_from_schema
-from better_aim.utils import generate_random_string, hash_dict
-from better_aim.load_mcp_tools import get_mcp_server_tools
-from google.adk.agents import LlmAgent
+from better_aim.tool_catalog import ToolCatalog, load_tool_catalog, fetch_tool_catalog
+from better_aim.tool_modify_guardrail import end_tool_calls, extract_arguments_from_schema
+from better_aim.ws_stream import CoalescingSender, ws_stream_metrics
+from better_aim.sse_stream import SseTurn, SseTurnRegistry, parse_event_id
+from better_aim.llm_limiter import llm_limiter, llm_queue_notifier
+from better_aim.interceptions import REJECT, interceptions
+from better_aim.notifications import SessionNotifier, interception_notifier
+from better_aim.parallel_tools import parallel_tools
+from better_aim.runner_registry import RunnerRegistry
+from better_aim.session_cleanup import add_session_eviction_listeners
+from better_aim.tool_cache import tool_result_cache
+from better_aim.tracing import tracer
+from better_aim.usage import token_usage, usage_notifier
+from better_aim.archive_stream import ARCHIVE_FORMATS, resolve_archive_roots, stream_archive
+from better_aim.artifact_watcher import artifact_watchers
+from better_aim.file_index import file_indexes, is_valid_session_id, resolve_session_dir, resolve_session_path
+from better_aim.file_transfer import SessionFileResponse, content_disposition, transfer_stats
+from better_aim.uploads import UploadError, UploadSizeLimitMiddleware, chunked_uploads, iter_upload_file, \
+    safe_filename, save_upload_stream
+from better_aim.turn_scheduler import TurnScheduler, SessionBusyError
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
 from google.genai import types
 
 
 # 全局状态管理 (保持与原main.py兼容)
-active_agents: Dict[str, LlmAgent] = {}
-history_pool: Dict[str, List[List[str]]] = {}
+active_agents: AgentPool = AgentPool()
+history_pool: RecentHistoryCache = RecentHistoryCache()  # 仅缓存各会话最近几轮对话
 session_service = InMemorySessionService()
+# 每个会话的Runner与ADK会话只创建一次，之后复用
+runner_registry = RunnerRegistry(session_service)
 
-# MCP工具拦截相关状态
-pending_events: Dict[str, asyncio.Event] = {}
-unmodified_schema_store: Dict[str, Dict] = {}
-modified_schema_store: Dict[str, Dict] = {}
-modified_args_store: Dict[str, Dict] = {}
+# 上传大小限制：普通上传的单个文件上限，分块上传的上限由 chunked_uploads 配置
+max_upload_bytes = 10 * 1024 * 1024
+
+# 对话轮次调度：每个会话同一时刻只运行一轮，其余排队
+turn_scheduler = TurnScheduler()
+
+# SSE聊天：按会话与轮次ID保存对话的事件缓冲，用于断线续传
+sse_turns = SseTurnRegistry()
 
 # 配置信息
 target_tools: List[str] = []
-tools_info: List[Dict[str, Any]] = {}
+tool_catalog: ToolCatalog = ToolCatalog()
 agent_info: Dict[str, Any] = {}
 model_config: Dict[str, Any] = {}
 mcp_server_url: str = ""
+streaming_enabled: bool = True  # 是否逐token推送LLM输出
+ws_flush_interval_ms: float = 50  # WebSocket增量帧合并的刷新间隔
+ws_flush_bytes: int = 8192  # 增量累计到该字节数时立即发送
 work_path: str = "/tmp"
+history_store: Optional[HistoryStore] = None  # 在 initialize_server 中按配置创建
 
 # FastAPI应用
 app = FastAPI(title="Better AIM React API", version="1.0.0")
 
+# 普通上传边接收边计数，超过 max_upload_bytes 时立即返回413（注册在CORS之前，使413响应也带CORS头）
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=lambda: max_upload_bytes)
+
 # CORS设置
 app.add_middleware(
     CORSMiddleware,
@@ -56,23 +93,68 @@ app.add_middleware(
 
 # WebSocket连接管理
 class ConnectionManager:
+    # 单次变化超过该数量时只通知客户端整体刷新，避免逐条推送
+    max_file_events = 100
+
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
+        self.senders: Dict[str, CoalescingSender] = {}
 
-    async def connect(self, websocket: WebSocket, session_id: str):
+    async def connect(self, websocket: WebSocket, session_id: str, session_dir: str) -> CoalescingSender:
         await websocket.accept()
+        # 同一会话重新连接时先停止旧连接的出站缓冲并关闭旧连接，其缓冲的帧已无法送达新连接
+        previous_sender = self.senders.pop(session_id, None)
+        if previous_sender is not None:
+            await previous_sender.abort()
+        previous = self.active_connections.pop(session_id, None)
+        if previous is not None:
+            try:
+                await previous.close(code=4000, reason="replaced")
+            except Exception:
+                pass  # 旧连接可能已经断开
         self.active_connections[session_id] = websocket
-
-    def disconnect(self, session_id: str):
+        sender = CoalescingSender(websocket,
+                                  flush_interval=ws_flush_interval_ms / 1000,
+                                  flush_bytes=ws_flush_bytes,
+                                  session_id=session_id)
+        self.senders[session_id] = sender
+        # 监听会话目录，工具写出的文件实时推送给客户端
+        artifact_watchers.watch(session_id, session_dir,
+                                on_events=lambda events: self.send_file_events(session_id, events),
+                                index=file_indexes.get(session_dir))
+        return sender
+
+    def disconnect(self, session_id: str, websocket: Optional[WebSocket] = None):
+        # 同一会话的新连接可能已替换旧连接，此时旧连接断开不影响新连接
+        if websocket is not None and self.active_connections.get(session_id) is not websocket:
+            return
         if session_id in self.active_connections:
             del self.active_connections[session_id]
+        sender = self.senders.pop(session_id, None)
+        if sender is not None:
+            asyncio.ensure_future(sender.close())
+        artifact_watchers.unwatch(session_id)
 
     async def send_message(self, session_id: str, message: dict):
-        if session_id in self.active_connections:
-            await self.active_connections[session_id].send_text(json.dumps(message))
+        # 经由出站缓冲区发送，保证与已缓冲的流式增量之间的顺序
+        if session_id in self.senders:
+            await self.senders[session_id].send(message)
+
+    async def send_file_events(self, session_id: str, events: List[Dict[str, Any]]):
+        """推送 file_created / file_modified / file_deleted"""
+        if len(events) > self.max_file_events:
+            await self.send_message(session_id, {"type": "files_changed", "count": len(events)})
+            return
+        for event in events:
+            await self.send_message(session_id, event)
 
 manager = ConnectionManager()
 
+# Prometheus指标：GET /metrics
+mount_metrics(app)
+active_agents_gauge.set_function(lambda: len(active_agents))
+open_websockets_gauge.set_function(lambda: len(manager.active_connections))
+
 
 # Pydantic模型
 class LoginRequest(BaseModel):
@@ -85,98 +167,112 @@ class ChatMessage(BaseModel):
 class ModifyParamsRequest(BaseModel):
     session_id: str
     modified_schema: Dict[str, Any]
+    call_id: Optional[str] = None  # 为空时取 modified_schema 中的 call_id，仍为空则作用于最早的待确认调用
+    action: str = "approve"  # approve / reject
+    trust: bool = False  # 确认后本会话内信任该工具，不再弹出确认
 
 
-# 辅助函数
-def get_chat_history_file_path(sha_id: str, work_path: str) -> str:
-    """获取聊天历史文件路径"""
-    history_file_path = os.path.join(work_path, "chat_history")
-    os.makedirs(history_file_path, exist_ok=True)
-    return os.path.join(history_file_path, f"{sha_id}.json")
-
-
-def load_chat_history(sha_id: str, work_path: str) -> List[List[str]]:
-    """加载聊天历史记录"""
-    history_file = get_chat_history_file_path(sha_id, work_path)
-    if os.path.exists(history_file):
+def get_session_dir(session_id: str, create: bool = True) -> str:
+    """校验会话ID并返回会话目录；create为False时会话目录不存在返回404"""
+    try:
+        session_dir = resolve_session_dir(work_path, session_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="会话ID需要为32位字母或数字")
+    if create:
+        os.makedirs(session_dir, exist_ok=True)
+    elif not os.path.isdir(session_dir):
+        raise HTTPException(status_code=404, detail="会话目录不存在")
+    return session_dir
+
+
+def save_history_entry(session_id: str, entry: List[str]):
+    """持久化一轮对话，并更新最近对话缓存"""
+    with tracer.span(session_id, "history.append"):
+        seq = history_store.append(session_id, entry)
+    history_pool.append(session_id, seq, entry)
+
+
+async def forward_session_events(notifier: SessionNotifier, session_id: str, send):
+    """
+    把会话通知转发给客户端，直到被取消
+
+    用于LLM排队状态（llm_queued / llm_admitted）、参数拦截（tool_modify_required / tool_modify_resolved）
+    与token用量（usage）
+    """
+    async for event in notifier.subscribe(session_id, replay_latest=False):
         try:
-            with open(history_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
-
+            await send(event)
+        except Exception as e:
+            print(f"推送会话事件失败: {e}")
 
-def save_chat_history(sha_id: str, history: List[List[str]], work_path: str):
-    """保存聊天历史记录"""
-    history_file = get_chat_history_file_path(sha_id, work_path)
-    try:
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"保存聊天历史失败: {e}")
 
+async def call_agent_async(query: str, runner: Runner, user_id: str, session_id: str,
+                           streaming: Optional[bool] = None,
+                           transport: str = "websocket") -> AsyncGenerator[Dict[str, Any], None]:
+    """与agent异步对话（transport 仅用于区分指标）
 
-async def call_agent_async(query: str, runner: Runner, user_id: str, session_id: str) -> AsyncGenerator[Dict[str, Any], None]:
-    """与agent异步对话，支持MCP工具拦截"""
+    需要确认参数的工具调用由 tool_modify_guardrail 拦截，拦截事件经 interception_notifier 推送。
+    streaming开启时，LLM输出的增量文本以 {"type": "delta"} 逐段产出，
+    随后仍会产出完整消息（streaming_response / final_response），历史记录只应保存完整消息。
+    """
     content = types.Content(role='user', parts=[types.Part(text=query)])
+    if streaming is None:
+        streaming = streaming_enabled
+    run_config = RunConfig(streaming_mode=StreamingMode.SSE if streaming else StreamingMode.NONE)
+
+    started = time.perf_counter()
+    token_usage.start_turn(session_id)
+    # 每个非增量事件记录一个 runner.step span，覆盖从上一个事件到该事件产出的时间
+    step_started = time.time_ns()
+    partial_events = 0
+    try:
+        async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=content,
+                                            run_config=run_config):
+            # 处理流式增量文本
+            if event.partial:
+                partial_events += 1
+                agent_events_total.inc(type="delta")
+                if event.content and event.content.parts and event.content.parts[0].text:
+                    yield {
+                        "type": "delta",
+                        "content": event.content.parts[0].text,
+                        "is_final": False
+                    }
+                continue
+            tracer.span(session_id, "runner.step", start_time_ns=step_started, author=event.author,
+                        partial_events=partial_events, final=event.is_final_response()).end()
+            step_started, partial_events = time.time_ns(), 0
 
-    async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=content):
-        # 处理工具调用
-        if event.content and event.content.parts:
-            calls = event.get_function_calls()
-            if calls:
-                for call in calls:
-                    tool_name = call.name
-                    arguments = call.args
-
-                    # 检查是否需要拦截
-                    if tool_name in target_tools:
-                        schema = zip_tool_schema(
-                            tool_name=tool_name,
-                            arguments=arguments,
-                            tools_dict=tools_info
-                        )
-
-                        # 存储schema并等待用户修改
-                        unmodified_schema_store[session_id] = schema
-                        pending_events[session_id] = asyncio.Event()
-
-                        # 通知前端需要修改参数
-                        await manager.send_message(session_id, {
-                            "type": "tool_modify_required",
-                            "schema": schema,
-                            "tool_name": tool_name
-                        })
-
-                        # 等待用户修改完成
-                        await pending_events[session_id].wait()
-
-                        # 使用修改后的参数
-                        if session_id in modified_args_store:
-                            call.args = modified_args_store[session_id]
-
-                        # 清理状态
-                        unmodified_schema_store[session_id] = ""
-
+            # 工具调用事件不产出文本
+            if event.content and event.content.parts and event.get_function_calls():
+                agent_events_total.inc(type="function_call")
                 continue
 
-        # 处理最终响应
-        if event.is_final_response():
-            if event.content and event.content.parts:
-                yield {
-                    "type": "final_response",
-                    "content": event.content.parts[0].text,
-                    "is_final": True
-                }
-            break
-        else:
-            if event.content and event.content.parts:
-                yield {
-                    "type": "streaming_response",
-                    "content": event.content.parts[0].text,
-                    "is_final": False
-                }
+            # 处理最终响应
+            if event.is_final_response():
+                agent_events_total.inc(type="final_response")
+                if event.content and event.content.parts:
+                    yield {
+                        "type": "final_response",
+                        "content": event.content.parts[0].text,
+                        "is_final": True
+                    }
+                break
+            else:
+                agent_events_total.inc(type="event")
+                if event.content and event.content.parts:
+                    yield {
+                        "type": "streaming_response",
+                        "content": event.content.parts[0].text,
+                        "is_final": False
+                    }
+    except Exception:
+        errors_total.inc(source="turn")
+        raise
+    finally:
+        turn_seconds.observe(time.perf_counter() - started, transport=transport)
+        token_usage.end_turn(session_id)
+        end_tool_calls(session_id)
 
 
 # API端点
@@ -188,25 +284,19 @@ async def login(request: LoginRequest):
 
     if not session_id:
         raise HTTPException(status_code=400, detail="请填写会话ID")
-    elif len(session_id) != 32:
-        raise HTTPException(status_code=400, detail="会话ID需要为长度为32的任意字符")
+    elif not is_valid_session_id(session_id):
+        raise HTTPException(status_code=400, detail="会话ID需要为32位字母或数字")
 
     # 创建或获取agent
-    if session_id not in active_agents:
-        try:
-            agent = create_llm_agent(
-                session_id=session_id,
-                mcp_tools_url=mcp_server_url,
-                agent_info=agent_info,
-                model_config=model_config
-            )
-            active_agents[session_id] = agent
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"创建Agent失败: {str(e)}")
+    try:
+        active_agents.get(session_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"创建Agent失败: {str(e)}")
 
     # 初始化聊天历史
-    if session_id not in history_pool:
-        history_pool[session_id] = load_chat_history(session_id, work_path)
+    if history_pool.get(session_id) is None:
+        rows, has_more = history_store.page(session_id, limit=history_pool.max_turns)
+        history_pool.put(session_id, rows, complete=not has_more)
 
     print(f"登录成功，会话ID: {session_id}")
     return {"message": "登录成功", "session_id": session_id}
@@ -218,30 +308,29 @@ async def chat_with_agent(message: ChatMessage):
     session_id = message.session_id
     user_message = message.message
 
-    if session_id not in active_agents:
-        raise HTTPException(status_code=404, detail="Agent未找到，请重新登录")
-
-    agent = active_agents[session_id]
-    session = await session_service.create_session(
-        app_name=agent_info["name"],
-        user_id=session_id[:4],
-        session_id=session_id
-    )
-
-    runner = Runner(
-        agent=agent,
-        app_name=agent_info["name"],
-        session_service=session_service
-    )
+    async def notify_position(position: int):
+        # HTTP请求无法推送，若该会话有WebSocket连接则通过它告知排队位置
+        await manager.send_message(session_id, {"type": "queued", "position": position})
 
     full_response = ""
-    async for response in call_agent_async(user_message, runner, session_id[:4], session_id):
-        full_response += response.get("content", "")
-
-    # 更新聊天历史
-    history = history_pool[session_id]
-    history.append([user_message, full_response])
-    save_chat_history(session_id, history, work_path)
+    # 请求期间固定会话，agent池不会在本轮进行中回收它
+    with active_agents.pinned(session_id):
+        # agent可能已被池回收，此时会透明重建
+        try:
+            agent = active_agents.get(session_id)
+        except Exception as e:
+            raise HTTPException(status_code=404, detail=f"Agent未找到，请重新登录: {str(e)}")
+        runner = await runner_registry.get(session_id, agent)
+        try:
+            async with turn_scheduler.turn(session_id, on_position=notify_position):
+                with tracer.start_turn(session_id, transport="http"):
+                    async for response in call_agent_async(user_message, runner, session_id[:4], session_id,
+                                                           streaming=False, transport="http"):
+                        full_response += response.get("content", "")
+                    # 更新聊天历史
+                    save_history_entry(session_id, [user_message, full_response])
+        except SessionBusyError as e:
+            raise HTTPException(status_code=429, detail=str(e))
 
     return {"response": full_response, "is_final": True}
 
@@ -249,151 +338,396 @@ async def chat_with_agent(message: ChatMessage):
 @app.websocket("/ws/chat/{session_id}")
 async def websocket_chat(websocket: WebSocket, session_id: str):
     """WebSocket聊天端点，支持流式响应"""
-    await manager.connect(websocket, session_id)
+    try:
+        session_dir = resolve_session_dir(work_path, session_id)
+    except ValueError:
+        await websocket.close(code=1008)
+        return
+    sender = await manager.connect(websocket, session_id, session_dir)
+    # 连接期间固定会话，agent池不会回收正在使用的会话
+    active_agents.pin(session_id)
+    forwarders = [
+        asyncio.create_task(forward_session_events(llm_queue_notifier, session_id, sender.send)),
+        asyncio.create_task(forward_session_events(interception_notifier, session_id, sender.send)),
+        asyncio.create_task(forward_session_events(usage_notifier, session_id, sender.send)),
+    ]
 
     try:
-        if session_id not in active_agents:
-            await websocket.send_text(json.dumps({
+        try:
+            active_agents.get(session_id)
+        except Exception as e:
+            await sender.send({
                 "type": "error",
-                "message": "Agent未找到，请重新登录"
-            }))
+                "message": f"Agent未找到，请重新登录: {str(e)}"
+            })
             return
 
-        agent = active_agents[session_id]
-        session = await session_service.create_session(
-            app_name=agent_info["name"],
-            user_id=session_id[:4],
-            session_id=session_id
-        )
-
-        runner = Runner(
-            agent=agent,
-            app_name=agent_info["name"],
-            session_service=session_service
-        )
-
         while True:
             data = await websocket.receive_text()
             message_data = json.loads(data)
             user_message = message_data.get("message", "")
 
             if not user_message.strip():
-                await websocket.send_text(json.dumps({
+                await sender.send({
                     "type": "error",
                     "message": "消息不能为空"
-                }))
+                })
                 continue
 
-            response_text = ""
-            async for response in call_agent_async(user_message, runner, session_id[:4], session_id):
-                if response["type"] in ["streaming_response", "final_response"]:
-                    response_text += response.get("content", "")
-                    await websocket.send_text(json.dumps(response))
+            async def notify_position(position: int):
+                await sender.send({"type": "queued", "position": position})
 
-            # 更新聊天历史
-            history = history_pool[session_id]
-            history.append([user_message, response_text])
-            save_chat_history(session_id, history, work_path)
+            response_text = ""
+            try:
+                async with turn_scheduler.turn(session_id, on_position=notify_position):
+                    # 根span在取得执行权后开始（排队中的下一轮不会覆盖当前轮），覆盖agent运行、推送与历史写入
+                    with tracer.start_turn(session_id, transport="websocket"):
+                        await sender.send({"type": "turn_started"})
+                        # 长连接期间agent可能被回收重建，每轮从注册表取最新的Runner
+                        runner = await runner_registry.get(session_id, active_agents.get(session_id))
+                        async for response in call_agent_async(user_message, runner, session_id[:4], session_id):
+                            if response["type"] in ["delta", "streaming_response", "final_response"]:
+                                # 增量文本只用于实时显示，历史记录保存完整消息
+                                if response["type"] != "delta":
+                                    response_text += response.get("content", "")
+                                await sender.send(response)
+                        await sender.flush()
+                        # 更新聊天历史
+                        save_history_entry(session_id, [user_message, response_text])
+            except SessionBusyError as e:
+                await sender.send({"type": "busy", "message": str(e)})
+                continue
 
     except WebSocketDisconnect:
-        manager.disconnect(session_id)
+        pass
+    finally:
+        # 任何方式退出都要停止该连接的目录监听与事件转发
+        manager.disconnect(session_id, websocket)
+        for forwarder in forwarders:
+            forwarder.cancel()
+        active_agents.unpin(session_id)
+
+
+async def run_sse_turn(turn: SseTurn, session_id: str, user_message: str):
+    """在后台运行一轮对话并把事件写入SSE缓冲，客户端断开不影响本轮执行"""
+    response_text = ""
+    active_agents.pin(session_id)
+    try:
+        agent = active_agents.get(session_id)
+        runner = await runner_registry.get(session_id, agent)
+
+        async def notify_position(position: int):
+            await turn.publish({"type": "queued", "position": position})
+
+        async with turn_scheduler.turn(session_id, on_position=notify_position):
+            with tracer.start_turn(session_id, transport="sse"):
+                await turn.publish({"type": "turn_started"})
+                forwarders = [
+                    asyncio.create_task(forward_session_events(llm_queue_notifier, session_id, turn.publish)),
+                    asyncio.create_task(forward_session_events(interception_notifier, session_id, turn.publish)),
+                    asyncio.create_task(forward_session_events(usage_notifier, session_id, turn.publish)),
+                ]
+                try:
+                    async for response in call_agent_async(user_message, runner, session_id[:4], session_id,
+                                                           transport="sse"):
+                        if response["type"] in ["streaming_response", "final_response"]:
+                            response_text += response.get("content") or ""
+                        await turn.publish(response)
+                finally:
+                    for forwarder in forwarders:
+                        forwarder.cancel()
+                save_history_entry(session_id, [user_message, response_text])
+    except SessionBusyError as e:
+        await turn.publish({"type": "busy", "message": str(e)})
+    except Exception as e:
+        await turn.publish({"type": "error", "message": str(e)})
+    finally:
+        active_agents.unpin(session_id)
+        await turn.finish()
+
+
+def sse_chat_response(session_id: str, user_message: Optional[str], last_event_id: Optional[str]) -> StreamingResponse:
+    """
+    携带Last-Event-ID时续传该ID所属的一轮，否则开始新一轮对话（排队中的轮次互不覆盖）
+
+    EventSource重连时会带上原来的消息，因此无法续传的ID（格式错误、轮次已过期、序号超出范围）直接拒绝，
+    不会当作新消息再运行一轮。
+    """
+    if last_event_id:
+        event_id = parse_event_id(last_event_id)
+        if event_id is None:
+            raise HTTPException(status_code=400, detail=f"无效的Last-Event-ID: {last_event_id}")
+        turn_id, after_seq = event_id
+        turn = sse_turns.get(session_id, turn_id)
+        if turn is None:
+            raise HTTPException(status_code=410, detail="该轮对话已结束或已过期，无法续传")
+        if not 0 <= after_seq <= turn.event_count:
+            raise HTTPException(status_code=400, detail=f"Last-Event-ID超出本轮事件范围: {last_event_id}")
+    else:
+        if not user_message or not user_message.strip():
+            raise HTTPException(status_code=400, detail="消息不能为空")
+        if turn_scheduler.is_full(session_id):
+            raise HTTPException(status_code=429, detail="会话正在处理消息，排队已满")
+        turn = sse_turns.create(session_id)
+        turn.task = asyncio.create_task(run_sse_turn(turn, session_id, user_message))
+        after_seq = 0
+
+    return StreamingResponse(
+        turn.stream(after_seq=after_seq),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁止nginx等代理缓冲
+        }
+    )
+
+
+@app.post("/api/chat/stream")
+async def chat_stream_post(message: ChatMessage, request: Request):
+    """SSE流式聊天（POST），适用于无法使用WebSocket的网络环境"""
+    return sse_chat_response(message.session_id, message.message, request.headers.get("last-event-id"))
+
+
+@app.get("/api/chat/stream")
+async def chat_stream_get(request: Request, session_id: str, message: Optional[str] = None,
+                          last_event_id: Optional[str] = None):
+    """SSE流式聊天（GET，供EventSource使用），EventSource自动重连时通过Last-Event-ID续传"""
+    return sse_chat_response(session_id, message, request.headers.get("last-event-id") or last_event_id)
 
 
 @app.post("/api/modify-params")
 async def modify_parameters(request: ModifyParamsRequest):
-    """处理参数修改请求"""
+    """确认（可修改参数）或拒绝一个待确认的工具调用，并行调用可分别提交"""
     session_id = request.session_id
     modified_schema = request.modified_schema
+    call_id = request.call_id or modified_schema.get("call_id")
 
-    # 提取修改后的参数
-    modified_args = extract_arguments_from_schema(modified_schema)
-    modified_args_store[session_id] = modified_args
-    modified_schema_store[session_id] = modified_schema
+    if request.action == REJECT:
+        modified_args = None
+    else:
+        # 提取修改后的参数
+        modified_args = extract_arguments_from_schema(modified_schema)
+        if request.trust and modified_schema.get("name"):
+            approval_policy.trust(session_id, modified_schema["name"])
 
     # 恢复agent执行
-    if session_id in pending_events:
-        pending_events[session_id].set()
+    if not interceptions.resolve(session_id, call_id, modified_args):
+        raise HTTPException(status_code=404, detail="没有对应的待确认工具调用（可能已超时）")
 
-    return {"message": "参数已更新", "modified_args": modified_args}
+    return {"message": "参数已更新" if modified_args is not None else "调用已取消",
+            "call_id": call_id,
+            "modified_args": modified_args}
 
 
 @app.get("/api/files/{session_id}")
-async def list_files(session_id: str):
-    """获取会话文件列表"""
-    session_dir = os.path.join(work_path, session_id)
-    os.makedirs(session_dir, exist_ok=True)
-
-    files = []
-    for filename in os.listdir(session_dir):
-        file_path = os.path.join(session_dir, filename)
-        if os.path.isfile(file_path):
-            files.append({
-                "name": filename,
-                "path": file_path,
-                "size": os.path.getsize(file_path)
-            })
-
-    return {"files": sorted(files, key=lambda x: x["name"])}
+async def list_files(session_id: str,
+                     offset: int = 0,
+                     limit: int = 500,
+                     sort: str = "name",
+                     order: str = "asc",
+                     q: Optional[str] = None,
+                     dir: Optional[str] = None):
+    """获取会话文件列表（递归），支持分页、排序（name/size/mtime）与过滤"""
+    session_dir = get_session_dir(session_id)
+
+    index = file_indexes.get(session_dir)
+    offset = max(0, offset)
+    limit = max(1, min(limit, 5000))
+    total, entries = await asyncio.to_thread(index.query, offset=offset, limit=limit, sort=sort,
+                                             order=order, pattern=q, directory=dir)
+    files = [{
+        "name": entry.path,
+        "path": os.path.join(session_dir, entry.path),
+        "size": entry.size,
+        "mtime": entry.mtime
+    } for entry in entries]
+
+    return {"files": files, "total": total, "offset": offset, "limit": limit}
 
 
 @app.post("/api/upload/{session_id}")
 async def upload_file(session_id: str, files: List[UploadFile] = File(...)):
-    """上传文件到会话目录"""
-    session_dir = os.path.join(work_path, session_id)
-    os.makedirs(session_dir, exist_ok=True)
+    """上传文件到会话目录，逐块写入临时文件后原子重命名，超限的文件会被跳过"""
+    session_dir = get_session_dir(session_id)
 
     uploaded_files = []
+    rejected_files = []
     for file in files:
-        file_path = os.path.join(session_dir, file.filename)
-
-        # 检查文件大小 (10MB限制)
-        content = await file.read()
-        if len(content) > 10 * 1024 * 1024:
+        try:
+            filename = safe_filename(file.filename)
+            file_path = os.path.join(session_dir, filename)
+            size = await save_upload_stream(iter_upload_file(file), file_path, max_upload_bytes)
+        except UploadError as e:
+            rejected_files.append({"name": file.filename, "reason": str(e)})
             continue
+        finally:
+            await file.close()
 
-        with open(file_path, "wb") as f:
-            f.write(content)
-
+        transfer_stats.add_uploaded(session_id, size)
         uploaded_files.append({
-            "name": file.filename,
+            "name": filename,
             "path": file_path,
-            "size": len(content)
+            "size": size
         })
 
-    return {"uploaded_files": uploaded_files}
+    file_indexes.get(session_dir).invalidate()
+    return {"uploaded_files": uploaded_files, "rejected_files": rejected_files}
+
+
+class ChunkedUploadRequest(BaseModel):
+    filename: str
+    size: int
+
+
+@app.post("/api/upload/{session_id}/chunked")
+async def create_chunked_upload(session_id: str, request: ChunkedUploadRequest):
+    """开始一个可续传的分块上传，返回upload_id与建议的分块大小"""
+    try:
+        return await chunked_uploads.create(get_session_dir(session_id), request.filename, request.size)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@app.get("/api/upload/{session_id}/chunked/{upload_id}")
+async def get_chunked_upload(session_id: str, upload_id: str):
+    """查询已接收的偏移量，断线重连后从这里继续"""
+    try:
+        return await chunked_uploads.status(get_session_dir(session_id), upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@app.put("/api/upload/{session_id}/chunked/{upload_id}")
+async def append_chunked_upload(session_id: str, upload_id: str, offset: int, request: Request):
+    """从offset处追加一块数据，请求体为原始字节流"""
+    try:
+        status = await chunked_uploads.append(get_session_dir(session_id), upload_id, offset, request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    transfer_stats.add_uploaded(session_id, status["offset"] - offset, files=0)
+    return status
+
+
+@app.post("/api/upload/{session_id}/chunked/{upload_id}/complete")
+async def complete_chunked_upload(session_id: str, upload_id: str):
+    """所有分块到齐后把文件移动到会话目录"""
+    try:
+        session_dir = get_session_dir(session_id)
+        uploaded = await chunked_uploads.complete(session_dir, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    file_indexes.get(session_dir).invalidate()
+    transfer_stats.add_uploaded(session_id, 0)
+    return uploaded
+
+
+@app.delete("/api/upload/{session_id}/chunked/{upload_id}")
+async def abort_chunked_upload(session_id: str, upload_id: str):
+    """放弃分块上传并删除已接收的数据"""
+    try:
+        await chunked_uploads.abort(get_session_dir(session_id), upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return {"message": "上传已取消"}
+
+
+# 必须注册在单文件下载之前，否则会被 {filename} 路由匹配
+@app.get("/api/download/{session_id}/archive")
+async def download_archive(session_id: str,
+                           format: str = "zip",
+                           paths: Optional[List[str]] = Query(None),
+                           compresslevel: int = 6):
+    """把会话目录（或其中指定的文件/子目录）递归打包为zip或tar.gz，边打包边下载"""
+    if format not in ARCHIVE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的压缩格式，可选: {', '.join(ARCHIVE_FORMATS)}")
+    session_dir = get_session_dir(session_id, create=False)
+    try:
+        roots = resolve_archive_roots(session_dir, paths)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"文件不存在: {e}")
+
+    media_type, suffix = ARCHIVE_FORMATS[format]
+
+    async def counted():
+        async for chunk in stream_archive(session_dir, roots, fmt=format,
+                                          compresslevel=max(0, min(compresslevel, 9))):
+            transfer_stats.add_downloaded(session_id, len(chunk))
+            yield chunk
+
+    transfer_stats.record_download(session_id, 200)
+    return StreamingResponse(
+        counted(),
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition(f"{session_id[:8]}{suffix}")}
+    )
 
 
-@app.get("/api/download/{session_id}/{filename}")
-async def download_file(session_id: str, filename: str):
-    """下载文件"""
-    file_path = os.path.join(work_path, session_id, filename)
+@app.api_route("/api/download/{session_id}/{filename:path}", methods=["GET", "HEAD"])
+async def download_file(session_id: str, filename: str, request: Request):
+    """下载文件（可为子目录中的文件），支持Range断点续传与ETag/Last-Modified条件请求"""
+    session_dir = get_session_dir(session_id, create=False)
+    try:
+        file_path = resolve_session_path(session_dir, filename)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="文件不存在")
 
-    if not os.path.exists(file_path):
+    try:
+        response = await SessionFileResponse.create(
+            file_path, request.headers, filename=os.path.basename(file_path),
+            on_sent=lambda nbytes: transfer_stats.add_downloaded(session_id, nbytes))
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="文件不存在")
+    transfer_stats.record_download(session_id, response.status_code)
+    return response
+
+
+@app.get("/api/sessions/{session_id}/transfer")
+async def get_session_transfer(session_id: str):
+    """会话的上传/下载流量统计"""
+    return transfer_stats.get(session_id)
+
 
-    return FileResponse(file_path, filename=filename)
+@app.get("/api/transfer/stats")
+async def get_transfer_stats(limit: int = 20):
+    """全局流量合计与流量最大的会话"""
+    return transfer_stats.top(limit=max(1, min(limit, 200)))
 
 
 @app.get("/api/sessions/{session_id}/history")
-async def get_chat_history(session_id: str):
-    """获取聊天历史"""
-    history = history_pool.get(session_id, load_chat_history(session_id, work_path))
-    return {"history": history}
+async def get_chat_history(session_id: str, before: Optional[int] = None, limit: int = 50):
+    """获取聊天历史（游标分页：before为上一页返回的next_before）"""
+    limit = max(1, min(limit, 500))
+    page = history_pool.page(session_id, limit) if before is None else None
+    if page is None:
+        page = history_store.page(session_id, before=before, limit=limit)
+    rows, has_more = page
+    return {
+        "history": [entry for _, entry in rows],
+        "next_before": rows[0][0] if rows and has_more else None,
+        "has_more": has_more
+    }
 
 
 @app.post("/api/sessions/{session_id}/clear")
 async def clear_chat_history(session_id: str):
     """清空聊天历史"""
-    history_pool[session_id] = []
-    save_chat_history(session_id, [], work_path)
+    history_store.clear(session_id)
+    history_pool.clear(session_id)
+    # 同时清空ADK会话中的对话上下文，否则模型仍会看到已清空的对话
+    await runner_registry.reset(session_id)
     return {"message": "聊天历史已清空"}
 
 
 @app.get("/api/schema/{session_id}")
 async def get_current_schema(session_id: str):
-    """获取当前需要修改的参数schema"""
-    schema = unmodified_schema_store.get(session_id, {})
-    return {"schema": schema}
+    """获取当前需要修改的参数schema：schema 为最早的待确认调用，pending 为全部待确认调用"""
+    pending = interceptions.pending(session_id)
+    return {
+        "schema": pending[0].schema if pending else {},
+        "pending": [interception.to_dict() for interception in pending]
+    }
 
 
 @app.get("/api/health")
@@ -401,6 +735,143 @@ async def health_check():
     """健康检查端点"""
     return {"status": "ok", "message": "Backend is running"}
 
+@app.get("/api/agents/stats")
+async def get_agent_pool_stats():
+    """agent池监控指标（命中/未命中/淘汰次数）"""
+    return active_agents.stats()
+
+
+@app.get("/api/runners/stats")
+async def get_runner_registry_stats():
+    """Runner与ADK会话复用统计"""
+    return runner_registry.stats()
+
+
+@app.get("/api/mcp/stats")
+async def get_mcp_pool_stats():
+    """MCP连接池状态"""
+    return mcp_connection_pool.stats()
+
+
+@app.post("/api/tools/refresh")
+async def refresh_tools():
+    """从MCP服务器重新拉取工具目录并热替换，无需重启"""
+    try:
+        catalog = await fetch_tool_catalog(mcp_server_url, work_path)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"刷新MCP工具失败: {str(e)}")
+
+    changed = catalog.fingerprint != tool_catalog.fingerprint
+    set_tool_catalog(catalog)
+    return {
+        "message": "工具目录已刷新",
+        "tool_count": len(catalog),
+        "fingerprint": catalog.fingerprint,
+        "changed": changed
+    }
+
+
+@app.get("/api/llm/stats")
+async def get_llm_limiter_stats():
+    """LLM并发准入与排队等待指标"""
+    return llm_limiter.stats()
+
+
+@app.get("/api/turns/stats")
+async def get_turn_stats():
+    """对话轮次调度状态"""
+    return turn_scheduler.stats()
+
+
+@app.get("/api/watchers/stats")
+async def get_watcher_stats():
+    """会话目录监听状态"""
+    return artifact_watchers.stats()
+
+
+@app.get("/api/sessions/{session_id}/trusted-tools")
+async def get_trusted_tools(session_id: str):
+    """会话内已信任（自动确认）的工具"""
+    return {"tools": approval_policy.trusted_tools(session_id)}
+
+
+@app.post("/api/sessions/{session_id}/trusted-tools/{tool_name}")
+async def trust_tool(session_id: str, tool_name: str):
+    """本会话内信任该工具，之后的调用不再等待确认"""
+    if tool_name not in target_tools:
+        raise HTTPException(status_code=404, detail=f"工具 '{tool_name}' 不需要确认")
+    approval_policy.trust(session_id, tool_name)
+    return {"tools": approval_policy.trusted_tools(session_id)}
+
+
+@app.delete("/api/sessions/{session_id}/trusted-tools/{tool_name}")
+async def untrust_tool(session_id: str, tool_name: str):
+    """取消对该工具的信任"""
+    approval_policy.untrust(session_id, tool_name)
+    return {"tools": approval_policy.trusted_tools(session_id)}
+
+
+@app.get("/api/sessions/{session_id}/usage")
+async def get_session_usage(session_id: str):
+    """会话累计与当前轮的token用量，以及预算余量"""
+    return token_usage.usage(session_id)
+
+
+@app.get("/api/usage/stats")
+async def get_usage_stats():
+    """全局token用量与因超出预算被拒绝的调用数"""
+    return token_usage.stats()
+
+
+@app.get("/api/approval/stats")
+async def get_approval_stats():
+    """自动确认策略的决策统计（按工具与结果计数）"""
+    return approval_policy.stats()
+
+
+@app.get("/api/tool-cache/stats")
+async def get_tool_cache_stats():
+    """工具结果缓存的命中率与占用"""
+    return tool_result_cache.stats()
+
+
+@app.delete("/api/tool-cache")
+async def clear_tool_cache():
+    """清空工具结果缓存（MCP工具实现更新后使用）"""
+    await asyncio.to_thread(tool_result_cache.clear)
+    return {"message": "工具结果缓存已清空"}
+
+
+@app.get("/api/tools/parallel/stats")
+async def get_parallel_tool_stats():
+    """并发工具调用统计"""
+    return parallel_tools.stats()
+
+
+@app.get("/api/tracing/stats")
+async def get_tracing_stats():
+    """追踪的采样与写入统计"""
+    return tracer.stats()
+
+
+@app.get("/api/interceptions/stats")
+async def get_interception_stats():
+    """待确认工具调用数量与超时次数"""
+    return interceptions.stats()
+
+
+@app.get("/api/sse/stats")
+async def get_sse_stats():
+    """SSE轮次缓冲统计"""
+    return sse_turns.stats()
+
+
+@app.get("/api/ws/stats")
+async def get_ws_stream_stats():
+    """WebSocket出站帧统计（发送帧数、字节数、合并比）"""
+    return ws_stream_metrics.stats()
+
+
 @app.get("/api/config")
 async def get_config():
     """获取应用配置信息"""
@@ -408,36 +879,124 @@ async def get_config():
     config = {
         "agent_info": agent_info,
         "mcp_server_url": mcp_server_url,
-        "target_tools": target_tools
+        "target_tools": target_tools,
+        "max_upload_size": max_upload_bytes,
+        "max_chunked_upload_size": chunked_uploads.max_bytes,
+        "upload_chunk_size": chunked_uploads.max_chunk_bytes,
+        "approval_timeout": interceptions.timeout,
+        "approval_default": interceptions.default_action,
+        "session_token_budget": token_usage.session_budget
     }
     print(f"返回配置信息: {config}")
     return config
 
 
 # 初始化函数
+def set_tool_catalog(catalog: ToolCatalog):
+    """热替换全局工具目录"""
+    global tool_catalog
+    tool_catalog = catalog
+    interceptions.configure(tool_catalog=catalog)
+
+
 def initialize_server(
     agent_info_dict: Dict[str, Any],
     model_config_dict: Dict[str, Any],
     mcp_url: str,
     work_dir: str = "/tmp",
-    tools_modify: List[str] = None
+    tools_modify: List[str] = None,
+    max_agents: int = 256,
+    agent_idle_ttl: float = 3600,
+    mcp_max_connections: int = 4,
+    history_backend: str = "sqlite",
+    streaming: bool = True,
+    flush_interval_ms: float = 50,
+    flush_bytes: int = 8192,
+    max_pending_turns: int = 2,
+    llm_max_concurrency: int = 8,
+    max_upload_mb: float = 10,
+    max_chunked_upload_mb: float = 4096,
+    upload_chunk_mb: float = 8,
+    watch_poll_interval: float = 2.0,
+    use_inotify: bool = True,
+    approval_timeout: float = 600,
+    approval_default: str = "reject",
+    approval_policy_file: Optional[str] = None,
+    tool_cache_tools: Optional[List[str]] = None,
+    tool_cache_ttl: float = 86400,
+    tool_cache_memory_mb: float = 64,
+    tool_cache_disk_mb: float = 1024,
+    parallel_tool_calls: bool = False,
+    max_parallel_tools: int = 4,
+    trace: bool = False,
+    trace_sample_rate: float = 1.0,
+    trace_max_mb: float = 64,
+    trace_backups: int = 5,
+    session_token_budget: int = 0
 ):
     """初始化服务器配置"""
-    global agent_info, model_config, mcp_server_url, work_path, target_tools, tools_info
+    global agent_info, model_config, mcp_server_url, work_path, target_tools, tool_catalog, history_store, \
+        streaming_enabled, ws_flush_interval_ms, ws_flush_bytes, max_upload_bytes
 
     agent_info = agent_info_dict
     model_config = model_config_dict
     mcp_server_url = mcp_url
+    streaming_enabled = streaming
+    ws_flush_interval_ms = flush_interval_ms
+    ws_flush_bytes = flush_bytes
+    turn_scheduler.max_pending = max_pending_turns
+    max_upload_bytes = int(max_upload_mb * 1024 * 1024)
+    artifact_watchers.configure(poll_interval=watch_poll_interval, use_inotify=use_inotify)
+    chunked_uploads.configure(max_bytes=int(max_chunked_upload_mb * 1024 * 1024),
+                              max_chunk_bytes=int(upload_chunk_mb * 1024 * 1024))
     work_path = work_dir
     target_tools = tools_modify or []
-
-    # 加载MCP工具信息
-    try:
-        tools_info = asyncio.run(get_mcp_server_tools(mcp_server_url))
-        print(f"✅ 成功加载 {len(tools_info)} 个MCP工具")
-    except Exception as e:
-        print(f"⚠️  加载MCP工具失败: {e}")
-        tools_info = []
+    history_store = get_history_store(work_path, backend=history_backend)
+
+    # 配置agent池：被回收的会话在下一次请求时自动重建
+    active_agents.configure(
+        factory=lambda session_id: create_llm_agent(
+            session_id=session_id,
+            mcp_tools_url=mcp_server_url,
+            agent_info=agent_info,
+            model_config=model_config
+        ),
+        max_size=max_agents,
+        idle_ttl=agent_idle_ttl
+    )
+    # 会话被回收时丢弃其全部会话状态
+    add_session_eviction_listeners(active_agents, sse_turns.discard, runner_registry.discard, transfer_stats.discard)
+    # 只统计agent池中的会话，回收时随之丢弃
+    transfer_stats.configure(is_active=lambda session_id: session_id in active_agents)
+    runner_registry.configure(app_name=agent_info["name"])
+    mcp_connection_pool.configure(max_connections=mcp_max_connections)
+    llm_limiter.configure(max_in_flight=llm_max_concurrency)
+    # 确定性工具的结果缓存（仅白名单中的工具）
+    tool_result_cache.configure(tools=tool_cache_tools or [],
+                                work_path=work_path,
+                                ttl=tool_cache_ttl,
+                                max_memory_bytes=int(tool_cache_memory_mb * 1024 * 1024),
+                                max_disk_bytes=int(tool_cache_disk_mb * 1024 * 1024))
+    # 同一回复中的多个工具调用并发执行
+    parallel_tools.configure(enabled=parallel_tool_calls, max_per_session=max_parallel_tools)
+    # 按轮采样的追踪，写入 work_path/traces 下按大小轮转的JSONL文件
+    tracer.configure(path=os.path.join(work_path, "traces", "spans.jsonl") if trace else None,
+                     sample_rate=trace_sample_rate,
+                     max_bytes=int(trace_max_mb * 1024 * 1024),
+                     backups=trace_backups)
+    # token用量随聊天记录持久化；每个会话的预算在模型调用前检查，0表示不限制
+    token_usage.configure(session_budget=session_token_budget, work_path=work_path)
+
+    # 加载MCP工具信息：优先使用磁盘缓存，后台再与MCP服务器同步
+    tool_catalog = load_tool_catalog(mcp_server_url, work_path, on_update=set_tool_catalog)
+
+    # 参数确认：超过 approval_timeout 秒无人处理时按 approval_default 放行或取消
+    interceptions.configure(target_tools=target_tools,
+                            tool_catalog=tool_catalog,
+                            timeout=approval_timeout,
+                            default_action=approval_default)
+    # 自动确认策略：匹配规则的调用无需等待用户确认
+    approval_policy.configure(load_approval_policy(approval_policy_file))
 
 
 def run_server(host: str = "0.0.0.0", port: int = 8000):
@@ -62,6 +62,194 @@ def parse_arguments():
         help="API密钥 (优先级高于环境变量)"
     )
 
+    parser.add_argument(
+        "--max-agents",
+        type=int,
+        default=256,
+        help="agent池容量上限，超出时按LRU回收 (默认: 256)"
+    )
+
+    parser.add_argument(
+        "--agent-idle-ttl",
+        type=float,
+        default=3600,
+        help="agent空闲多少秒后被回收 (默认: 3600)"
+    )
+
+    parser.add_argument(
+        "--mcp-max-connections",
+        type=int,
+        default=4,
+        help="所有会话共享的MCP连接数上限 (默认: 4)"
+    )
+
+    parser.add_argument(
+        "--history-backend",
+        type=str,
+        choices=["sqlite", "jsonl"],
+        default="sqlite",
+        help="聊天历史存储方式 (默认: sqlite)"
+    )
+
+    parser.add_argument(
+        "--no-streaming",
+        action="store_true",
+        help="关闭LLM输出的逐token流式推送"
+    )
+
+    parser.add_argument(
+        "--ws-flush-ms",
+        type=float,
+        default=50,
+        help="WebSocket流式增量合并的刷新间隔，毫秒 (默认: 50)"
+    )
+
+    parser.add_argument(
+        "--ws-flush-bytes",
+        type=int,
+        default=8192,
+        help="WebSocket流式增量累计到该字节数时立即发送 (默认: 8192)"
+    )
+
+    parser.add_argument(
+        "--max-pending-turns",
+        type=int,
+        default=2,
+        help="每个会话最多排队的消息数，超出时拒绝 (默认: 2)"
+    )
+
+    parser.add_argument(
+        "--llm-max-concurrency",
+        type=int,
+        default=8,
+        help="全局同时在途的LLM请求上限，超出时按会话公平排队，0表示不限制 (默认: 8)"
+    )
+
+    parser.add_argument(
+        "--max-upload-mb",
+        type=float,
+        default=10,
+        help="普通上传的单个文件大小上限，单位MB (默认: 10)"
+    )
+
+    parser.add_argument(
+        "--max-chunked-upload-mb",
+        type=float,
+        default=4096,
+        help="分块（可续传）上传的单个文件大小上限，单位MB (默认: 4096)"
+    )
+
+    parser.add_argument(
+        "--watch-poll-interval",
+        type=float,
+        default=2.0,
+        help="无inotify时轮询会话目录变化的间隔，单位秒 (默认: 2)"
+    )
+
+    parser.add_argument(
+        "--no-inotify",
+        action="store_true",
+        help="禁用inotify，始终轮询会话目录 (默认: 在Linux上使用inotify)"
+    )
+
+    parser.add_argument(
+        "--approval-timeout",
+        type=float,
+        default=600,
+        help="工具参数确认的等待超时，单位秒，0表示不超时 (默认: 600)"
+    )
+
+    parser.add_argument(
+        "--approval-default",
+        type=str,
+        choices=["approve", "reject"],
+        default="reject",
+        help="确认超时后的默认动作：approve按原参数执行，reject取消调用 (默认: reject)"
+    )
+
+    parser.add_argument(
+        "--approval-policy",
+        type=str,
+        default=None,
+        help="自动确认策略文件(JSON)，匹配规则的工具调用无需等待确认 (默认: 不启用)"
+    )
+
+    parser.add_argument(
+        "--tool-cache",
+        type=str,
+        nargs="*",
+        default=[],
+        help="启用结果缓存的确定性工具名称列表 (默认: 不缓存)"
+    )
+
+    parser.add_argument(
+        "--tool-cache-ttl",
+        type=float,
+        default=86400,
+        help="工具结果缓存的有效期，单位秒 (默认: 86400)"
+    )
+
+    parser.add_argument(
+        "--tool-cache-memory-mb",
+        type=float,
+        default=64,
+        help="工具结果内存缓存上限，单位MB (默认: 64)"
+    )
+
+    parser.add_argument(
+        "--tool-cache-disk-mb",
+        type=float,
+        default=1024,
+        help="工具结果磁盘缓存上限，单位MB (默认: 1024)"
+    )
+
+    parser.add_argument(
+        "--parallel-tools",
+        action="store_true",
+        help="并发执行同一条模型回复中的多个工具调用 (默认: 依次执行)"
+    )
+
+    parser.add_argument(
+        "--max-parallel-tools",
+        type=int,
+        default=4,
+        help="每个会话同时执行的工具调用上限 (默认: 4)"
+    )
+
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="记录每轮对话的追踪span，写入 work_path/traces/spans.jsonl (默认: 关闭)"
+    )
+
+    parser.add_argument(
+        "--trace-sample-rate",
+        type=float,
+        default=1.0,
+        help="追踪的采样率，按轮采样，取值0~1 (默认: 1.0)"
+    )
+
+    parser.add_argument(
+        "--trace-max-mb",
+        type=float,
+        default=64,
+        help="单个追踪文件的大小上限，超出后轮转，单位MB (默认: 64)"
+    )
+
+    parser.add_argument(
+        "--trace-backups",
+        type=int,
+        default=5,
+        help="保留的已轮转追踪文件数 (默认: 5)"
+    )
+
+    parser.add_argument(
+        "--session-token-budget",
+        type=int,
+        default=0,
+        help="每个会话的token预算（prompt + completion），用完后不再调用模型，0表示不限制 (默认: 0)"
+    )
+
     parser.add_argument(
         "--no-dev",
         action="store_true",
@@ -223,7 +411,34 @@ def react_launch(agent_info: Dict,
                 backend_host: str = "localhost",
                 no_dev: bool = False,
                 debug: bool = False,
-                api_key: str = None):
+                api_key: str = None,
+                max_agents: int = 256,
+                agent_idle_ttl: float = 3600,
+                mcp_max_connections: int = 4,
+                history_backend: str = "sqlite",
+                streaming: bool = True,
+                ws_flush_interval_ms: float = 50,
+                ws_flush_bytes: int = 8192,
+                max_pending_turns: int = 2,
+                llm_max_concurrency: int = 8,
+                max_upload_mb: float = 10,
+                max_chunked_upload_mb: float = 4096,
+                watch_poll_interval: float = 2.0,
+                use_inotify: bool = True,
+                approval_timeout: float = 600,
+                approval_default: str = "reject",
+                approval_policy_file: str = None,
+                tool_cache_tools: list = None,
+                tool_cache_ttl: float = 86400,
+                tool_cache_memory_mb: float = 64,
+                tool_cache_disk_mb: float = 1024,
+                parallel_tool_calls: bool = False,
+                max_parallel_tools: int = 4,
+                trace: bool = False,
+                trace_sample_rate: float = 1.0,
+                trace_max_mb: float = 64,
+                trace_backups: int = 5,
+                session_token_budget: int = 0):
     """启动React版本的Better AIM"""
 
     # 设置API密钥
@@ -242,7 +457,34 @@ def react_launch(agent_info: Dict,
         model_config_dict=model_config,
         mcp_url=mcp_server_url,
         work_dir=work_path,
-        tools_modify=tools_need_modify
+        tools_modify=tools_need_modify,
+        max_agents=max_agents,
+        agent_idle_ttl=agent_idle_ttl,
+        mcp_max_connections=mcp_max_connections,
+        history_backend=history_backend,
+        streaming=streaming,
+        flush_interval_ms=ws_flush_interval_ms,
+        flush_bytes=ws_flush_bytes,
+        max_pending_turns=max_pending_turns,
+        llm_max_concurrency=llm_max_concurrency,
+        max_upload_mb=max_upload_mb,
+        max_chunked_upload_mb=max_chunked_upload_mb,
+        watch_poll_interval=watch_poll_interval,
+        use_inotify=use_inotify,
+        approval_timeout=approval_timeout,
+        approval_default=approval_default,
+        approval_policy_file=approval_policy_file,
+        tool_cache_tools=tool_cache_tools,
+        tool_cache_ttl=tool_cache_ttl,
+        tool_cache_memory_mb=tool_cache_memory_mb,
+        tool_cache_disk_mb=tool_cache_disk_mb,
+        parallel_tool_calls=parallel_tool_calls,
+        max_parallel_tools=max_parallel_tools,
+        trace=trace,
+        trace_sample_rate=trace_sample_rate,
+        trace_max_mb=trace_max_mb,
+        trace_backups=trace_backups,
+        session_token_budget=session_token_budget
     )
 
     # 启动前端开发服务器（如果需要）
@@ -308,7 +550,34 @@ Help users perform DeePTB tasks including training config file generation, submi
         backend_host=args.backend_host,
         no_dev=args.no_dev,
         debug=args.debug,
-        api_key=args.api_key
+        api_key=args.api_key,
+        max_agents=args.max_agents,
+        agent_idle_ttl=args.agent_idle_ttl,
+        mcp_max_connections=args.mcp_max_connections,
+        history_backend=args.history_backend,
+        streaming=not args.no_streaming,
+        ws_flush_interval_ms=args.ws_flush_ms,
+        ws_flush_bytes=args.ws_flush_bytes,
+        max_pending_turns=args.max_pending_turns,
+        llm_max_concurrency=args.llm_max_concurrency,
+        max_upload_mb=args.max_upload_mb,
+        max_chunked_upload_mb=args.max_chunked_upload_mb,
+        watch_poll_interval=args.watch_poll_interval,
+        use_inotify=not args.no_inotify,
+        approval_timeout=args.approval_timeout,
+        approval_default=args.approval_default,
+        approval_policy_file=args.approval_policy,
+        tool_cache_tools=args.tool_cache,
+        tool_cache_ttl=args.tool_cache_ttl,
+        tool_cache_memory_mb=args.tool_cache_memory_mb,
+        tool_cache_disk_mb=args.tool_cache_disk_mb,
+        parallel_tool_calls=args.parallel_tools,
+        max_parallel_tools=args.max_parallel_tools,
+        trace=args.trace,
+        trace_sample_rate=args.trace_sample_rate,
+        trace_max_mb=args.trace_max_mb,
+        trace_backups=args.trace_backups,
+        session_token_budget=args.session_token_budget
     )
 
 
@@ -0,0 +1,95 @@
+import asyncio
+from typing import Any, Dict, Optional
+
+from google.adk.agents import LlmAgent
+from google.adk.runners import Runner
+from google.adk.sessions import BaseSessionService
+
+
+class _Entry:
+    def __init__(self, runner: Runner, agent: LlmAgent, user_id: str):
+        self.runner = runner
+        self.agent = agent
+        self.user_id = user_id
+
+
+class RunnerRegistry:
+    """
+    按会话缓存 Runner 与 ADK 会话
+
+    首次对话时创建ADK会话（已存在则直接复用）与Runner，之后的每一轮都复用同一个Runner。
+    agent被池回收后会被重建，此时按新的agent重建Runner；
+    discard 在agent被回收时调用，只移除Runner，session_service 中的ADK会话（对话上下文）保持不变；
+    只有用户显式清空对话时才通过 reset 删除ADK会话。
+    """
+
+    def __init__(self, session_service: BaseSessionService, app_name: str = ""):
+        self.session_service = session_service
+        self.app_name = app_name
+        self._entries: Dict[str, _Entry] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.created = 0
+        self.reused = 0
+
+    def configure(self, app_name: str):
+        self.app_name = app_name
+
+    async def get(self, session_id: str, agent: LlmAgent, user_id: Optional[str] = None) -> Runner:
+        """获取会话的Runner，不存在（或agent已被重建）时创建"""
+        user_id = user_id or session_id[:4]
+        entry = self._entries.get(session_id)
+        if entry is not None and entry.agent is agent:
+            self.reused += 1
+            return entry.runner
+
+        async with self._lock(session_id):
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.agent is agent:
+                self.reused += 1
+                return entry.runner
+
+            session = await self.session_service.get_session(app_name=self.app_name,
+                                                             user_id=user_id,
+                                                             session_id=session_id)
+            if session is None:
+                await self.session_service.create_session(app_name=self.app_name,
+                                                          user_id=user_id,
+                                                          session_id=session_id)
+            runner = Runner(agent=agent, app_name=self.app_name, session_service=self.session_service)
+            self._entries[session_id] = _Entry(runner, agent, user_id)
+            self.created += 1
+            return runner
+
+    def discard(self, session_id: str):
+        """移除会话的Runner（agent被回收时调用），ADK会话保留，下次对话时按新agent重建Runner"""
+        self._entries.pop(session_id, None)
+        lock = self._locks.get(session_id)
+        # 正在被 get 持有的锁不能丢弃，否则并发的 get 会各自创建Runner
+        if lock is not None and not lock.locked():
+            del self._locks[session_id]
+
+    async def reset(self, session_id: str, user_id: Optional[str] = None):
+        """删除会话的Runner与ADK会话（用户清空对话时调用），下一轮从空的对话上下文开始"""
+        async with self._lock(session_id):
+            entry = self._entries.pop(session_id, None)
+            user_id = entry.user_id if entry is not None else (user_id or session_id[:4])
+            session = await self.session_service.get_session(app_name=self.app_name,
+                                                             user_id=user_id,
+                                                             session_id=session_id)
+            if session is not None:
+                await self.session_service.delete_session(app_name=self.app_name,
+                                                          user_id=user_id,
+                                                          session_id=session_id)
+
+    def _lock(self, session_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(session_id, asyncio.Lock())
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "created": self.created,
+            "reused": self.reused,
+        }
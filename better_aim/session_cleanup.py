@@ -0,0 +1,29 @@
+from typing import Any, Callable
+
+from better_aim.agent_pool import AgentPool
+from better_aim.approval_policy import approval_policy
+from better_aim.interceptions import interceptions
+from better_aim.llm_limiter import llm_limiter, llm_queue_notifier
+from better_aim.notifications import interception_notifier
+from better_aim.parallel_tools import parallel_tools
+from better_aim.tracing import tracer
+from better_aim.usage import token_usage, usage_notifier
+
+# 两个host共用的按会话保存的状态，会话被回收时全部丢弃
+SESSION_DISCARDS = [
+    interceptions.cancel_session,
+    interception_notifier.discard,
+    approval_policy.discard,
+    parallel_tools.discard,
+    tracer.discard,
+    token_usage.discard,
+    usage_notifier.discard,
+    llm_limiter.discard,
+    llm_queue_notifier.discard,
+]
+
+
+def add_session_eviction_listeners(agents: AgentPool, *discards: Callable[[str], Any]):
+    """为agent池注册会话回收时的清理回调：先丢弃共用状态，再丢弃host自己的状态（discards）"""
+    for discard in [*SESSION_DISCARDS, *discards]:
+        agents.add_eviction_listener(lambda session_id, reason, discard=discard: discard(session_id))
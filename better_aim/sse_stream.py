@@ -0,0 +1,127 @@
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+_turn_ids = itertools.count(1)
+
+
+def format_sse(data: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    """编码为一条SSE消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class SseTurn:
+    """
+    一轮对话的SSE事件缓冲
+
+    agent在后台task中运行并把事件写入缓冲，客户端断线不会中断本轮对话；
+    重连时携带 Last-Event-ID 即可从断点继续接收。
+    事件ID格式为 "{turn_id}:{seq}"，seq从1开始连续递增。
+    内存占用与单轮回复长度相当，结束后由 SseTurnRegistry 在保留期过后丢弃。
+    """
+
+    def __init__(self):
+        self.turn_id = next(_turn_ids)
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None  # 运行本轮的后台task，保留引用以免被垃圾回收
+        self._events: List[Dict[str, Any]] = []
+        self._changed = asyncio.Condition()
+
+    @property
+    def event_count(self) -> int:
+        return len(self._events)
+
+    async def publish(self, event: Dict[str, Any]):
+        async with self._changed:
+            self._events.append(event)
+            self._changed.notify_all()
+
+    async def finish(self):
+        async with self._changed:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._changed.notify_all()
+
+    async def stream(self, after_seq: int = 0, heartbeat_interval: float = 15) -> AsyncIterator[str]:
+        """产出序号大于after_seq的SSE消息，空闲时发送心跳注释，本轮结束后退出"""
+        yield "retry: 3000\n\n"
+        while True:
+            async with self._changed:
+                if len(self._events) <= after_seq and not self.done:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=heartbeat_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                pending = self._events[after_seq:]
+                done = self.done
+
+            if not pending and not done:
+                # 心跳注释，防止代理因空闲断开连接
+                yield ": ping\n\n"
+                continue
+            for event in pending:
+                after_seq += 1
+                yield format_sse(event, f"{self.turn_id}:{after_seq}")
+            if done and not pending:
+                yield format_sse({"type": "done"}, f"{self.turn_id}:{after_seq}")
+                return
+
+
+def parse_event_id(event_id: Optional[str]) -> Optional[Tuple[int, int]]:
+    """把 "{turn_id}:{seq}" 解析为 (turn_id, seq)，格式不对时返回None"""
+    if not event_id:
+        return None
+    try:
+        turn_id, seq = event_id.split(":", 1)
+        return int(turn_id), int(seq)
+    except ValueError:
+        return None
+
+
+class SseTurnRegistry:
+    """
+    按会话与轮次ID保存SSE轮次
+
+    同一会话可能有一轮正在运行、若干轮在排队，每一轮都可以按各自的 Last-Event-ID 续传，
+    新一轮不会覆盖仍在进行的轮次。已结束的轮次保留 retention 秒供断线的客户端取回剩余事件。
+    """
+
+    def __init__(self, retention: float = 300):
+        self.retention = retention
+        self._turns: Dict[str, Dict[int, SseTurn]] = {}
+
+    def create(self, session_id: str) -> SseTurn:
+        self._prune(session_id)
+        turn = SseTurn()
+        self._turns.setdefault(session_id, {})[turn.turn_id] = turn
+        return turn
+
+    def get(self, session_id: str, turn_id: int) -> Optional[SseTurn]:
+        return self._turns.get(session_id, {}).get(turn_id)
+
+    def discard(self, session_id: str):
+        self._turns.pop(session_id, None)
+
+    def _prune(self, session_id: str):
+        turns = self._turns.get(session_id)
+        if not turns:
+            return
+        now = time.monotonic()
+        for turn_id in [turn_id for turn_id, turn in turns.items()
+                        if turn.done and now - turn.finished_at > self.retention]:
+            del turns[turn_id]
+
+    def stats(self) -> Dict[str, Any]:
+        turns = [turn for session_turns in self._turns.values() for turn in session_turns.values()]
+        return {
+            "sessions": len(self._turns),
+            "turns": len(turns),
+            "running_or_queued": sum(1 for turn in turns if not turn.done),
+        }
@@ -0,0 +1,426 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.tools.tool_context import ToolContext
+
+
+def canonical_json(value: Any) -> str:
+    """键排序、无多余空白的JSON，相同内容的参数得到相同的字符串"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def normalize_tool_result(result: Any) -> Dict[str, Any]:
+    """
+    把工具返回值转换为可JSON序列化的字典
+
+    与ADK的处理一致：非字典的返回值包装为 {"result": ...}，MCP返回的pydantic对象先转换为字典。
+    """
+    if hasattr(result, "model_dump"):
+        result = result.model_dump(mode="json", exclude_none=True)
+    if not isinstance(result, dict):
+        result = {"result": result}
+    return json.loads(json.dumps(result, ensure_ascii=False, default=str))
+
+
+def is_error_result(result: Dict[str, Any]) -> bool:
+    inner = result.get("result")
+    return bool(result.get("isError") or (isinstance(inner, dict) and inner.get("isError")))
+
+
+class ToolResultCache:
+    """
+    按内容寻址的MCP工具结果缓存（仅对白名单中的确定性工具生效）
+
+    缓存键为 工具名 + 参数的规范化哈希，参数中指向输入文件的路径按所在位置替换为文件内容哈希，
+    因此同一结构文件在不同会话中（路径不同）重复计算时也能命中；输入文件内容变化后自动失效。
+    结果中引用了本会话目录（输出文件）的只对本会话缓存，其它会话不会拿到指向别人目录的路径。
+    两级存储：内存LRU（max_memory_bytes）与 cache_dir 下的JSON文件（max_disk_bytes，按最久未用淘汰），
+    均受 ttl 限制。相同键的并发调用只执行一次。出错的结果不缓存。
+    """
+
+    def __init__(self,
+                 tools: Optional[List[str]] = None,
+                 cache_dir: Optional[str] = None,
+                 work_path: str = "/tmp",
+                 ttl: float = 86400,
+                 max_memory_bytes: int = 64 * 1024 * 1024,
+                 max_disk_bytes: int = 1024 * 1024 * 1024):
+        self.tools: Set[str] = set(tools or [])
+        self.cache_dir = cache_dir
+        self.work_path = work_path
+        self.ttl = ttl
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes: Optional[int] = None
+        self._file_hashes: Dict[Tuple[str, int, int], str] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._toolsets: Dict[int, "CachedToolset"] = {}
+        self.metrics = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "shared_inflight": 0,
+            "stores": 0,
+            "session_scoped": 0,
+            "uncacheable": 0,
+            "evictions": 0,
+        }
+
+    def configure(self,
+                  tools: Optional[List[str]] = None,
+                  work_path: Optional[str] = None,
+                  ttl: Optional[float] = None,
+                  max_memory_bytes: Optional[int] = None,
+                  max_disk_bytes: Optional[int] = None):
+        if tools is not None:
+            self.tools = set(tools)
+        if work_path is not None:
+            self.work_path = work_path
+            self.cache_dir = os.path.join(work_path, "tool_cache")
+            self._disk_bytes = None
+        if ttl is not None:
+            self.ttl = ttl
+        if max_memory_bytes is not None:
+            self.max_memory_bytes = max_memory_bytes
+        if max_disk_bytes is not None:
+            self.max_disk_bytes = max_disk_bytes
+        if self.tools:
+            print(f"✅ 工具结果缓存已启用: {sorted(self.tools)}")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tools)
+
+    def is_cacheable(self, tool_name: str) -> bool:
+        return tool_name in self.tools
+
+    def wrap(self, toolset: BaseToolset) -> BaseToolset:
+        """为toolset加上结果缓存，未配置白名单时原样返回；同一toolset只包装一次"""
+        if not self.enabled:
+            return toolset
+        with self._lock:
+            wrapped = self._toolsets.get(id(toolset))
+            if wrapped is None:
+                wrapped = self._toolsets[id(toolset)] = CachedToolset(toolset, self)
+            return wrapped
+
+    # ---- 缓存键 ----
+
+    def make_key(self, tool_name: str, args: Dict[str, Any], session_id: Optional[str] = None) -> str:
+        digest = hashlib.sha256()
+        digest.update(tool_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(canonical_json(self._normalize_args(args, session_id)).encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def session_key(key: str, session_id: str) -> str:
+        """只在单个会话内有效的缓存键"""
+        return hashlib.sha256(f"{key}\0{session_id}".encode("utf-8")).hexdigest()
+
+    def _normalize_args(self, value: Any, session_id: Optional[str]) -> Any:
+        """把参数中（递归）指向已存在普通文件的字符串替换为文件内容哈希，相对路径按会话目录解析"""
+        if isinstance(value, dict):
+            return {key: self._normalize_args(item, session_id) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._normalize_args(item, session_id) for item in value]
+        if isinstance(value, str) and value and len(value) < 4096 and "\n" not in value:
+            if os.path.isabs(value):
+                candidate = value
+            elif session_id:
+                candidate = os.path.join(self.work_path, session_id, value)
+            else:
+                return value
+            try:
+                if os.path.isfile(candidate):
+                    return {"$file_sha256": self._file_digest(os.path.realpath(candidate))}
+            except (OSError, ValueError):
+                pass
+        return value
+
+    def _references_session(self, result: Dict[str, Any], session_id: Optional[str]) -> bool:
+        """结果中是否出现会话目录的路径（工具在会话目录下生成了输出文件）"""
+        if not session_id:
+            return False
+        session_dir = os.path.join(self.work_path, session_id)
+        text = canonical_json(result)
+        return session_dir in text or os.path.realpath(session_dir) in text
+
+    def _file_digest(self, path: str) -> str:
+        """文件内容的sha256，按 (路径, 大小, mtime) 记忆，文件未变化时不重复读取"""
+        stat_result = os.stat(path)
+        memo_key = (path, stat_result.st_size, stat_result.st_mtime_ns)
+        with self._lock:
+            cached = self._file_hashes.get(memo_key)
+        if cached is not None:
+            return cached
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        value = digest.hexdigest()
+        with self._lock:
+            if len(self._file_hashes) > 4096:
+                self._file_hashes.clear()
+            self._file_hashes[memo_key] = value
+        return value
+
+    # ---- 读写 ----
+
+    async def run(self,
+                  tool_name: str,
+                  args: Dict[str, Any],
+                  call: Callable[[], Awaitable[Any]],
+                  session_id: Optional[str] = None) -> Any:
+        """命中缓存时直接返回结果，否则执行 call 并写入缓存"""
+        if not self.is_cacheable(tool_name):
+            return await call()
+        key = await asyncio.to_thread(self.make_key, tool_name, args, session_id)
+
+        cached = await self._lookup(key)
+        if cached is None and session_id:
+            cached = await self._lookup(self.session_key(key, session_id))
+        if cached is not None:
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # 相同参数的调用正在执行，等待它的结果；结果引用了其它会话目录时自己再执行一次
+            result, owner = await asyncio.shield(inflight)
+            if owner == session_id or not self._references_session(result, owner):
+                self._count("shared_inflight")
+                return result
+
+        self._count("misses")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = normalize_tool_result(await call())
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                future.exception()  # 没有其它等待者时避免未取回异常的警告
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        future.set_result((result, session_id))
+
+        if is_error_result(result):
+            self._count("uncacheable")
+            return result
+        if self._references_session(result, session_id):
+            self._count("session_scoped")
+            key = self.session_key(key, session_id)
+        self._count("stores")
+        self._put_memory(key, result)
+        await asyncio.to_thread(self._put_disk, key, tool_name, result)
+        return result
+
+    async def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        cached = self._get_memory(key)
+        if cached is not None:
+            self._count("memory_hits")
+            return cached
+        cached = await asyncio.to_thread(self._get_disk, key)
+        if cached is not None:
+            self._count("disk_hits")
+            self._put_memory(key, cached)
+        return cached
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            created_at, size, result = entry
+            if self.ttl and time.time() - created_at > self.ttl:
+                del self._memory[key]
+                self._memory_bytes -= size
+                return None
+            self._memory.move_to_end(key)
+            return result
+
+    def _put_memory(self, key: str, result: Dict[str, Any], created_at: Optional[float] = None):
+        size = len(canonical_json(result))
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= previous[1]
+            self._memory[key] = (created_at or time.time(), size, result)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes and self._memory:
+                _, (_, evicted_size, _) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+                self.metrics["evictions"] += 1
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _get_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._disk_path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取工具结果缓存失败: {e}")
+            return None
+        if self.ttl and time.time() - entry.get("created_at", 0) > self.ttl:
+            self._remove_disk(path)
+            return None
+        # 更新访问时间，磁盘淘汰按最久未用进行
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["result"]
+
+    def _put_disk(self, key: str, tool_name: str, result: Dict[str, Any]):
+        path = self._disk_path(key)
+        if path is None:
+            return
+        data = json.dumps({"tool": tool_name, "created_at": time.time(), "result": result}, ensure_ascii=False)
+        if len(data) > self.max_disk_bytes:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"写入工具结果缓存失败: {e}")
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += os.path.getsize(path) - previous
+        self._enforce_disk_limit()
+
+    def _scan_disk(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat_result = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat_result.st_mtime, stat_result.st_size, path))
+        return entries
+
+    def _enforce_disk_limit(self):
+        with self._lock:
+            disk_bytes = self._disk_bytes
+        if disk_bytes is not None and disk_bytes <= self.max_disk_bytes:
+            return
+        entries = self._scan_disk()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_disk_bytes:
+            # 淘汰到上限的90%，避免每次写入都重新扫描
+            for _, size, path in sorted(entries):
+                if total <= self.max_disk_bytes * 0.9:
+                    break
+                if self._remove_disk(path):
+                    total -= size
+                    self._count("evictions")
+        with self._lock:
+            self._disk_bytes = total
+
+    @staticmethod
+    def _remove_disk(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def clear(self):
+        """清空内存与磁盘缓存"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            for _, _, path in self._scan_disk():
+                self._remove_disk(path)
+        with self._lock:
+            self._disk_bytes = 0
+
+    def _count(self, name: str):
+        with self._lock:
+            self.metrics[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self.metrics)
+            memory_entries = len(self._memory)
+            memory_bytes = self._memory_bytes
+            disk_bytes = self._disk_bytes
+        hits = metrics["memory_hits"] + metrics["disk_hits"] + metrics["shared_inflight"]
+        lookups = hits + metrics["misses"]
+        return dict(
+            metrics,
+            tools=sorted(self.tools),
+            hit_rate=hits / lookups if lookups else 0.0,
+            memory_entries=memory_entries,
+            memory_bytes=memory_bytes,
+            disk_bytes=disk_bytes,
+        )
+
+
+class CachedTool(BaseTool):
+    """包装单个工具：执行前查询结果缓存，参数已经过 before_tool_callback（参数确认）处理"""
+
+    def __init__(self, tool: BaseTool, cache: ToolResultCache):
+        super().__init__(name=tool.name, description=tool.description, is_long_running=tool.is_long_running)
+        self._tool = tool
+        self._cache = cache
+
+    def _get_declaration(self):
+        return self._tool._get_declaration()
+
+    async def run_async(self, *, args: Dict[str, Any], tool_context: ToolContext) -> Any:
+        session_id = tool_context.agent_name[-32:] if tool_context is not None else None
+        return await self._cache.run(self._tool.name, args,
+                                     lambda: self._tool.run_async(args=args, tool_context=tool_context),
+                                     session_id=session_id)
+
+
+class CachedToolset(BaseToolset):
+    """在toolset前加一层结果缓存，只包装白名单中的工具"""
+
+    def __init__(self, toolset: BaseToolset, cache: ToolResultCache):
+        super().__init__()
+        self._toolset = toolset
+        self._cache = cache
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> List[BaseTool]:
+        tools = await self._toolset.get_tools(readonly_context)
+        return [CachedTool(tool, self._cache) if self._cache.is_cacheable(tool.name) else tool for tool in tools]
+
+    async def close(self):
+        await self._toolset.close()
+
+
+# 全局工具结果缓存（默认不启用，需配置白名单）
+tool_result_cache = ToolResultCache()
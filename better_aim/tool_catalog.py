@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from better_aim.load_mcp_tools import get_mcp_server_tools
+from better_aim.utils import hash_dict
+
+
+class _FrozenDict(dict):
+    """只读字典：可直接json序列化，任何修改都会报错"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("工具目录中的schema是只读的，请先copy()再修改")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    update = pop = popitem = clear = setdefault = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return _FrozenDict, (dict(self),)
+
+
+class _FrozenList(list):
+    """只读列表，保留list类型以兼容 isinstance(x, list) 判断"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("工具目录中的schema是只读的，请先copy()再修改")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return _FrozenList, (list(self),)
+
+
+def freeze(value: Any) -> Any:
+    """递归地把dict/list转为只读版本"""
+    if isinstance(value, dict):
+        return _FrozenDict({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return _FrozenList(freeze(v) for v in value)
+    return value
+
+
+class ToolCatalog:
+    """
+    MCP工具目录，由 get_mcp_server_tools 的结果一次性构建
+
+    - 按工具名O(1)索引
+    - 基础schema只读，可在所有会话间安全共享
+    - overlay() 为单次调用生成带 agent_input 的视图，只复制被覆盖的层级，不修改共享数据
+    """
+
+    def __init__(self, tools_info: Optional[List[Dict[str, Any]]] = None):
+        self._tools: Dict[str, _FrozenDict] = {}
+        for tool in tools_info or []:
+            self._tools[tool["name"]] = freeze(tool)
+        # schema指纹，用于判断磁盘缓存与服务器上的工具是否一致
+        self.fingerprint = hash_dict(sorted(self._tools.items()))
+
+    def get(self, tool_name: str) -> Optional[Dict[str, Any]]:
+        return self._tools.get(tool_name)
+
+    def names(self) -> List[str]:
+        return list(self._tools.keys())
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return list(self._tools.values())
+
+    def __contains__(self, tool_name: str) -> bool:
+        return tool_name in self._tools
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # 与原来的 tools_info 列表保持相同的迭代语义
+        return iter(self._tools.values())
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def overlay(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        生成本次调用的工具schema，在参数属性中插入agent_input
+
+        Args:
+            tool_name: 工具名称
+            arguments: agent给出的参数字典
+
+        Returns:
+            新的schema字典，未找到工具时返回None
+        """
+        base = self._tools.get(tool_name)
+        if base is None:
+            return None
+
+        schema = dict(base)
+        input_schema = base.get("input_schema")
+        if isinstance(input_schema, dict) and isinstance(input_schema.get("properties"), dict):
+            properties = {}
+            for prop_name, prop_value in input_schema["properties"].items():
+                if prop_name in arguments:
+                    prop_value = dict(prop_value)
+                    prop_value["agent_input"] = arguments[prop_name]
+                properties[prop_name] = prop_value
+            schema["input_schema"] = dict(input_schema, properties=properties)
+        return schema
+
+
+def get_tool_catalog_cache_path(mcp_url: str, work_path: str) -> str:
+    """获取工具目录缓存文件路径（按MCP服务器URL区分）"""
+    url_id = hashlib.sha256(mcp_url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(work_path, "tool_catalog", f"{url_id}.json")
+
+
+def load_cached_tool_catalog(mcp_url: str, work_path: str) -> Optional[ToolCatalog]:
+    """从磁盘加载工具目录缓存，文件不存在或指纹校验失败时返回None"""
+    cache_file = get_tool_catalog_cache_path(mcp_url, work_path)
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        catalog = ToolCatalog(cached["tools"])
+        if catalog.fingerprint != cached.get("fingerprint"):
+            print(f"⚠️  工具目录缓存指纹不匹配，忽略缓存: {cache_file}")
+            return None
+        return catalog
+    except Exception as e:
+        print(f"读取工具目录缓存失败: {e}")
+        return None
+
+
+def save_tool_catalog(catalog: ToolCatalog, mcp_url: str, work_path: str):
+    """原子地写入工具目录缓存（先写临时文件再重命名）"""
+    cache_file = get_tool_catalog_cache_path(mcp_url, work_path)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({
+                "mcp_url": mcp_url,
+                "fingerprint": catalog.fingerprint,
+                "saved_at": time.time(),
+                "tools": catalog.to_list()
+            }, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+    except Exception as e:
+        print(f"保存工具目录缓存失败: {e}")
+
+
+async def fetch_tool_catalog(mcp_url: str, work_path: str) -> ToolCatalog:
+    """从MCP服务器拉取工具目录，schema有变化时更新磁盘缓存"""
+    catalog = ToolCatalog(await get_mcp_server_tools(mcp_url))
+    cached = load_cached_tool_catalog(mcp_url, work_path)
+    if cached is None or cached.fingerprint != catalog.fingerprint:
+        save_tool_catalog(catalog, mcp_url, work_path)
+    return catalog
+
+
+def refresh_tool_catalog_in_background(mcp_url: str,
+                                       work_path: str,
+                                       on_update: Callable[[ToolCatalog], Any],
+                                       retry_max: float = 300) -> threading.Thread:
+    """
+    在后台线程中刷新工具目录，MCP服务器不可用时按指数退避重试直到成功
+
+    Args:
+        mcp_url: MCP服务器URL
+        work_path: 工作路径（缓存存放位置）
+        on_update: 拉取成功后的回调，用于热替换全局工具目录
+        retry_max: 重试间隔上限（秒）
+    """
+    def run():
+        delay = 1
+        while True:
+            try:
+                catalog = asyncio.run(fetch_tool_catalog(mcp_url, work_path))
+                on_update(catalog)
+                print(f"✅ 后台刷新工具目录完成，共 {len(catalog)} 个MCP工具")
+                return
+            except Exception as e:
+                print(f"⚠️  后台刷新工具目录失败: {e}，{delay}秒后重试")
+                time.sleep(delay)
+                delay = min(retry_max, delay * 2)
+
+    thread = threading.Thread(target=run, name="tool-catalog-refresh", daemon=True)
+    thread.start()
+    return thread
+
+
+def load_tool_catalog(mcp_url: str, work_path: str, on_update: Callable[[ToolCatalog], Any]) -> ToolCatalog:
+    """
+    启动时加载工具目录：优先使用磁盘缓存并在后台与MCP服务器同步；
+    无缓存时同步拉取，失败则返回空目录并在后台重试。后台拉取成功后通过 on_update 热替换
+    """
+    cached = load_cached_tool_catalog(mcp_url, work_path)
+    if cached is not None:
+        print(f"✅ 从缓存加载 {len(cached)} 个MCP工具，后台刷新中")
+        refresh_tool_catalog_in_background(mcp_url, work_path, on_update=on_update)
+        return cached
+    try:
+        catalog = asyncio.run(fetch_tool_catalog(mcp_url, work_path))
+        print(f"✅ 成功加载 {len(catalog)} 个MCP工具")
+        return catalog
+    except Exception as e:
+        print(f"⚠️  加载MCP工具失败: {e}，将在后台重试")
+        refresh_tool_catalog_in_background(mcp_url, work_path, on_update=on_update)
+        return ToolCatalog()
@@ -1,38 +1,133 @@
-import asyncio
+import time
+import uuid
+from contextlib import contextmanager
 
 from google.adk.tools.base_tool import BaseTool
 from google.adk.tools.tool_context import ToolContext
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, List, Tuple, Union
+
+from better_aim.approval_policy import approval_policy
+from better_aim.interceptions import interceptions
+from better_aim.metrics import errors_total, tool_call_seconds
+from better_aim.parallel_tools import parallel_tools
+from better_aim.tool_cache import is_error_result
+from better_aim.tool_catalog import ToolCatalog
+from better_aim.tracing import tracer
+
+# function call ID -> (工具开始执行的时间, 对应的span, 会话ID)，用于统计工具耗时
+_tool_started: Dict[str, Tuple[float, Any, str]] = {}
 
 
 async def tool_modify_guardrail(
         tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext
 ) -> Optional[Dict]:
-    from better_aim.main import unmodified_schema_store, pending_events, modified_args_store, target_tools, tools_info
-    global unmodified_schema_store
+    # 已由并发调度提前确认并执行的调用，直接返回其结果作为工具响应
+    prefetched = parallel_tools.claim(tool_context.agent_name[-32:], tool_context.function_call_id)
+    if prefetched is not None:
+        print(f"--- Callback: Tool '{tool.name}' was dispatched in parallel. Waiting for its result. ---")
+        return await prefetched
+    rejected = await approve_tool_call(tool, args, tool_context)
+    if rejected is None and tool_context.function_call_id:
+        session_id = tool_context.agent_name[-32:]
+        span = tracer.span(session_id, "tool.call", tool=tool.name, call_id=tool_context.function_call_id)
+        _tool_started[tool_context.function_call_id] = (time.perf_counter(), span, session_id)
+    return rejected
+
+
+async def record_tool_latency(
+        tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, tool_response: Any
+) -> Optional[Dict]:
+    """
+    after_tool_callback：记录工具执行耗时与出错次数，不修改工具结果
+
+    并发执行的调用取回结果后也会经过这里（耗时已在 parallel_tools 中记录），工具出错只在此处计数。
+    """
+    started = _tool_started.pop(tool_context.function_call_id, None)
+    if isinstance(tool_response, dict):
+        is_error = is_error_result(tool_response)
+    else:
+        is_error = bool(getattr(tool_response, "isError", False))
+    if started is not None:
+        tool_call_seconds.observe(time.perf_counter() - started[0], tool=tool.name)
+        started[1].end(error="tool returned isError" if is_error else None)
+    if is_error:
+        errors_total.inc(source="tool")
+    return None
+
+
+def end_tool_calls(session_id: str):
+    """
+    一轮结束时清理会话中未完成的工具调用
+
+    工具抛出异常或本轮被取消时ADK不会调用 after_tool_callback，这些调用的span在此以出错结束；
+    并发调度中提前启动但未被取走的任务一并取消。
+    """
+    cancelled = parallel_tools.cancel_unclaimed(session_id)
+    if cancelled:
+        print(f"--- 本轮已结束，取消 {cancelled} 个未被取走的并发工具调用 ---")
+    for call_id in [call_id for call_id, started in _tool_started.items() if started[2] == session_id]:
+        _, span, _ = _tool_started.pop(call_id)
+        span.end(error="tool call did not complete")
+
+
+@contextmanager
+def tool_calls_turn(session_id: str) -> Iterator[None]:
+    try:
+        yield
+    finally:
+        end_tool_calls(session_id)
+
+
+async def approve_tool_call(
+        tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext
+) -> Optional[Dict]:
+    """参数确认：返回None表示按（可能被修改的）args执行，返回字典表示取消调用并以其作为工具结果"""
+    with tracer.span(tool_context.agent_name[-32:], "tool.guardrail",
+                     tool=tool.name, call_id=tool_context.function_call_id) as span:
+        rejected = await _approve_tool_call(tool, args, tool_context, span)
+        span.set_attribute("outcome", "allowed" if rejected is None else "rejected")
+        return rejected
+
+
+async def _approve_tool_call(
+        tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, span
+) -> Optional[Dict]:
     tool_name = tool.name
     agent_name = tool_context.agent_name # Agent attempting the tool call
     print(f"--- Callback: tool_modify_guardrail running for tool '{tool_name}' in agent '{agent_name}' ---")
     print(f"--- Callback: Inspecting args: {args} ---")
 
     session_id = agent_name[-32:]
-    print(target_tools)
 
-    if tool_name in target_tools:
+    decision = None
+    if interceptions.should_intercept(tool_name):
+        decision = approval_policy.evaluate(session_id, tool_name, args)
+        span.set_attribute("decision", decision.reason)
+
+    if decision is not None and decision.approved:
+        print(f"--- Callback: Tool '{tool_name}' auto-approved by policy ({decision.reason} {decision.rule or ''}). ---")
+        approval_policy.record_approved(session_id, tool_name, args)
+    elif decision is not None:
+        # 同一轮中的并行调用按 function call ID 区分，各自等待确认
+        call_id = tool_context.function_call_id or f"{tool_name}-{uuid.uuid4().hex[:8]}"
         schema = zip_tool_schema(tool_name=tool_name,
                                  arguments=args,
-                                 tools_dict=tools_info)
-
-        unmodified_schema_store[session_id] = schema
-
-        pending_events[session_id] = asyncio.Event()
-        print("--- Callback: Wait for the user to click the button to continue execution... ---")
-        await pending_events[session_id].wait()  # ⏸ pause until clicked
-        print("--- Callback: The user has clicked the button and continues to execute. ---")
-
-        unmodified_schema_store[session_id] = ""
-        for k, v in modified_args_store[session_id].items():
+                                 tools_dict=interceptions.tool_catalog or [])
+        schema = dict(schema or {}, call_id=call_id)
+
+        print(f"--- Callback: Wait for the user to confirm call {call_id}... ---")
+        modified_args = await interceptions.request(session_id, call_id, tool_name, schema, args)
+        if modified_args is None:
+            print(f"--- Callback: Tool '{tool_name}' ({call_id}) was rejected. Skipping. ---")
+            approval_policy.record_rejected(tool_name)
+            # 返回字典即跳过工具执行，并作为工具结果交给模型
+            return {
+                "status": "rejected",
+                "message": f"用户未确认工具 '{tool_name}' 的运行参数（已拒绝或等待超时），本次调用已取消"
+            }
+        for k, v in modified_args.items():
             args[k] = v
+        approval_policy.record_approved(session_id, tool_name, args, by_user=True)
 
         print(f"--- Callback: Tool '{tool_name}' Running with modified args: {args}. ---")
     else:
@@ -43,62 +138,46 @@ async def tool_modify_guardrail(
     print(f"--- Callback: Allowing tool '{tool_name}' to proceed. ---")
     return None # Returning None allows the actual tool function to run
 
-def zip_tool_schema(tool_name, arguments, tools_dict):
+def zip_tool_schema(tool_name: str,
+                    arguments: Dict[str, Any],
+                    tools_dict: Union[ToolCatalog, List[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
     """
     根据工具名称和参数准备工具模式
 
     Args:
         tool_name: 工具名称
         arguments: 参数字典
-        tools_dict: 工具字典列表
+        tools_dict: 工具目录（ToolCatalog），也兼容旧的工具字典列表
 
     Returns:
         包含agent_input的更新后的工具模式字典，如果未找到工具则返回None
     """
-    # 在工具字典中查找匹配的工具
-    tool_info = None
-    for tool in tools_dict:
-        if tool.get('name') == tool_name:
-            tool_info = tool.copy()  # 创建副本以避免修改原始数据
-            break
-
-    if tool_info is None:
-        return None
-
-    # 如果有input_schema且包含properties，则插入agent_input字段
-    if 'input_schema' in tool_info and 'properties' in tool_info['input_schema']:
-        properties = tool_info['input_schema']['properties']
-
-        for prop_name, prop_value in properties.items():
-            if prop_name in arguments:
-                # 在属性字典中插入agent_input，保持原有结构
-                prop_value = prop_value.copy()  # 创建属性副本
-                prop_value['agent_input'] = arguments[prop_name]
-                properties[prop_name] = prop_value
-
-    return tool_info
-
-def collect_inputs(schema, _session_id, *values):
-    from better_aim.main import pending_events, modified_args_store, modified_schema_store
-    if _session_id not in modified_schema_store.keys():
-        modified_schema_store[_session_id] = ""
-    if len(schema['input_schema']['properties']) == len(values):
-        # 根据用户输入生成输出字典，结构与输入类似，并新增 'user_input'
-        output = {
-            'name': schema['name'],
-            'description': schema['description'],
-            'input_schema': {'properties': {}},
-            'parameters': schema.get('parameters', {})
-        }
-        for (key, prop), val in zip(schema['input_schema']['properties'].items(), values):
-            new_prop = prop.copy()
-            new_prop['user_input'] = val
-            output['input_schema']['properties'][key] = new_prop
-
-        modified_schema_store[_session_id] = output
-        modified_args_store[_session_id] = extract_arguments_from_schema(output)
-        pending_events[_session_id].set()
-    return modified_schema_store[_session_id]
+    if not isinstance(tools_dict, ToolCatalog):
+        tools_dict = ToolCatalog(tools_dict)
+    # 只生成本次调用的覆盖视图，共享的工具目录不会被修改
+    return tools_dict.overlay(tool_name, arguments)
+
+def collect_inputs(schema, _session_id, *values, trust=False):
+    if len(schema['input_schema']['properties']) != len(values):
+        return schema
+    # 根据用户输入生成输出字典，结构与输入类似，并新增 'user_input'
+    output = {
+        'name': schema['name'],
+        'description': schema['description'],
+        'input_schema': {'properties': {}},
+        'parameters': schema.get('parameters', {}),
+        'call_id': schema.get('call_id')
+    }
+    for (key, prop), val in zip(schema['input_schema']['properties'].items(), values):
+        new_prop = prop.copy()
+        new_prop['user_input'] = val
+        output['input_schema']['properties'][key] = new_prop
+
+    if trust:
+        # 本会话内信任该工具，之后的调用不再弹出确认
+        approval_policy.trust(_session_id, output['name'])
+    interceptions.resolve(_session_id, output['call_id'], extract_arguments_from_schema(output))
+    return output
 
 def extract_arguments_from_schema(tool_schema):
     """
@@ -0,0 +1,249 @@
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
+
+class _NoopSpan:
+    """未开启追踪或本轮未被采样时使用的空span，所有操作均无开销"""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def end(self, error: Union[BaseException, str, None] = None, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """一段计时区间，end 之后写入导出器；end 可重复调用，只有第一次生效"""
+
+    __slots__ = ("tracer", "trace_id", "span_id", "parent_span_id", "name", "session_id",
+                 "start_time_ns", "attributes", "ended")
+
+    def __init__(self, tracer: "Tracer", trace_id: str, parent_span_id: Optional[str], name: str,
+                 session_id: str, attributes: Dict[str, Any], start_time_ns: Optional[int] = None):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.session_id = session_id
+        self.start_time_ns = start_time_ns or time.time_ns()
+        self.attributes = attributes
+        self.ended = False
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self, error: Union[BaseException, str, None] = None, **attributes):
+        if self.ended:
+            return
+        self.ended = True
+        self.attributes.update(attributes)
+        end_time_ns = time.time_ns()
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_time_ns,
+            "end_time_unix_nano": end_time_ns,
+            "duration_ms": round((end_time_ns - self.start_time_ns) / 1e6, 3),
+            "status": "ok" if error is None else "error",
+            "attributes": self.attributes,
+        }
+        if error is not None:
+            record["error"] = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+        self.tracer._finish(self, record)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and not isinstance(exc, Exception):
+            # 任务取消或生成器被提前关闭，不算作错误
+            self.end(cancelled=True)
+        else:
+            self.end(error=exc)
+        return False
+
+
+class RotatingJsonlExporter:
+    """
+    在后台线程中把span按行写入JSONL文件，事件循环只负责入队
+
+    文件超过 max_bytes 时轮转为 .1 … .backups（与 logging.RotatingFileHandler 相同），
+    每行一个span，字段沿用OTLP的命名，可直接用jq等工具离线查看整轮的调用链。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.written = 0
+        self.rotations = 0
+        self.write_errors = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, record: Dict[str, Any]):
+        self._queue.put(record)
+
+    def close(self, timeout: float = 5):
+        """写完已入队的span后停止后台线程"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _run(self):
+        f = open(self.path, "a", encoding="utf-8")
+        size = f.tell()
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            # 一次取完积压的span，合并为一次写入
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [record for record in batch if record is not None]
+            if not batch:
+                continue
+            try:
+                data = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in batch)
+                data_bytes = len(data.encode("utf-8"))
+                if size and size + data_bytes > self.max_bytes:
+                    f.close()
+                    self._rotate()
+                    f = open(self.path, "a", encoding="utf-8")
+                    size = 0
+                f.write(data)
+                f.flush()
+                size += data_bytes
+                self.written += len(batch)
+            except Exception as e:
+                self.write_errors += 1
+                print(f"写入追踪文件失败: {e}")
+        f.close()
+
+    def _rotate(self):
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                source = f"{self.path}.{i}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+
+
+class Tracer:
+    """
+    按会话记录每轮对话的span
+
+    每轮对话由 start_turn 开启一个根span，并在此时按 sample_rate 决定是否采样；
+    同一会话内的LLM请求、工具调用、参数确认、历史写入与WebSocket发送通过 span(session_id, ...) 挂到当前轮下。
+    会话的各个环节本来就带有会话ID，按会话关联比依赖contextvars更可靠（gradio的生成器可能在不同上下文中迭代）。
+    未开启或未被采样时 span 返回共享的空span，只有一次字典查询的开销。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 1.0
+        self.exporter: Optional[RotatingJsonlExporter] = None
+        self._turns: Dict[str, Span] = {}
+        self.metrics = {
+            "turns": 0,
+            "sampled_turns": 0,
+            "spans": 0,
+        }
+
+    def configure(self,
+                  path: Optional[str] = None,
+                  sample_rate: float = 1.0,
+                  max_bytes: int = 64 * 1024 * 1024,
+                  backups: int = 5):
+        """path为空或采样率为0时关闭追踪"""
+        self.close()
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.enabled = bool(path) and self.sample_rate > 0
+        if self.enabled:
+            self.exporter = RotatingJsonlExporter(path, max_bytes=max_bytes, backups=backups)
+            print(f"✅ 追踪已开启，采样率 {self.sample_rate:g}，写入 {path}")
+
+    def start_turn(self, session_id: str, name: str = "turn", **attributes) -> Union[Span, _NoopSpan]:
+        """开始一轮对话的根span，未被采样时返回空span（本轮内的其它span也都不会记录）"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        self.metrics["turns"] += 1
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return _NOOP_SPAN
+        self.metrics["sampled_turns"] += 1
+        span = Span(self, "%032x" % random.getrandbits(128), None, name, session_id,
+                    dict(attributes, session_id=session_id))
+        self._turns[session_id] = span
+        return span
+
+    def span(self, session_id: Optional[str], name: str, start_time_ns: Optional[int] = None,
+             **attributes) -> Union[Span, _NoopSpan]:
+        """在会话当前轮下开始一个子span；start_time_ns 用于补记已经开始的区间"""
+        turn = self._turns.get(session_id) if self._turns else None
+        if turn is None:
+            return _NOOP_SPAN
+        return Span(self, turn.trace_id, turn.span_id, name, session_id, attributes, start_time_ns)
+
+    def _finish(self, span: Span, record: Dict[str, Any]):
+        if span.parent_span_id is None and self._turns.get(span.session_id) is span:
+            del self._turns[span.session_id]
+        exporter = self.exporter
+        if exporter is not None:
+            self.metrics["spans"] += 1
+            exporter.export(record)
+
+    def discard(self, session_id: str):
+        """会话被回收时丢弃其未结束的轮次"""
+        self._turns.pop(session_id, None)
+
+    def close(self):
+        self._turns.clear()
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+        self.enabled = False
+
+    def stats(self) -> Dict[str, Any]:
+        exporter = self.exporter
+        return dict(
+            self.metrics,
+            enabled=self.enabled,
+            sample_rate=self.sample_rate,
+            active_turns=len(self._turns),
+            path=exporter.path if exporter else None,
+            written_spans=exporter.written if exporter else 0,
+            rotations=exporter.rotations if exporter else 0,
+            write_errors=exporter.write_errors if exporter else 0,
+        )
+
+
+# 全局追踪器
+tracer = Tracer()
+atexit.register(tracer.close)
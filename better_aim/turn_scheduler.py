@@ -0,0 +1,105 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+
+class SessionBusyError(Exception):
+    """会话的排队轮次已满"""
+
+
+PositionCallback = Callable[[int], Awaitable[Any]]
+
+
+class _SessionQueue:
+    def __init__(self):
+        self.active = False
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.callbacks: Dict[asyncio.Future, Optional[PositionCallback]] = {}
+
+
+class TurnScheduler:
+    """
+    按会话的对话轮次调度器
+
+    同一会话同一时刻只运行一轮对话（避免多个标签页或WebSocket/HTTP并发调用同一个ADK会话导致事件交错），
+    其余轮次按到达顺序排队，最多排队 max_pending 轮，超出时抛出 SessionBusyError。
+    排队位置变化时通过回调通知客户端（位置从1开始）。
+    """
+
+    def __init__(self, max_pending: int = 2):
+        self.max_pending = max_pending
+        self._sessions: Dict[str, _SessionQueue] = {}
+        self.rejected = 0
+
+    def is_full(self, session_id: str) -> bool:
+        queue = self._sessions.get(session_id)
+        return queue is not None and queue.active and len(queue.waiters) >= self.max_pending
+
+    @asynccontextmanager
+    async def turn(self, session_id: str, on_position: Optional[PositionCallback] = None):
+        """获取会话的执行权，退出上下文时交给下一个排队的轮次"""
+        await self._acquire(session_id, on_position)
+        try:
+            yield
+        finally:
+            self._release(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_turns": sum(1 for queue in self._sessions.values() if queue.active),
+            "queued_turns": sum(len(queue.waiters) for queue in self._sessions.values()),
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+        }
+
+    async def _acquire(self, session_id: str, on_position: Optional[PositionCallback]):
+        queue = self._sessions.setdefault(session_id, _SessionQueue())
+        if not queue.active:
+            queue.active = True
+            return
+        if len(queue.waiters) >= self.max_pending:
+            self.rejected += 1
+            raise SessionBusyError(f"会话正在处理消息，排队已满（最多{self.max_pending}条）")
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.waiters.append(waiter)
+        queue.callbacks[waiter] = on_position
+        self._notify(on_position, len(queue.waiters))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in queue.waiters:
+                queue.waiters.remove(waiter)
+                queue.callbacks.pop(waiter, None)
+                self._notify_positions(queue)
+            elif waiter.done() and not waiter.cancelled():
+                # 已被交接执行权但调用方取消了，继续交给下一个
+                self._release(session_id)
+            raise
+
+    def _release(self, session_id: str):
+        queue = self._sessions.get(session_id)
+        if queue is None:
+            return
+        while queue.waiters:
+            waiter = queue.waiters.popleft()
+            queue.callbacks.pop(waiter, None)
+            if not waiter.done():
+                # 直接交接执行权，active保持为True
+                waiter.set_result(None)
+                self._notify_positions(queue)
+                return
+        queue.active = False
+        del self._sessions[session_id]
+
+    def _notify_positions(self, queue: _SessionQueue):
+        for position, waiter in enumerate(queue.waiters, 1):
+            self._notify(queue.callbacks.get(waiter), position)
+
+    @staticmethod
+    def _notify(callback: Optional[PositionCallback], position: int):
+        if callback is None:
+            return
+        task = asyncio.ensure_future(callback(position))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
@@ -0,0 +1,299 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """上传失败，status_code 为建议返回给客户端的HTTP状态码"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadTooLargeError(UploadError):
+    def __init__(self, limit: int):
+        super().__init__(f"文件超过大小限制 ({limit // (1024 * 1024)}MB)", status_code=413)
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """只保留文件名部分，防止通过路径跳出会话目录"""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if name in ("", ".", ".."):
+        raise UploadError("文件名无效")
+    return name
+
+
+def _open_temp(dest_path: str):
+    # 临时文件与目标在同一目录，保证 os.replace 是原子的
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path),
+                                    prefix=f".{os.path.basename(dest_path)}.", suffix=".part")
+    return os.fdopen(fd, "wb"), tmp_path
+
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def save_upload_stream(chunks: AsyncIterator[bytes], dest_path: str, max_bytes: int) -> int:
+    """
+    分块写入临时文件，完成后原子重命名到 dest_path，返回写入的字节数
+
+    超过 max_bytes 时立即中止并删除临时文件（抛出 UploadTooLargeError），磁盘写入在线程池中执行，不阻塞事件循环。
+    """
+    f, tmp_path = await asyncio.to_thread(_open_temp, dest_path)
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise UploadTooLargeError(max_bytes)
+            await asyncio.to_thread(f.write, chunk)
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.replace, tmp_path, dest_path)
+        return size
+    except BaseException:
+        f.close()
+        await asyncio.to_thread(_discard, tmp_path)
+        raise
+
+
+async def iter_upload_file(upload, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """按块读取 fastapi.UploadFile"""
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def copy_file_atomic(src_path: str, dest_path: str, max_bytes: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """同步版本：分块复制文件并原子替换目标，超过 max_bytes 时抛出 UploadTooLargeError"""
+    if max_bytes and os.path.getsize(src_path) > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+    f, tmp_path = _open_temp(dest_path)
+    try:
+        with f, open(src_path, "rb") as src:
+            shutil.copyfileobj(src, f, chunk_size)
+        os.replace(tmp_path, dest_path)
+        return os.path.getsize(dest_path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+
+
+class ChunkedUploadManager:
+    """
+    可续传的分块上传
+
+    每个上传在会话目录下的 .uploads/ 中保存一个 .part 数据文件与一个 .json 元数据文件。
+    已接收的偏移量即 .part 文件的实际大小，因此服务重启后也能从断点继续；
+    客户端每次从当前偏移量追加一块，全部收到后 complete 把文件原子移动到会话目录。
+    超过 ttl 秒未更新的未完成上传会被清理。
+    """
+
+    def __init__(self, max_bytes: int = 4 * 1024 ** 3, max_chunk_bytes: int = 8 * 1024 * 1024,
+                 ttl: float = 24 * 3600):
+        self.max_bytes = max_bytes
+        self.max_chunk_bytes = max_chunk_bytes
+        self.ttl = ttl
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def configure(self, max_bytes: Optional[int] = None, max_chunk_bytes: Optional[int] = None):
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if max_chunk_bytes is not None:
+            self.max_chunk_bytes = max_chunk_bytes
+
+    @staticmethod
+    def _upload_dir(session_dir: str) -> str:
+        return os.path.join(session_dir, ".uploads")
+
+    def _paths(self, session_dir: str, upload_id: str):
+        try:
+            uuid.UUID(hex=upload_id)
+        except ValueError:
+            raise UploadError("上传ID无效", status_code=404)
+        base = os.path.join(self._upload_dir(session_dir), upload_id)
+        return base + ".part", base + ".json"
+
+    def _load_meta(self, session_dir: str, upload_id: str) -> Dict[str, Any]:
+        part_path, meta_path = self._paths(session_dir, upload_id)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise UploadError("上传不存在或已过期", status_code=404)
+        meta["offset"] = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        return meta
+
+    async def create(self, session_dir: str, filename: str, size: int) -> Dict[str, Any]:
+        """登记一个新上传，返回 upload_id 与建议的分块大小"""
+        filename = safe_filename(filename)
+        if size < 0:
+            raise UploadError("文件大小无效")
+        if self.max_bytes and size > self.max_bytes:
+            raise UploadTooLargeError(self.max_bytes)
+        await asyncio.to_thread(self.cleanup, session_dir)
+
+        upload_id = uuid.uuid4().hex
+        await asyncio.to_thread(self._create_files, session_dir, upload_id,
+                                {"upload_id": upload_id, "filename": filename, "size": size})
+        return {"upload_id": upload_id, "filename": filename, "size": size, "offset": 0,
+                "chunk_size": self.max_chunk_bytes}
+
+    def _create_files(self, session_dir: str, upload_id: str, meta: Dict[str, Any]):
+        os.makedirs(self._upload_dir(session_dir), exist_ok=True)
+        part_path, meta_path = self._paths(session_dir, upload_id)
+        open(part_path, "wb").close()
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    async def status(self, session_dir: str, upload_id: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._load_meta, session_dir, upload_id)
+
+    async def append(self, session_dir: str, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """从 offset 处追加一块数据；offset 必须等于已接收的字节数，否则返回409并附带当前偏移量"""
+        async with self._locks.setdefault(upload_id, asyncio.Lock()):
+            meta = await asyncio.to_thread(self._load_meta, session_dir, upload_id)
+            if offset != meta["offset"]:
+                raise UploadError(f"偏移量不匹配，当前已接收 {meta['offset']} 字节", status_code=409)
+
+            part_path, _ = self._paths(session_dir, upload_id)
+            received = 0
+            f = await asyncio.to_thread(open, part_path, "ab")
+            try:
+                async for chunk in chunks:
+                    received += len(chunk)
+                    if received > self.max_chunk_bytes:
+                        raise UploadError(f"分块超过大小限制 ({self.max_chunk_bytes} 字节)", status_code=413)
+                    if offset + received > meta["size"]:
+                        raise UploadError(f"数据超过登记的文件大小 ({meta['size']} 字节)", status_code=413)
+                    await asyncio.to_thread(f.write, chunk)
+            except BaseException:
+                # 丢弃本块已写入的部分，客户端可从原偏移量重试
+                await asyncio.to_thread(f.truncate, offset)
+                raise
+            finally:
+                await asyncio.to_thread(f.close)
+            meta["offset"] = offset + received
+            return meta
+
+    async def complete(self, session_dir: str, upload_id: str) -> Dict[str, Any]:
+        """全部数据到齐后把文件原子移动到会话目录"""
+        async with self._locks.setdefault(upload_id, asyncio.Lock()):
+            meta = await asyncio.to_thread(self._load_meta, session_dir, upload_id)
+            if meta["offset"] != meta["size"]:
+                raise UploadError(f"上传未完成，已接收 {meta['offset']}/{meta['size']} 字节", status_code=409)
+            part_path, meta_path = self._paths(session_dir, upload_id)
+            dest_path = os.path.join(session_dir, meta["filename"])
+            await asyncio.to_thread(os.replace, part_path, dest_path)
+            await asyncio.to_thread(_discard, meta_path)
+        self._locks.pop(upload_id, None)
+        return {"name": meta["filename"], "path": dest_path, "size": meta["size"]}
+
+    async def abort(self, session_dir: str, upload_id: str):
+        for path in self._paths(session_dir, upload_id):
+            await asyncio.to_thread(_discard, path)
+        self._locks.pop(upload_id, None)
+
+    def cleanup(self, session_dir: str) -> int:
+        """删除过期的未完成上传，返回删除的数量（同步执行，create 在线程池中调用）"""
+        upload_dir = self._upload_dir(session_dir)
+        if not os.path.isdir(upload_dir):
+            return 0
+        removed = 0
+        deadline = time.time() - self.ttl
+        for entry in os.scandir(upload_dir):
+            if entry.name.endswith(".json") and entry.stat().st_mtime < deadline:
+                upload_id = entry.name[:-len(".json")]
+                part_path = os.path.join(upload_dir, upload_id + ".part")
+                if os.path.exists(part_path) and os.path.getmtime(part_path) >= deadline:
+                    continue
+                _discard(part_path)
+                _discard(entry.path)
+                removed += 1
+        return removed
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI中间件：限制普通上传的请求体大小
+
+    先按 Content-Length 拒绝明显超限的请求；分块传输编码的请求没有 Content-Length，
+    所以在读取请求体的同时累计字节数，超限后立即停止接收并返回413，不会把整个请求体缓存到临时文件。
+    max_bytes 为返回当前上限的函数，overhead 预留给multipart分隔符与表单头。
+    """
+
+    def __init__(self, app, max_bytes: Callable[[], int], path_prefix: str = "/api/upload/",
+                 overhead: int = 64 * 1024):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_prefix = path_prefix
+        self.overhead = overhead
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = self.max_bytes()
+        if (scope["type"] != "http" or scope["method"] != "POST" or not max_bytes
+                or not scope["path"].startswith(self.path_prefix)):
+            await self.app(scope, receive, send)
+            return
+
+        limit = max_bytes + self.overhead
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                await self._reject(send, max_bytes)
+                return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise UploadTooLargeError(max_bytes)
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            # 超限后框架可能把中断的解析包装成其他错误响应，丢弃它并统一返回413
+            if exceeded and not started:
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded or started:
+                raise
+        if exceeded and not started:
+            await self._reject(send, max_bytes)
+
+    @staticmethod
+    async def _reject(send, max_bytes: int):
+        body = json.dumps({"detail": f"{UploadTooLargeError(max_bytes)}，请使用分块上传"},
+                          ensure_ascii=False).encode("utf-8")
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+# 全局分块上传管理器
+chunked_uploads = ChunkedUploadManager()
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from better_aim.notifications import SessionNotifier
+
+# token用量事件通道：usage
+usage_notifier = SessionNotifier()
+
+
+class TokenUsage:
+    """一组模型调用的token计数，cached 为 prompt 中命中缓存的部分"""
+
+    __slots__ = ("prompt", "completion", "cached", "calls")
+
+    def __init__(self, prompt: int = 0, completion: int = 0, cached: int = 0, calls: int = 0):
+        self.prompt = prompt
+        self.completion = completion
+        self.cached = cached
+        self.calls = calls
+
+    @property
+    def total(self) -> int:
+        return self.prompt + self.completion
+
+    def add(self, prompt: int = 0, completion: int = 0, cached: int = 0, calls: int = 1):
+        self.prompt += prompt
+        self.completion += completion
+        self.cached += cached
+        self.calls += calls
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "prompt_tokens": self.prompt,
+            "completion_tokens": self.completion,
+            "cached_tokens": self.cached,
+            "total_tokens": self.total,
+            "calls": self.calls,
+        }
+
+
+class UsageTracker:
+    """
+    按单次调用、轮次、会话与全局汇总LLM的token用量
+
+    每次模型调用结束后由 AdmittedLiteLlm 调用 record，并通过 usage_notifier 推送给客户端；
+    每轮结束时把本轮用量追加到 work_path/chat_history/<session_id>.usage.jsonl，
+    会话累计用量在首次访问时从该文件恢复，因此重启或会话被回收后预算仍然有效（清空聊天记录不会重置用量）。
+    session_budget 为每个会话的总token上限（prompt + completion），0表示不限制；
+    达到上限后新的模型调用在发出之前即被拒绝。
+    """
+
+    def __init__(self, session_budget: int = 0, notifier: Optional[SessionNotifier] = None):
+        self.session_budget = session_budget
+        self.notifier = notifier or usage_notifier
+        self.usage_path: Optional[str] = None
+        self.total = TokenUsage()
+        self.rejected_calls = 0
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, TokenUsage] = {}
+        self._turns: Dict[str, TokenUsage] = {}
+
+    def configure(self, session_budget: Optional[int] = None, work_path: Optional[str] = None):
+        if session_budget is not None:
+            self.session_budget = max(0, session_budget)
+        if work_path is not None:
+            self.usage_path = os.path.join(work_path, "chat_history")
+            with self._lock:
+                self._sessions.clear()
+
+    def start_turn(self, session_id: str):
+        with self._lock:
+            self._turns[session_id] = TokenUsage()
+
+    def end_turn(self, session_id: str) -> Optional[Dict[str, int]]:
+        """结束一轮并持久化本轮用量，返回本轮用量（没有模型调用时返回None）"""
+        with self._lock:
+            turn = self._turns.pop(session_id, None)
+        if turn is None or not turn.calls:
+            return None
+        record = dict(turn.to_dict(), ts=time.time())
+        if self.usage_path is not None:
+            try:
+                os.makedirs(self.usage_path, exist_ok=True)
+                with open(self._file_path(session_id), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                print(f"保存token用量失败: {e}")
+        self.notifier.publish(session_id, dict(self.usage(session_id), type="usage", turn=turn.to_dict(),
+                                               turn_complete=True))
+        return turn.to_dict()
+
+    @contextmanager
+    def turn(self, session_id: str) -> Iterator[None]:
+        self.start_turn(session_id)
+        try:
+            yield
+        finally:
+            self.end_turn(session_id)
+
+    def record(self, session_id: str, prompt: int, completion: int, cached: int = 0):
+        """记录一次模型调用的用量并推送给客户端"""
+        session = self._session(session_id)
+        with self._lock:
+            session.add(prompt, completion, cached)
+            self.total.add(prompt, completion, cached)
+            turn = self._turns.get(session_id)
+            if turn is not None:
+                turn.add(prompt, completion, cached)
+        self.notifier.publish(session_id, dict(
+            self.usage(session_id),
+            type="usage",
+            call=TokenUsage(prompt, completion, cached, 1).to_dict(),
+        ))
+
+    def check_budget(self, session_id: str) -> Optional[str]:
+        """模型调用前检查会话预算，超出时返回提示信息，否则返回None"""
+        if not self.session_budget:
+            return None
+        used = self._session(session_id).total
+        if used < self.session_budget:
+            return None
+        with self._lock:
+            self.rejected_calls += 1
+        self.notifier.publish(session_id, dict(self.usage(session_id), type="usage", budget_exceeded=True))
+        return f"本会话的token用量（{used}）已达到预算上限（{self.session_budget}），已停止调用模型"
+
+    def usage(self, session_id: str) -> Dict[str, Any]:
+        session = self._session(session_id)
+        with self._lock:
+            turn = self._turns.get(session_id)
+            session_usage = session.to_dict()
+            turn_usage = turn.to_dict() if turn is not None else None
+        budget = self.session_budget or None
+        return {
+            "session_id": session_id,
+            "session": session_usage,
+            "turn": turn_usage,
+            "budget": budget,
+            "remaining": max(0, budget - session_usage["total_tokens"]) if budget else None,
+        }
+
+    def discard(self, session_id: str):
+        """丢弃会话在内存中的用量（会话被回收时调用，之后从文件恢复）"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._turns.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                self.total.to_dict(),
+                session_budget=self.session_budget,
+                rejected_calls=self.rejected_calls,
+                tracked_sessions=len(self._sessions),
+            )
+
+    def _file_path(self, session_id: str) -> str:
+        return os.path.join(self.usage_path, f"{session_id}.usage.jsonl")
+
+    def _session(self, session_id: str) -> TokenUsage:
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is not None:
+            return session
+        session = self._load(session_id)
+        with self._lock:
+            # 加载期间可能已被其它调用创建
+            return self._sessions.setdefault(session_id, session)
+
+    def _load(self, session_id: str) -> TokenUsage:
+        usage = TokenUsage()
+        if self.usage_path is None:
+            return usage
+        try:
+            with open(self._file_path(session_id), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 写入中断留下的残行
+                    usage.add(record.get("prompt_tokens", 0), record.get("completion_tokens", 0),
+                              record.get("cached_tokens", 0), record.get("calls", 0))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"读取token用量失败: {e}")
+        return usage
+
+
+# 全局token用量统计
+token_usage = UsageTracker()
@@ -0,0 +1,172 @@
+import asyncio
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import WebSocket
+
+from better_aim.tracing import tracer
+
+
+class StreamMetrics:
+    """WebSocket出站帧统计"""
+
+    def __init__(self):
+        self.messages = 0  # 业务层提交的消息数
+        self.frames_sent = 0  # 实际发送的帧数
+        self.bytes_sent = 0
+        self.backpressure_waits = 0  # 发送队列已满、生产者需要等待的次数
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "messages": self.messages,
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+            "coalescing_ratio": self.messages / self.frames_sent if self.frames_sent else 0.0,
+            "backpressure_waits": self.backpressure_waits,
+        }
+
+
+# 进程级汇总指标
+ws_stream_metrics = StreamMetrics()
+
+
+class CoalescingSender:
+    """
+    每个WebSocket连接一个的出站缓冲区
+
+    - 连续的 delta 消息合并为一帧，每 flush_interval 秒或累计 flush_bytes 字节时发送
+    - 其它类型的消息会先冲刷已缓冲的增量再发送，保证顺序不变
+    - 帧经有界队列（max_queued_frames）交给后台写入task发送；客户端读取过慢导致队列写满时，
+      send 会等待队列腾出空间，从而对agent形成背压
+    """
+
+    def __init__(self,
+                 websocket: WebSocket,
+                 flush_interval: float = 0.05,
+                 flush_bytes: int = 8192,
+                 max_queued_frames: int = 64,
+                 metrics: Optional[StreamMetrics] = None,
+                 session_id: Optional[str] = None):
+        self.websocket = websocket
+        self.session_id = session_id  # 用于把发送挂到会话当前轮的追踪上
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.metrics = metrics or StreamMetrics()
+        self._pending: Optional[Dict[str, Any]] = None
+        self._pending_parts = []
+        self._pending_bytes = 0
+        self._queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=max(1, max_queued_frames))
+        self._writer: Optional[asyncio.Task] = None
+        self._error: Optional[Exception] = None
+        self._closed = False
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def send(self, message: Dict[str, Any]):
+        self._count_message()
+        if message.get("type") != "delta":
+            await self.flush()
+            await self._enqueue(message)
+            return
+
+        if self._pending is None:
+            self._pending = {k: v for k, v in message.items() if k != "content"}
+        content = message.get("content") or ""
+        self._pending_parts.append(content)
+        self._pending_bytes += len(content.encode("utf-8"))
+
+        if self._pending_bytes >= self.flush_bytes or not self.flush_interval:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+
+    async def flush(self):
+        """把已缓冲的增量作为一帧放入发送队列"""
+        if self._pending is None:
+            return
+        message = dict(self._pending, content="".join(self._pending_parts))
+        self._pending, self._pending_parts, self._pending_bytes = None, [], 0
+        await self._enqueue(message)
+
+    async def close(self, timeout: float = 5):
+        """发送剩余的增量与队列中的帧后停止写入task"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        try:
+            await self.flush()
+        except Exception:
+            pass
+        self._closed = True
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        if self._error is None:
+            try:
+                await asyncio.wait_for(self._queue.put(None), timeout)
+                await asyncio.wait([writer], timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        writer.cancel()
+
+    async def abort(self):
+        """丢弃缓冲的增量与队列中的帧并立即停止写入task（连接已被新连接替换时调用）"""
+        self._closed = True
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self._pending, self._pending_parts, self._pending_bytes = None, [], 0
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.cancel()
+            await asyncio.wait([writer])
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    async def _enqueue(self, message: Dict[str, Any]):
+        if self._error is not None:
+            raise self._error
+        if self._closed:
+            raise ConnectionError("WebSocket连接已关闭")
+        if self._writer is None:
+            self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+        if self._queue.full():
+            # 客户端跟不上，等待队列腾出空间后再继续产出
+            self._count_backpressure()
+        await self._queue.put(message)
+
+    async def _write_loop(self):
+        while True:
+            message = await self._queue.get()
+            if message is None:
+                return
+            if self._error is not None:
+                continue  # 连接已失效，丢弃剩余的帧，避免生产者阻塞在已满的队列上
+            try:
+                await self._send_frame(message)
+            except Exception as e:
+                self._error = e
+                print(f"WebSocket发送失败: {e}")
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"WebSocket发送失败: {e}")
+
+    async def _send_frame(self, message: Dict[str, Any]):
+        data = json.dumps(message, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        with tracer.span(self.session_id, "ws.send", type=message.get("type"), bytes=size):
+            await self.websocket.send_text(data)
+        for metrics in (self.metrics, ws_stream_metrics):
+            metrics.frames_sent += 1
+            metrics.bytes_sent += size
+
+    def _count_message(self):
+        self.metrics.messages += 1
+        ws_stream_metrics.messages += 1
+
+    def _count_backpressure(self):
+        self.metrics.backpressure_waits += 1
+        ws_stream_metrics.backpressure_waits += 1
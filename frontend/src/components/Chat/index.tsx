@@ -62,6 +62,7 @@ function Chat() {
   const { state, actions } = useApp();
   const [message, setMessage] = useState('');
   const [selectedExample, setSelectedExample] = useState<string>('-');
+  const [loadingOlder, setLoadingOlder] = useState(false);
 
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const chatContainerRef = useRef<HTMLDivElement>(null);
@@ -76,7 +77,16 @@ function Chat() {
     // Prism.highlightAll();
   }, [state.isAuthenticated, navigate]);
 
+  // 加载更早的消息前的滚动高度，用于加载后保持当前可见的位置
+  const scrollHeightBeforeLoad = useRef<number | null>(null);
+
   useEffect(() => {
+    const container = chatContainerRef.current;
+    if (scrollHeightBeforeLoad.current !== null && container) {
+      container.scrollTop = container.scrollHeight - scrollHeightBeforeLoad.current;
+      scrollHeightBeforeLoad.current = null;
+      return;
+    }
     // 滚动到底部
     scrollToBottom();
   }, [state.currentChatSession?.history]);
@@ -110,6 +120,16 @@ function Chat() {
     }
   };
 
+  const handleLoadOlder = async () => {
+    setLoadingOlder(true);
+    scrollHeightBeforeLoad.current = chatContainerRef.current?.scrollHeight ?? null;
+    try {
+      await actions.loadOlderHistory();
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const handleKeyPress = (e: React.KeyboardEvent) => {
     if (e.key === 'Enter' && !e.shiftKey) {
       e.preventDefault();
@@ -200,6 +220,9 @@ function Chat() {
             {!isComplete && state.responding && (
               <div style={{ display: 'inline-block', marginLeft: '8px' }}>
                 <Spin size="small" />
+                {state.llmQueueStatus && (
+                  <Text type="secondary" style={{ marginLeft: '8px' }}>{state.llmQueueStatus}</Text>
+                )}
               </div>
             )}
           </div>
@@ -242,6 +265,18 @@ function Chat() {
         </div>
 
         <Space>
+          {state.tokenUsage && (
+            <Tooltip title={
+              `输入 ${state.tokenUsage.session.prompt_tokens}（缓存命中 ${state.tokenUsage.session.cached_tokens}）` +
+              ` / 输出 ${state.tokenUsage.session.completion_tokens}，共 ${state.tokenUsage.session.calls} 次调用` +
+              (state.tokenUsage.turn ? `；本轮 ${state.tokenUsage.turn.total_tokens}` : '')
+            }>
+              <Text type={state.tokenUsage.budget && !state.tokenUsage.remaining ? 'danger' : 'secondary'}>
+                Token: {state.tokenUsage.session.total_tokens.toLocaleString()}
+                {state.tokenUsage.budget ? ` / ${state.tokenUsage.budget.toLocaleString()}` : ''}
+              </Text>
+            </Tooltip>
+          )}
           <Tooltip title="用户会话ID">
             <Text code>{state.userId?.slice(0, 4)}****{state.userId?.slice(-4)}</Text>
           </Tooltip>
@@ -280,6 +315,13 @@ function Chat() {
                 backgroundColor: '#fafafa'
               }}
             >
+              {state.currentChatSession?.history_before != null && (
+                <div style={{ textAlign: 'center', marginBottom: '16px' }}>
+                  <Button type="link" size="small" loading={loadingOlder} onClick={handleLoadOlder}>
+                    加载更早的消息
+                  </Button>
+                </div>
+              )}
               {state.currentChatSession?.history.map((msg, index) => renderMessage(msg, index))}
               <div ref={messagesEndRef} />
             </div>
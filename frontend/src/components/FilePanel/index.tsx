@@ -22,6 +22,7 @@ import {
 import type { UploadProps } from 'antd';
 
 import { useApp } from '../../contexts/AppContext';
+import { apiService } from '../../services/api';
 import type { FileInfo } from '../../types';
 
 const { Title, Text } = Typography;
@@ -38,6 +39,7 @@ function formatFileSize(bytes: number): string {
 function FilePanel() {
   const { state, actions } = useApp();
   const [uploading, setUploading] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
   const fileInputRef = useRef<HTMLInputElement>(null);
 
   const handleUpload: UploadProps['beforeUpload'] = async (file) => {
@@ -46,9 +48,10 @@ function FilePanel() {
       return false;
     }
 
-    // 检查文件大小 (10MB限制)
-    if (file.size > 10 * 1024 * 1024) {
-      message.error('文件大小不能超过10MB');
+    // 检查文件大小，超过普通上传上限的文件会自动分块上传
+    const maxSize = state.config?.max_chunked_upload_size ?? 10 * 1024 * 1024;
+    if (file.size > maxSize) {
+      message.error(`文件大小不能超过${formatFileSize(maxSize)}`);
       return false;
     }
 
@@ -69,10 +72,21 @@ function FilePanel() {
   const handleDownload = (file: FileInfo) => {
     if (!state.userId) return;
 
-    const downloadUrl = `/api/download/${state.userId}/${file.name}`;
+    const downloadUrl = apiService.getFileDownloadUrl(state.userId, file.name);
     const link = document.createElement('a');
     link.href = downloadUrl;
-    link.download = file.name;
+    link.download = file.name.split('/').pop() || file.name;
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+  };
+
+  const handleDownloadArchive = () => {
+    if (!state.userId) return;
+
+    // 整个会话目录打包为zip，服务器边打包边发送
+    const link = document.createElement('a');
+    link.href = apiService.getArchiveDownloadUrl(state.userId, 'zip');
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
@@ -94,6 +108,18 @@ function FilePanel() {
     }
   };
 
+  const handleLoadMore = async () => {
+    setLoadingMore(true);
+    try {
+      await actions.loadMoreFiles();
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const loadedFiles = state.currentChatSession?.files?.length ?? 0;
+  const totalFiles = state.currentChatSession?.files_total ?? loadedFiles;
+
   const uploadProps: UploadProps = {
     name: 'files',
     multiple: true,
@@ -108,14 +134,24 @@ function FilePanel() {
         <Title level={5} style={{ margin: 0 }}>
           文件管理
         </Title>
-        <Tooltip title="刷新文件列表">
-          <Button
-            icon={<ReloadOutlined />}
-            onClick={handleRefresh}
-            size="small"
-            loading={state.loading}
-          />
-        </Tooltip>
+        <Space size="small">
+          <Tooltip title="打包下载全部文件">
+            <Button
+              icon={<DownloadOutlined />}
+              onClick={handleDownloadArchive}
+              size="small"
+              disabled={!state.isAuthenticated}
+            />
+          </Tooltip>
+          <Tooltip title="刷新文件列表">
+            <Button
+              icon={<ReloadOutlined />}
+              onClick={handleRefresh}
+              size="small"
+              loading={state.loading}
+            />
+          </Tooltip>
+        </Space>
       </div>
 
       <Text type="secondary" style={{ fontSize: '12px', display: 'block', marginBottom: '12px' }}>
@@ -142,7 +178,7 @@ function FilePanel() {
         </div>
       ) : (
         <Card
-          title="文件列表"
+          title={totalFiles > loadedFiles ? `文件列表（已显示 ${loadedFiles} / ${totalFiles}）` : '文件列表'}
           size="small"
           styles={{ body: { padding: '0' } }}
         >
@@ -193,6 +229,13 @@ function FilePanel() {
                   />
                 </List.Item>
               )}
+              loadMore={totalFiles > loadedFiles && (
+                <div style={{ textAlign: 'center', padding: '8px' }}>
+                  <Button size="small" loading={loadingMore} onClick={handleLoadMore}>
+                    加载更多（剩余 {totalFiles - loadedFiles} 个）
+                  </Button>
+                </div>
+              )}
             />
           ) : (
             <div style={{ padding: '20px', textAlign: 'center', color: '#8c8c8c' }}>
@@ -46,6 +46,7 @@ function ParamPanel() {
   const [modifyMode, setModifyMode] = useState<ModifyMode>('individual');
   const [jsonText, setJsonText] = useState('');
   const [submitting, setSubmitting] = useState(false);
+  const [trustTool, setTrustTool] = useState(false); // 提交后本会话内不再确认该工具
   const [bohrConfig, setBohrConfig] = useState({
     username: '',
     password: '',
@@ -133,10 +134,11 @@ function ParamPanel() {
         });
       }
 
-      await actions.modifyParameters(modifiedSchema);
+      await actions.modifyParameters(modifiedSchema, trustTool);
       message.success('参数已提交');
       setCurrentSchema(null);
       setLastSchemaHash(''); // 重置hash以触发重新检查
+      setTrustTool(false);
       form.resetFields();
     } catch (error) {
       message.error('参数提交失败');
@@ -366,7 +368,14 @@ function ParamPanel() {
                 </Form.Item>
               ))}
 
-              <Form.Item style={{ marginTop: '16px', marginBottom: '0' }}>
+              <Form.Item style={{ marginTop: '16px', marginBottom: '8px' }}>
+                <Space>
+                  <Switch size="small" checked={trustTool} onChange={setTrustTool} />
+                  <Text type="secondary" style={{ fontSize: '12px' }}>本会话内信任该工具，不再确认</Text>
+                </Space>
+              </Form.Item>
+
+              <Form.Item style={{ marginBottom: '0' }}>
                 <Button
                   type="primary"
                   htmlType="submit"
@@ -1,6 +1,6 @@
 import React, { createContext, useContext, useReducer, ReactNode, useEffect } from 'react';
-import { AppState, CurrentChatSession, ChatSession, ChatMessage, FileInfo, ExecutionMode, ModifyMode } from '../types';
-import { apiService, wsService } from '../services/api';
+import { AppState, CurrentChatSession, ChatSession, ChatMessage, FileInfo, ExecutionMode, HistoryEntry, ModifyMode, SessionUsage, WSMessage } from '../types';
+import { apiService, wsService, openChatStream } from '../services/api';
 
 // Action类型定义
 type AppAction =
@@ -13,12 +13,18 @@ type AppAction =
   | { type: 'SET_CHAT_SESSIONS'; payload: ChatSession[] }
   | { type: 'CREATE_NEW_CHAT_SESSION'; payload: ChatSession }
   | { type: 'ADD_CHAT_MESSAGE'; payload: ChatMessage }
-  | { type: 'UPDATE_FILES'; payload: FileInfo[] }
+  | { type: 'PREPEND_CHAT_HISTORY'; payload: { messages: ChatMessage[]; before: number | null } }
+  | { type: 'UPDATE_FILES'; payload: { files: FileInfo[]; total: number } }
+  | { type: 'APPEND_FILES'; payload: { files: FileInfo[]; total: number } }
+  | { type: 'APPLY_FILE_EVENT'; payload: { type: 'file_created' | 'file_modified' | 'file_deleted'; file: FileInfo } }
   | { type: 'SET_EXECUTION_MODE'; payload: ExecutionMode }
   | { type: 'SET_MODIFY_MODE'; payload: ModifyMode }
   | { type: 'UPDATE_STREAMING_RESPONSE'; payload: string }
+  | { type: 'APPEND_STREAMING_DELTA'; payload: string }
   | { type: 'SET_RESPONDING'; payload: boolean }
-  | { type: 'SET_PENDING_TOOL_RESPONSE'; payload: string };
+  | { type: 'SET_PENDING_TOOL_RESPONSE'; payload: string }
+  | { type: 'SET_LLM_QUEUE_STATUS'; payload: string }
+  | { type: 'SET_TOKEN_USAGE'; payload: SessionUsage | null };
 
 // 初始状态
 const initialState: AppState = {
@@ -33,8 +39,29 @@ const initialState: AppState = {
   error: null,
   responding: false,
   pendingToolResponse: '',
+  llmQueueStatus: '',
+  tokenUsage: null,
 };
 
+// 本会话上一条消息尚未处理完时的排队提示（position从1开始）
+function formatTurnQueueStatus(position?: number): string {
+  return position ? `等待上一条消息处理完成（排队第${position}位）` : '等待上一条消息处理完成';
+}
+
+// 文件列表每页的数量
+const FILE_PAGE_SIZE = 500;
+
+// 把服务端保存的对话轮次转换为聊天消息（服务端不保存时间，以加载时间标记为已完成的消息）
+function historyToMessages(entries: HistoryEntry[]): ChatMessage[] {
+  const loadedAt = new Date().toISOString();
+  const messages: ChatMessage[] = [];
+  for (const [user, assistant] of entries) {
+    if (user) messages.push({ role: 'user', content: user, timestamp: loadedAt });
+    if (assistant) messages.push({ role: 'assistant', content: assistant, timestamp: loadedAt });
+  }
+  return messages;
+}
+
 // Reducer函数
 function appReducer(state: AppState, action: AppAction): AppState {
   switch (action.type) {
@@ -77,6 +104,7 @@ function appReducer(state: AppState, action: AppAction): AppState {
           title: action.payload.title,
           history: action.payload.history,
           files: state.currentChatSession?.files || [],
+          history_before: action.payload.history_before,
         }
       };
 
@@ -99,16 +127,67 @@ function appReducer(state: AppState, action: AppAction): AppState {
         ),
       };
 
+    case 'PREPEND_CHAT_HISTORY': {
+      // 服务端较早的历史插入到当前对话开头
+      const session = state.currentChatSession;
+      if (!session) return state;
+      const history = [...action.payload.messages, ...session.history];
+      return {
+        ...state,
+        currentChatSession: { ...session, history, history_before: action.payload.before },
+        chatSessions: state.chatSessions.map(chat =>
+          chat.chat_id === session.chat_id
+            ? { ...chat, history, message_count: history.length, history_before: action.payload.before }
+            : chat
+        ),
+      };
+    }
+
     case 'UPDATE_FILES':
       if (!state.currentChatSession) return state;
       return {
         ...state,
         currentChatSession: {
           ...state.currentChatSession,
-          files: action.payload,
+          files: action.payload.files,
+          files_total: action.payload.total,
         },
       };
 
+    case 'APPEND_FILES': {
+      // 下一页文件追加到列表末尾（期间由文件事件插入的文件不重复添加）
+      if (!state.currentChatSession) return state;
+      const loaded = state.currentChatSession.files || [];
+      const names = new Set(loaded.map(f => f.name));
+      return {
+        ...state,
+        currentChatSession: {
+          ...state.currentChatSession,
+          files: [...loaded, ...action.payload.files.filter(f => !names.has(f.name))],
+          files_total: action.payload.total,
+        },
+      };
+    }
+
+    case 'APPLY_FILE_EVENT': {
+      if (!state.currentChatSession) return state;
+      const { type: eventType, file } = action.payload;
+      const others = (state.currentChatSession.files || []).filter(f => f.name !== file.name);
+      const files = eventType === 'file_deleted'
+        ? others
+        : [...others, file].sort((a, b) => a.name.localeCompare(b.name));
+      const total = state.currentChatSession.files_total ?? others.length;
+      const delta = eventType === 'file_created' ? 1 : eventType === 'file_deleted' ? -1 : 0;
+      return {
+        ...state,
+        currentChatSession: {
+          ...state.currentChatSession,
+          files,
+          files_total: Math.max(files.length, total + delta),
+        },
+      };
+    }
+
     case 'SET_EXECUTION_MODE':
       return { ...state, executionMode: action.payload };
 
@@ -148,12 +227,37 @@ function appReducer(state: AppState, action: AppAction): AppState {
         };
       }
 
+    case 'APPEND_STREAMING_DELTA': {
+      // 逐token增量：追加到正在生成的助手消息末尾
+      const history = state.currentChatSession?.history || [];
+      const last = history[history.length - 1];
+      if (!state.currentChatSession) return state;
+      if (last && last.role === 'assistant' && !last.timestamp) {
+        const updatedHistory = [...history];
+        updatedHistory[updatedHistory.length - 1] = { ...last, content: last.content + action.payload };
+        return { ...state, currentChatSession: { ...state.currentChatSession, history: updatedHistory } };
+      }
+      return {
+        ...state,
+        currentChatSession: {
+          ...state.currentChatSession,
+          history: [...history, { role: 'assistant' as const, content: action.payload }],
+        },
+      };
+    }
+
     case 'SET_RESPONDING':
       return { ...state, responding: action.payload };
 
     case 'SET_PENDING_TOOL_RESPONSE':
       return { ...state, pendingToolResponse: action.payload };
 
+    case 'SET_LLM_QUEUE_STATUS':
+      return { ...state, llmQueueStatus: action.payload };
+
+    case 'SET_TOKEN_USAGE':
+      return { ...state, tokenUsage: action.payload };
+
     default:
       return state;
   }
@@ -168,12 +272,14 @@ const AppContext = createContext<{
     logout: () => void;
     sendMessage: (message: string) => Promise<void>;
     loadChatHistory: () => Promise<void>;
+    loadOlderHistory: () => Promise<void>;
     loadFiles: () => Promise<void>;
+    loadMoreFiles: () => Promise<void>;
     uploadFiles: (files: File[]) => Promise<void>;
     clearCurrentChatHistory: () => Promise<void>;
     createNewChatSession: () => Promise<ChatSession>;
     switchToChatSession: (chatId: string) => Promise<void>;
-    modifyParameters: (modifiedSchema: any) => Promise<void>;
+    modifyParameters: (modifiedSchema: any, trust?: boolean) => Promise<void>;
     getCurrentSchema: () => Promise<any>;
   };
 } | null>(null);
@@ -182,6 +288,24 @@ const AppContext = createContext<{
 export function AppProvider({ children }: { children: ReactNode }) {
   const [state, dispatch] = useReducer(appReducer, initialState);
 
+  // 处理WebSocket/SSE推送的token用量
+  const applyUsageMessage = (message: WSMessage) => {
+    if (!message.session) return;
+    dispatch({
+      type: 'SET_TOKEN_USAGE',
+      payload: {
+        session_id: state.userId,
+        session: message.session,
+        turn: message.turn ?? null,
+        budget: message.budget ?? null,
+        remaining: message.remaining ?? null,
+      },
+    });
+    if (message.budget_exceeded) {
+      dispatch({ type: 'SET_ERROR', payload: '本会话的token预算已用完，已停止调用模型' });
+    }
+  };
+
   // 初始化应用
   useEffect(() => {
     const initApp = async () => {
@@ -207,6 +331,9 @@ export function AppProvider({ children }: { children: ReactNode }) {
     if (state.isAuthenticated && state.userId) {
       const handleWSMessage = (message: any) => {
         switch (message.type) {
+          case 'delta':
+            dispatch({ type: 'APPEND_STREAMING_DELTA', payload: message.content || '' });
+            break;
           case 'streaming_response':
             dispatch({ type: 'UPDATE_STREAMING_RESPONSE', payload: message.content || '' });
             break;
@@ -235,6 +362,37 @@ export function AppProvider({ children }: { children: ReactNode }) {
           case 'error':
             dispatch({ type: 'SET_ERROR', payload: message.message || 'WebSocket错误' });
             break;
+          case 'busy':
+            dispatch({ type: 'SET_ERROR', payload: message.message || '会话繁忙，请稍后再试' });
+            dispatch({ type: 'SET_RESPONDING', payload: false });
+            dispatch({ type: 'SET_LLM_QUEUE_STATUS', payload: '' });
+            break;
+          case 'file_created':
+          case 'file_modified':
+          case 'file_deleted':
+            if (message.file) {
+              dispatch({ type: 'APPLY_FILE_EVENT', payload: { type: message.type, file: message.file } });
+            }
+            break;
+          case 'files_changed':
+            actions.loadFiles();
+            break;
+          case 'llm_queued':
+            dispatch({
+              type: 'SET_LLM_QUEUE_STATUS',
+              payload: `LLM繁忙，排队中（第${message.position}位，已等待${(message.wait || 0).toFixed(1)}秒）`,
+            });
+            break;
+          case 'llm_admitted':
+          case 'turn_started':
+            dispatch({ type: 'SET_LLM_QUEUE_STATUS', payload: '' });
+            break;
+          case 'queued':
+            dispatch({ type: 'SET_LLM_QUEUE_STATUS', payload: formatTurnQueueStatus(message.position) });
+            break;
+          case 'usage':
+            applyUsageMessage(message);
+            break;
           case 'tool_modify_required':
             // 存储当前的响应内容作为待处理的工具响应
             const currentHistory = state.currentChatSession?.history || [];
@@ -271,6 +429,19 @@ export function AppProvider({ children }: { children: ReactNode }) {
     }
   }, [state.chatSessions, state.userId]);
 
+  // 拉取一页服务端历史并插入当前对话开头，before为空时取最近一页
+  const fetchHistoryPage = async (userId: string, before?: number) => {
+    try {
+      const page = await apiService.getChatHistory(userId, before);
+      dispatch({
+        type: 'PREPEND_CHAT_HISTORY',
+        payload: { messages: historyToMessages(page.history), before: page.has_more ? page.next_before : null },
+      });
+    } catch (error) {
+      console.error('加载聊天历史失败:', error);
+    }
+  };
+
   // Actions
   const actions = {
     login: async (userId: string) => {
@@ -284,10 +455,11 @@ export function AppProvider({ children }: { children: ReactNode }) {
         // 加载现有的聊天会话
         await actions.loadChatHistory();
 
-        // 如果没有现有聊天会话，创建一个新的
+        // 如果没有现有聊天会话，创建一个新的，并显示服务端保存的最近一页历史（更早的在聊天界面中按需加载）
         const savedSessions = localStorage.getItem(`chat_sessions_${userId}`);
         if (!savedSessions || JSON.parse(savedSessions).length === 0) {
           await actions.createNewChatSession();
+          await fetchHistoryPage(userId);
         } else {
           // 如果有现有会话，切换到第一个会话
           const sessions = JSON.parse(savedSessions);
@@ -297,6 +469,12 @@ export function AppProvider({ children }: { children: ReactNode }) {
         }
 
         await actions.loadFiles();
+
+        try {
+          dispatch({ type: 'SET_TOKEN_USAGE', payload: await apiService.getSessionUsage(userId) });
+        } catch (error) {
+          console.error('获取token用量失败:', error);
+        }
       } catch (error) {
         console.error('登录失败:', error);
         const errorMessage = error instanceof Error ? error.message : '登录失败，请检查网络连接';
@@ -351,8 +529,51 @@ export function AppProvider({ children }: { children: ReactNode }) {
         };
         dispatch({ type: 'ADD_CHAT_MESSAGE', payload: assistantMessage });
 
-        // 通过WebSocket发送消息
-        wsService.sendMessage(message);
+        if (wsService.isConnected()) {
+          // 通过WebSocket发送消息
+          wsService.sendMessage(message);
+        } else {
+          // WebSocket不可用时降级为SSE流式接口
+          openChatStream(state.userId, message, (streamMessage) => {
+            switch (streamMessage.type) {
+              case 'delta':
+                dispatch({ type: 'APPEND_STREAMING_DELTA', payload: streamMessage.content || '' });
+                break;
+              case 'streaming_response':
+              case 'final_response':
+                dispatch({ type: 'UPDATE_STREAMING_RESPONSE', payload: streamMessage.content || '' });
+                break;
+              case 'llm_queued':
+                dispatch({
+                  type: 'SET_LLM_QUEUE_STATUS',
+                  payload: `LLM繁忙，排队中（第${streamMessage.position}位，已等待${(streamMessage.wait || 0).toFixed(1)}秒）`,
+                });
+                break;
+              case 'llm_admitted':
+              case 'turn_started':
+                dispatch({ type: 'SET_LLM_QUEUE_STATUS', payload: '' });
+                break;
+              case 'queued':
+                dispatch({ type: 'SET_LLM_QUEUE_STATUS', payload: formatTurnQueueStatus(streamMessage.position) });
+                break;
+              case 'usage':
+                applyUsageMessage(streamMessage);
+                break;
+              case 'error':
+              case 'busy':
+                dispatch({ type: 'SET_ERROR', payload: streamMessage.message || '流式请求错误' });
+                break;
+              case 'done':
+                dispatch({ type: 'SET_RESPONDING', payload: false });
+                dispatch({ type: 'SET_LLM_QUEUE_STATUS', payload: '' });
+                // 本轮结束时的用量事件可能未随SSE送达，结束后重新拉取
+                apiService.getSessionUsage(state.userId)
+                  .then((usage) => dispatch({ type: 'SET_TOKEN_USAGE', payload: usage }))
+                  .catch(() => {});
+                break;
+            }
+          });
+        }
       } catch (error) {
         dispatch({ type: 'SET_ERROR', payload: error instanceof Error ? error.message : '发送消息失败' });
         dispatch({ type: 'SET_RESPONDING', payload: false });
@@ -374,6 +595,12 @@ export function AppProvider({ children }: { children: ReactNode }) {
       }
     },
 
+    loadOlderHistory: async () => {
+      const before = state.currentChatSession?.history_before;
+      if (!state.userId || before == null) return;
+      await fetchHistoryPage(state.userId, before);
+    },
+
     switchToChatSession: async (chatId: string) => {
       if (!state.userId) return;
 
@@ -389,6 +616,7 @@ export function AppProvider({ children }: { children: ReactNode }) {
               title: targetSession.title,
               history: targetSession.history,
               files: state.currentChatSession?.files || [],
+              history_before: targetSession.history_before,
             };
             dispatch({ type: 'SET_CURRENT_CHAT_SESSION', payload: currentChatSession });
           }
@@ -402,19 +630,42 @@ export function AppProvider({ children }: { children: ReactNode }) {
       if (!state.userId) return;
 
       try {
-        const { files } = await apiService.getFiles(state.userId);
-        dispatch({ type: 'UPDATE_FILES', payload: files });
+        const { files, total } = await apiService.getFiles(state.userId, { limit: FILE_PAGE_SIZE });
+        dispatch({ type: 'UPDATE_FILES', payload: { files, total } });
       } catch (error) {
         console.error('加载文件列表失败:', error);
       }
     },
 
+    loadMoreFiles: async () => {
+      if (!state.userId || !state.currentChatSession) return;
+
+      try {
+        const { files, total } = await apiService.getFiles(state.userId, {
+          offset: state.currentChatSession.files.length,
+          limit: FILE_PAGE_SIZE,
+        });
+        dispatch({ type: 'APPEND_FILES', payload: { files, total } });
+      } catch (error) {
+        console.error('加载更多文件失败:', error);
+      }
+    },
+
     uploadFiles: async (files: File[]) => {
       if (!state.userId) return;
 
       try {
         dispatch({ type: 'SET_LOADING', payload: true });
-        await apiService.uploadFiles(state.userId, files);
+        // 超过普通上传上限的大文件走分块上传
+        const maxUploadSize = state.config?.max_upload_size ?? 10 * 1024 * 1024;
+        const smallFiles = files.filter(file => file.size <= maxUploadSize);
+        const largeFiles = files.filter(file => file.size > maxUploadSize);
+        if (smallFiles.length) {
+          await apiService.uploadFiles(state.userId, smallFiles);
+        }
+        for (const file of largeFiles) {
+          await apiService.uploadFileChunked(state.userId, file);
+        }
         await actions.loadFiles(); // 重新加载文件列表
       } catch (error) {
         dispatch({ type: 'SET_ERROR', payload: error instanceof Error ? error.message : '文件上传失败' });
@@ -451,11 +702,11 @@ export function AppProvider({ children }: { children: ReactNode }) {
       }
     },
 
-    modifyParameters: async (modifiedSchema: any) => {
+    modifyParameters: async (modifiedSchema: any, trust: boolean = false) => {
       if (!state.userId) return;
 
       try {
-        await apiService.modifyParameters(state.userId, modifiedSchema);
+        await apiService.modifyParameters(state.userId, modifiedSchema, trust);
         // 清除待处理的工具响应
         dispatch({ type: 'SET_PENDING_TOOL_RESPONSE', payload: '' });
       } catch (error) {
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import type { LoginRequest, LoginResponse, FileInfo, ToolSchema, WSMessage, AppConfig, ChatMessage } from '../types';
+import type { LoginRequest, LoginResponse, FileInfo, FileListQuery, ToolSchema, WSMessage, AppConfig, ChatHistoryPage, SessionUsage } from '../types';
 
 // 强制使用相对路径，确保通过Vite代理
 const API_BASE_URL = '/api';
@@ -72,6 +72,12 @@ export const apiService = {
     return response.data;
   },
 
+  // 重新拉取MCP工具目录（无需重启后端）
+  async refreshTools(): Promise<{ message: string; tool_count: number; fingerprint: string; changed: boolean }> {
+    const response = await api.post('/tools/refresh');
+    return response.data;
+  },
+
   // 聊天相关
   async sendMessage(sessionId: string, message: string): Promise<{ response: string; is_final: boolean }> {
     const response = await api.post('/chat', {
@@ -81,9 +87,11 @@ export const apiService = {
     return response.data;
   },
 
-  // 获取聊天历史
-  async getChatHistory(sessionId: string): Promise<{ history: ChatMessage[] }> {
-    const response = await api.get(`/sessions/${sessionId}/history`);
+  // 获取聊天历史（游标分页，before传入上一页的next_before）
+  async getChatHistory(sessionId: string, before?: number, limit: number = 50): Promise<ChatHistoryPage> {
+    const response = await api.get(`/sessions/${sessionId}/history`, {
+      params: { before, limit },
+    });
     return response.data;
   },
 
@@ -100,17 +108,25 @@ export const apiService = {
   },
 
   // 提交修改后的参数
-  async modifyParameters(sessionId: string, modifiedSchema: ToolSchema): Promise<{ message: string; modified_args: any }> {
+  async modifyParameters(sessionId: string, modifiedSchema: ToolSchema, trust: boolean = false): Promise<{ message: string; modified_args: any }> {
     const response = await api.post('/modify-params', {
       session_id: sessionId,
       modified_schema: modifiedSchema,
+      call_id: modifiedSchema.call_id,
+      trust,
     });
     return response.data;
   },
 
+  // 会话的token用量与预算
+  async getSessionUsage(sessionId: string): Promise<SessionUsage> {
+    const response = await api.get(`/sessions/${sessionId}/usage`);
+    return response.data;
+  },
+
   // 文件管理相关
-  async getFiles(sessionId: string): Promise<{ files: FileInfo[] }> {
-    const response = await api.get(`/files/${sessionId}`);
+  async getFiles(sessionId: string, query: FileListQuery = {}): Promise<{ files: FileInfo[]; total: number }> {
+    const response = await api.get(`/files/${sessionId}`, { params: query });
     return response.data;
   },
 
@@ -128,9 +144,55 @@ export const apiService = {
     return response.data;
   },
 
+  // 分块（可续传）上传：失败时查询服务器已接收的偏移量并从断点继续
+  async uploadFileChunked(
+    sessionId: string,
+    file: File,
+    onProgress?: (uploaded: number, total: number) => void,
+    maxRetries: number = 3,
+  ): Promise<FileInfo> {
+    const created = await api.post(`/upload/${sessionId}/chunked`, {
+      filename: file.name,
+      size: file.size,
+    });
+    const { upload_id: uploadId, chunk_size: chunkSize } = created.data;
+    let offset = 0;
+    let retries = 0;
+
+    while (offset < file.size) {
+      const chunk = file.slice(offset, offset + chunkSize);
+      try {
+        const response = await api.put(`/upload/${sessionId}/chunked/${uploadId}`, chunk, {
+          params: { offset },
+          headers: { 'Content-Type': 'application/octet-stream' },
+          timeout: 0,
+        });
+        offset = response.data.offset;
+        retries = 0;
+        onProgress?.(offset, file.size);
+      } catch (error) {
+        if (++retries > maxRetries) {
+          throw error;
+        }
+        const status = await api.get(`/upload/${sessionId}/chunked/${uploadId}`);
+        offset = status.data.offset;
+      }
+    }
+
+    const completed = await api.post(`/upload/${sessionId}/chunked/${uploadId}/complete`);
+    return completed.data;
+  },
+
   // 下载文件
   getFileDownloadUrl(sessionId: string, filename: string): string {
-    return `${API_BASE_URL}/download/${sessionId}/${filename}`;
+    return `${API_BASE_URL}/download/${sessionId}/${encodeURI(filename)}`;
+  },
+
+  // 打包下载会话目录（可指定子路径）
+  getArchiveDownloadUrl(sessionId: string, format: 'zip' | 'tar.gz' = 'zip', paths: string[] = []): string {
+    const params = new URLSearchParams({ format });
+    paths.forEach(path => params.append('paths', path));
+    return `${API_BASE_URL}/download/${sessionId}/archive?${params.toString()}`;
   },
 };
 
@@ -194,6 +256,10 @@ export class WebSocketService {
     this.messageHandlers = [];
   }
 
+  isConnected(): boolean {
+    return this.ws !== null && this.ws.readyState === WebSocket.OPEN;
+  }
+
   sendMessage(message: string) {
     if (this.ws && this.ws.readyState === WebSocket.OPEN) {
       this.ws.send(JSON.stringify({ message }));
@@ -214,4 +280,29 @@ export class WebSocketService {
   }
 }
 
-export const wsService = new WebSocketService();
\ No newline at end of file
+export const wsService = new WebSocketService();
+
+// SSE流式聊天：WebSocket被代理阻断时的降级方案，断线后EventSource会携带Last-Event-ID自动续传
+export function openChatStream(sessionId: string, message: string, onMessage: (message: WSMessage) => void): EventSource {
+  const params = new URLSearchParams({ session_id: sessionId, message });
+  const source = new EventSource(`${API_BASE_URL}/chat/stream?${params.toString()}`);
+  source.onmessage = (event) => {
+    try {
+      const data: WSMessage = JSON.parse(event.data);
+      if (data.type === 'done') {
+        source.close();
+      }
+      onMessage(data);
+    } catch (error) {
+      console.error('解析SSE消息失败:', error);
+    }
+  };
+  source.onerror = () => {
+    // 网络中断时浏览器会带着Last-Event-ID自动重连；服务端拒绝续传（如该轮已过期）时连接关闭，不再重连
+    if (source.readyState === EventSource.CLOSED) {
+      onMessage({ type: 'error', message: 'SSE连接已关闭，无法续传本轮对话' });
+      onMessage({ type: 'done' });
+    }
+  };
+  return source;
+}
\ No newline at end of file
@@ -5,6 +5,16 @@ export interface ChatMessage {
   timestamp?: string;
 }
 
+// 服务端保存的一轮对话：[用户消息, 助手回复]
+export type HistoryEntry = [string | null, string | null];
+
+// 聊天历史的一页（游标分页）
+export interface ChatHistoryPage {
+  history: HistoryEntry[];
+  next_before: number | null;
+  has_more: boolean;
+}
+
 // 登录请求类型
 export interface LoginRequest {
   session_id: string;
@@ -18,9 +28,19 @@ export interface LoginResponse {
 
 // 文件信息类型
 export interface FileInfo {
-  name: string;
+  name: string; // 相对会话目录的路径，子目录中的文件包含目录前缀
   path: string;
   size: number;
+  mtime?: number;
+}
+
+export interface FileListQuery {
+  offset?: number;
+  limit?: number;
+  sort?: 'name' | 'size' | 'mtime';
+  order?: 'asc' | 'desc';
+  q?: string; // 通配符（如 *.pth）或子串
+  dir?: string;
 }
 
 // 工具参数Schema类型
@@ -31,6 +51,7 @@ export interface ToolSchema {
     properties: Record<string, PropertySchema>;
   };
   parameters?: Record<string, any>;
+  call_id?: string; // 工具调用ID，并行调用时用于区分各个待确认调用
 }
 
 export interface PropertySchema {
@@ -42,14 +63,47 @@ export interface PropertySchema {
   description?: string;
 }
 
+// token用量
+export interface TokenUsage {
+  prompt_tokens: number;
+  completion_tokens: number;
+  cached_tokens: number; // prompt中命中缓存的部分
+  total_tokens: number;
+  calls: number;
+}
+
+// 会话的token用量与预算，budget为null表示不限制
+export interface SessionUsage {
+  session_id: string;
+  session: TokenUsage;
+  turn: TokenUsage | null; // 当前（或刚结束的）一轮
+  budget: number | null;
+  remaining: number | null;
+}
+
 // WebSocket消息类型
 export interface WSMessage {
-  type: 'streaming_response' | 'final_response' | 'error' | 'tool_modify_required';
+  type: 'delta' | 'streaming_response' | 'final_response' | 'error' | 'tool_modify_required' | 'tool_modify_resolved' | 'done'
+    | 'queued' | 'turn_started' | 'busy' | 'llm_queued' | 'llm_admitted'
+    | 'file_created' | 'file_modified' | 'file_deleted' | 'files_changed' | 'usage';
+  position?: number;
+  wait?: number; // LLM排队已等待的秒数
+  file?: FileInfo; // 文件变化事件对应的文件
   content?: string;
   is_final?: boolean;
   message?: string;
   schema?: ToolSchema;
   tool_name?: string;
+  call_id?: string;
+  pending?: number; // 会话中仍待确认的工具调用数
+  // usage消息：字段同 SessionUsage
+  session?: TokenUsage;
+  turn?: TokenUsage | null;
+  call?: TokenUsage; // 刚结束的单次模型调用
+  budget?: number | null;
+  remaining?: number | null;
+  turn_complete?: boolean;
+  budget_exceeded?: boolean;
 }
 
 // 应用配置类型
@@ -61,6 +115,9 @@ export interface AppConfig {
   };
   mcp_server_url: string;
   target_tools: string[];
+  max_upload_size?: number; // 普通上传的单个文件上限（字节）
+  max_chunked_upload_size?: number; // 分块上传的单个文件上限（字节）
+  upload_chunk_size?: number;
 }
 
 // 用户会话信息类型（32位用户会话ID）
@@ -79,6 +136,7 @@ export interface ChatSession {
   created_at: string;
   last_active: string;
   message_count: number;
+  history_before?: number | null; // 服务端更早历史的分页游标，为空表示没有更早的消息
 }
 
 // 当前聊天会话信息
@@ -87,7 +145,9 @@ export interface CurrentChatSession {
   user_id: string;
   title: string;
   history: ChatMessage[];
-  files: FileInfo[]; // 用户文件列表
+  files: FileInfo[]; // 用户文件列表（已加载的部分）
+  files_total?: number; // 会话目录中的文件总数，大于 files.length 时可继续加载
+  history_before?: number | null; // 服务端更早历史的分页游标，为空表示没有更早的消息
 }
 
 // MCP工具执行模式
@@ -109,4 +169,6 @@ export interface AppState {
   error: string | null;
   responding: boolean; // Agent是否正在响应
   pendingToolResponse: string; // 待处理的工具响应内容
+  llmQueueStatus: string; // LLM排队状态提示，为空表示未排队
+  tokenUsage: SessionUsage | null; // 当前会话的token用量
 }
\ No newline at end of file
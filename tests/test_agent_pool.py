@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip("google.adk")
+
+from better_aim.agent_pool import AgentPool
+
+
+def _pool(**kwargs):
+    evicted = []
+    pool = AgentPool(factory=lambda session_id: object(), **kwargs)
+    pool.add_eviction_listener(lambda session_id, reason: evicted.append((session_id, reason)))
+    return pool, evicted
+
+
+def test_lru_skips_pinned_sessions():
+    pool, evicted = _pool(max_size=2, idle_ttl=0)
+    pool.get("a")
+    with pool.pinned("a"):
+        pool.get("b")
+        pool.get("c")
+        assert evicted == [("b", "lru")]
+        assert "a" in pool
+    assert pool.stats()["pinned"] == 0
+
+
+def test_pool_overflows_while_all_pinned():
+    pool, evicted = _pool(max_size=1, idle_ttl=0)
+    pool.pin("a")
+    pool.get("a")
+    pool.pin("b")
+    pool.get("b")
+    assert len(pool) == 2 and evicted == []
+    pool.unpin("a")
+    assert evicted == [("a", "lru")]
+    pool.unpin("b")
+    assert len(pool) == 1
+
+
+def test_ttl_skips_pinned_sessions(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("better_aim.agent_pool.time.monotonic", lambda: now[0])
+    pool, evicted = _pool(max_size=10, idle_ttl=60)
+    pool.get("a")
+    pool.get("b")
+    with pool.pinned("a"):
+        now[0] += 120
+        assert pool.evict_expired() == 1
+        assert evicted == [("b", "ttl")]
+    # 解除固定后重新计算空闲时间
+    assert pool.evict_expired() == 0
+    now[0] += 120
+    assert pool.evict_expired() == 1
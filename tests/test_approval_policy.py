@@ -0,0 +1,26 @@
+import pytest
+
+from better_aim.approval_policy import ApprovalPolicy
+
+
+def _configure(rule):
+    policy = ApprovalPolicy()
+    policy.configure({"tools": {"run_training": {"rules": [rule]}}})
+    return policy
+
+
+@pytest.mark.parametrize("rule", [
+    {"name": "no-args"},
+    {"name": "empty-args", "args": {}},
+    {"name": "empty-spec", "args": {"device": {}}},
+])
+def test_empty_rules_are_rejected(rule):
+    with pytest.raises(ValueError):
+        _configure(rule)
+
+
+def test_rule_matches_only_constrained_calls():
+    policy = _configure({"name": "cpu", "args": {"device": {"in": ["cpu"]}, "epochs": {"max": 50}}})
+    assert policy.evaluate("s", "run_training", {"device": "cpu", "epochs": 10}).approved
+    assert not policy.evaluate("s", "run_training", {"device": "cuda", "epochs": 10}).approved
+    assert not policy.evaluate("s", "run_training", {"device": "cpu"}).approved
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from better_aim.artifact_watcher import ArtifactWatcher, inotify_available
+from better_aim.file_index import SessionFileIndex
+
+requires_inotify = pytest.mark.skipif(not inotify_available(), reason="inotify不可用")
+
+
+def _write_idle(path, data):
+    with open(path, "w") as f:
+        f.write(data)
+    mtime = time.time() - 600
+    os.utime(path, (mtime, mtime))
+
+
+async def _watch_append_after_idle(session_dir, use_inotify, index=None, safety_interval=30):
+    log = os.path.join(session_dir, "train.log")
+    _write_idle(log, "a")
+
+    received = []
+
+    async def on_events(events):
+        received.extend(events)
+
+    watcher = ArtifactWatcher(session_dir, on_events, index=index, poll_interval=0.05,
+                              safety_interval=safety_interval, debounce=0.01, use_inotify=use_inotify)
+    watcher.start()
+    try:
+        await asyncio.sleep(0.2)
+        # 空闲超过 hot_window 后原地追加
+        with open(log, "a") as f:
+            f.write("bc")
+        for _ in range(100):
+            if received:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        watcher.stop()
+    return received
+
+
+@pytest.mark.parametrize("use_inotify, safety_interval", [
+    # 轮询时空闲文件的原地追加在兜底的全量检查中发现
+    (False, 0.2),
+    pytest.param(True, 30, marks=requires_inotify),
+])
+def test_append_after_idle_is_reported(tmp_path, use_inotify, safety_interval):
+    events = asyncio.run(_watch_append_after_idle(str(tmp_path), use_inotify, safety_interval=safety_interval))
+    assert [event["type"] for event in events] == ["file_modified"]
+    assert events[0]["file"]["name"] == "train.log"
+    assert events[0]["file"]["size"] == 3
+
+
+@requires_inotify
+def test_inotify_change_restats_only_reported_file(tmp_path):
+    for i in range(50):
+        _write_idle(os.path.join(tmp_path, f"result_{i}.dat"), "x")
+    index = SessionFileIndex(str(tmp_path), min_refresh_interval=0, hot_window=120)
+    events = asyncio.run(_watch_append_after_idle(str(tmp_path), True, index=index))
+    assert [event["file"]["name"] for event in events] == ["train.log"]
+    assert index.scanned_dirs == 0
+    assert index.restatted_files == 1
@@ -0,0 +1,80 @@
+import os
+import time
+
+import pytest
+
+from better_aim.file_index import SessionFileIndex, resolve_session_dir
+
+
+def _write(path, data, age=0.0):
+    with open(path, "a") as f:
+        f.write(data)
+    if age:
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+
+
+def test_forced_refresh_sees_append_after_idle(tmp_path):
+    log = tmp_path / "train.log"
+    _write(log, "a", age=600)
+    index = SessionFileIndex(str(tmp_path), hot_window=120)
+    [entry] = index.refresh(force=True)
+    assert entry.size == 1
+
+    # 空闲超过 hot_window 后原地追加，目录 mtime 不变
+    _write(log, "bc")
+    [entry] = index.refresh(force=True)
+    assert entry.size == 3
+    assert time.time() - entry.mtime < 60
+    assert index.scanned_dirs == 0
+
+
+def test_invalidate_sees_append_after_idle(tmp_path):
+    log = tmp_path / "train.log"
+    _write(log, "a", age=600)
+    index = SessionFileIndex(str(tmp_path), min_refresh_interval=3600, hot_window=120)
+    index.refresh()
+
+    _write(log, "bc")
+    index.invalidate()
+    total, [entry] = index.query()
+    assert total == 1
+    assert entry.size == 3
+
+
+def test_throttled_refresh_skips_idle_files(tmp_path):
+    log = tmp_path / "train.log"
+    _write(log, "a", age=600)
+    index = SessionFileIndex(str(tmp_path), min_refresh_interval=0, hot_window=120)
+    index.refresh()
+
+    # 非强制刷新只 stat hot_window 内修改过的文件
+    _write(log, "bc", age=600)
+    [entry] = index.refresh()
+    assert entry.size == 1
+    [entry] = index.refresh(force=True)
+    assert entry.size == 3
+
+
+def test_mark_changed_restats_only_marked_files(tmp_path):
+    for name in ("a.log", "b.log", "c.log"):
+        _write(tmp_path / name, "x", age=600)
+    index = SessionFileIndex(str(tmp_path), min_refresh_interval=3600, hot_window=120)
+    index.refresh()
+
+    _write(tmp_path / "b.log", "yz", age=600)
+    index.mark_changed(["b.log"])
+    entries = {entry.path: entry.size for entry in index.refresh()}
+    assert entries == {"a.log": 1, "b.log": 3, "c.log": 1}
+    assert index.restatted_files == 1
+
+
+@pytest.mark.parametrize("session_id", ["..", "../" + "a" * 29, "a" * 31 + "/", "." * 32, "a" * 31, ""])
+def test_resolve_session_dir_rejects_invalid_ids(tmp_path, session_id):
+    with pytest.raises(ValueError):
+        resolve_session_dir(str(tmp_path), session_id)
+
+
+def test_resolve_session_dir(tmp_path):
+    session_id = "aB3" * 10 + "xy"
+    assert resolve_session_dir(str(tmp_path), session_id) == os.path.join(os.path.realpath(tmp_path), session_id)
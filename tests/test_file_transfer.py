@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("starlette")
+
+from better_aim.file_transfer import TransferStats, parse_range
+
+
+def test_transfer_stats_skip_inactive_sessions():
+    active = {"a" * 32}
+    stats = TransferStats(is_active=lambda session_id: session_id in active)
+    stats.record_download("a" * 32, 206)
+    stats.add_downloaded("a" * 32, 100)
+    stats.add_downloaded("b" * 32, 100)
+    stats.add_uploaded("b" * 32, 100)
+
+    top = stats.top()
+    assert top["sessions"] == 1
+    assert top["bytes_downloaded"] == 100
+    assert top["bytes_uploaded"] == 0
+    assert stats.get("a" * 32)["partial_downloads"] == 1
+
+    stats.discard("a" * 32)
+    assert stats.top()["sessions"] == 0
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-", (10, 999)),
+    ("bytes=990-2000", (990, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    (None, None),
+    ("items=0-1", None),
+    ("bytes=0-1,5-6", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=abc-", "bytes=-x", "bytes=-", "bytes=5", "bytes=1-x", "bytes=+1-2",
+                                    "bytes=9-3", "bytes=\u00b2-3"])
+def test_parse_range_ignores_malformed_header(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header, size", [("bytes=1000-", 1000), ("bytes=-0", 1000), ("bytes=0-", 0)])
+def test_parse_range_unsatisfiable(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
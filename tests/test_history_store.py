@@ -0,0 +1,123 @@
+import json
+import os
+
+import pytest
+
+from better_aim.history_store import JsonlHistoryStore, RecentHistoryCache, SqliteHistoryStore
+
+
+def _entries(n, start=0):
+    return [[f"q{i}", f"a{i}"] for i in range(start, start + n)]
+
+
+@pytest.fixture(params=["jsonl", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SqliteHistoryStore(str(tmp_path))
+    return JsonlHistoryStore(str(tmp_path))
+
+
+def test_append_returns_sequential_seq(store):
+    assert [store.append("s", entry) for entry in _entries(3)] == [1, 2, 3]
+    assert store.load("s") == _entries(3)
+
+
+def test_page_walks_backwards(store):
+    for entry in _entries(7):
+        store.append("s", entry)
+
+    rows, has_more = store.page("s", limit=3)
+    assert rows == [(5, ["q4", "a4"]), (6, ["q5", "a5"]), (7, ["q6", "a6"])]
+    assert has_more
+
+    rows, has_more = store.page("s", before=rows[0][0], limit=3)
+    assert [seq for seq, _ in rows] == [2, 3, 4]
+    assert has_more
+
+    rows, has_more = store.page("s", before=rows[0][0], limit=3)
+    assert rows == [(1, ["q0", "a0"])]
+    assert not has_more
+
+
+def test_clear_restarts_history(store):
+    for entry in _entries(3):
+        store.append("s", entry)
+    store.clear("s")
+    assert store.page("s") == ([], False)
+    assert store.append("s", ["new", "turn"]) == 1
+    assert store.page("s") == ([(1, ["new", "turn"])], False)
+
+
+def test_jsonl_folds_clear_and_compacts(tmp_path):
+    store = JsonlHistoryStore(str(tmp_path), compact_threshold=3)
+    for entry in _entries(3):
+        store.append("s", entry)
+    store.clear("s")
+    store.append("s", ["q9", "a9"])
+    assert store.load("s") == [["q9", "a9"]]
+
+    # 失效记录超过阈值后文件被压缩为只含有效记录
+    store.append("s", ["q10", "a10"])
+    with open(store.get_file_path("s"), encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == [{"entry": ["q9", "a9"]}, {"entry": ["q10", "a10"]}]
+    assert store.page("s") == ([(1, ["q9", "a9"]), (2, ["q10", "a10"])], False)
+
+
+def test_jsonl_page_reads_only_the_tail(tmp_path, monkeypatch):
+    store = JsonlHistoryStore(str(tmp_path))
+    for entry in _entries(100):
+        store.append("s", entry)
+    monkeypatch.setattr(store, "_read_lines", lambda path: pytest.fail("page不应读取整个文件"))
+    rows, has_more = store.page("s", limit=2)
+    assert rows == [(99, ["q98", "a98"]), (100, ["q99", "a99"])]
+    assert has_more
+
+
+def test_jsonl_ignores_partial_last_line(tmp_path):
+    store = JsonlHistoryStore(str(tmp_path))
+    store.append("s", ["q0", "a0"])
+    with open(store.get_file_path("s"), "a", encoding="utf-8") as f:
+        f.write('{"entry": ["q1", ')
+
+    # 重新打开（模拟崩溃后重启）时截断残缺行
+    reopened = JsonlHistoryStore(str(tmp_path))
+    assert reopened.load("s") == [["q0", "a0"]]
+    assert reopened.append("s", ["q1", "a1"]) == 2
+    assert reopened.load("s") == [["q0", "a0"], ["q1", "a1"]]
+
+
+def test_jsonl_migrates_legacy_json(tmp_path):
+    history_path = os.path.join(tmp_path, "chat_history")
+    os.makedirs(history_path)
+    with open(os.path.join(history_path, "s.json"), "w", encoding="utf-8") as f:
+        json.dump(_entries(2), f)
+    store = JsonlHistoryStore(str(tmp_path))
+    assert store.load("s") == _entries(2)
+    assert not os.path.exists(os.path.join(history_path, "s.json"))
+
+
+def test_sqlite_imports_jsonl_history(tmp_path):
+    jsonl = JsonlHistoryStore(str(tmp_path))
+    for entry in _entries(3):
+        jsonl.append("s", entry)
+    store = SqliteHistoryStore(str(tmp_path))
+    assert store.page("s", limit=2) == ([(2, ["q1", "a1"]), (3, ["q2", "a2"])], True)
+    assert store.append("s", ["q3", "a3"]) == 4
+
+
+def test_recent_history_cache_serves_latest_page():
+    cache = RecentHistoryCache(max_sessions=2, max_turns=3)
+    assert cache.page("s", 2) is None
+    cache.put("s", list(enumerate(_entries(2), 1)), complete=True)
+    cache.append("s", 3, ["q2", "a2"])
+    assert cache.page("s", 5) == (list(enumerate(_entries(3), 1)), False)
+
+    # 超过 max_turns 后缓存不再完整，更早的记录需要从存储读取
+    cache.append("s", 4, ["q3", "a3"])
+    assert cache.page("s", 3) == (list(enumerate(_entries(3, 1), 2)), True)
+    assert cache.page("s", 5) is None
+
+    cache.put("t", [], complete=True)
+    cache.put("u", [], complete=True)
+    assert cache.get("s") is None
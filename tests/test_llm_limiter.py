@@ -0,0 +1,87 @@
+import asyncio
+
+from better_aim.llm_limiter import LlmAdmissionController
+from better_aim.notifications import SessionNotifier
+
+
+async def _admission_order(sessions, weights=None):
+    """占满唯一的名额后按顺序让各会话排队，返回放行顺序"""
+    limiter = LlmAdmissionController(max_in_flight=1, notifier=SessionNotifier())
+    for session_id, weight in (weights or {}).items():
+        limiter.set_weight(session_id, weight)
+    release = asyncio.Event()
+    order = []
+
+    async def hold():
+        async with limiter.slot("holder"):
+            await release.wait()
+
+    async def request(session_id, i):
+        async with limiter.slot(session_id):
+            order.append(f"{session_id}{i}")
+
+    tasks = [asyncio.create_task(hold())]
+    await asyncio.sleep(0)
+    for i, session_id in enumerate(sessions):
+        tasks.append(asyncio.create_task(request(session_id, i)))
+        await asyncio.sleep(0)
+    queued = limiter.stats()["queue_length"]
+    latest = {session_id: limiter.notifier.latest(session_id) for session_id in set(sessions)}
+    release.set()
+    await asyncio.gather(*tasks)
+    return order, queued, latest, limiter.stats()
+
+
+def test_busy_session_does_not_starve_others():
+    order, queued, latest, stats = asyncio.run(_admission_order(["a", "a", "a", "b"]))
+    assert queued == 4
+    # b 最后才排队，但只需等 a 的第一个请求
+    assert order == ["a0", "b3", "a1", "a2"]
+    assert latest["b"]["type"] == "llm_queued" and latest["b"]["position"] == 2
+    assert stats["in_flight"] == 0 and stats["queue_length"] == 0
+    assert stats["admitted"] == 5 and stats["queued"] == 4
+
+
+def test_weight_scales_share():
+    order, _, _, _ = asyncio.run(_admission_order(["a", "a", "b", "b", "b", "b"], weights={"b": 2}))
+    assert order == ["b2", "a0", "b3", "b4", "a1", "b5"]
+
+
+async def _cancel_queued():
+    limiter = LlmAdmissionController(max_in_flight=1, notifier=SessionNotifier())
+    release = asyncio.Event()
+
+    async def hold():
+        async with limiter.slot("holder"):
+            await release.wait()
+
+    async def request(session_id):
+        async with limiter.slot(session_id):
+            return session_id
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    cancelled = asyncio.create_task(request("a"))
+    waiting = asyncio.create_task(request("b"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    queue_length = limiter.stats()["queue_length"]
+    release.set()
+    await holder
+    return queue_length, await waiting, cancelled.cancelled(), limiter.stats()["in_flight"]
+
+
+def test_cancelled_waiter_leaves_queue():
+    assert asyncio.run(_cancel_queued()) == (1, "b", True, 0)
+
+
+async def _unlimited():
+    limiter = LlmAdmissionController(max_in_flight=0, notifier=SessionNotifier())
+    async with limiter.slot("a"), limiter.slot("a"), limiter.slot("b"):
+        return limiter.stats()
+
+
+def test_zero_means_unlimited():
+    stats = asyncio.run(_unlimited())
+    assert stats["in_flight"] == 3 and stats["queued"] == 0
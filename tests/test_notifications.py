@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+from better_aim.notifications import SessionNotifier
+
+
+async def _collect(notifier, session_id, count, **kwargs):
+    events = []
+    async for event in notifier.subscribe(session_id, **kwargs):
+        events.append(event)
+        if len(events) == count:
+            break
+    return events
+
+
+async def _replay_and_live():
+    notifier = SessionNotifier()
+    notifier.publish("s", {"n": 1})
+    notifier.publish("other", {"n": 0})
+    task = asyncio.create_task(_collect(notifier, "s", 3))
+    await asyncio.sleep(0)
+    assert notifier.subscriber_count("s") == 1
+    notifier.publish("s", {"n": 2})
+    # 跨线程发布也能投递到订阅方的事件循环
+    thread = threading.Thread(target=notifier.publish, args=("s", {"n": 3}))
+    thread.start()
+    thread.join()
+    events = await asyncio.wait_for(task, 1)
+    return events, notifier.subscriber_count("s")
+
+
+def test_subscriber_gets_latest_then_live_events():
+    events, subscribers = asyncio.run(_replay_and_live())
+    assert events == [{"n": 1}, {"n": 2}, {"n": 3}]
+    # 退出迭代后自动退订
+    assert subscribers == 0
+
+
+async def _without_replay():
+    notifier = SessionNotifier()
+    notifier.publish("s", {"n": 1})
+    task = asyncio.create_task(_collect(notifier, "s", 1, replay_latest=False))
+    await asyncio.sleep(0)
+    notifier.publish("s", {"n": 2})
+    return await asyncio.wait_for(task, 1)
+
+
+def test_subscribe_without_replay():
+    assert asyncio.run(_without_replay()) == [{"n": 2}]
+
+
+def test_discard_drops_latest_event():
+    notifier = SessionNotifier()
+    notifier.publish("s", {"n": 1})
+    notifier.discard("s")
+    assert notifier.latest("s") is None
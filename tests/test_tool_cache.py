@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("google.adk")
+
+from better_aim.tool_cache import ToolResultCache
+
+SESSION_A = "a" * 32
+SESSION_B = "b" * 32
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ToolResultCache(tools=["relax"], work_path=str(tmp_path), cache_dir=str(tmp_path / "tool_cache"))
+    for session_id in (SESSION_A, SESSION_B):
+        os.makedirs(tmp_path / session_id)
+    return cache
+
+
+def _write(path, content):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def test_key_ignores_argument_order(cache):
+    assert cache.make_key("relax", {"a": 1, "b": [1, 2]}) == cache.make_key("relax", {"b": [1, 2], "a": 1})
+    assert cache.make_key("relax", {"a": 1}) != cache.make_key("other", {"a": 1})
+    assert cache.make_key("relax", {"a": 1}) != cache.make_key("relax", {"a": 2})
+
+
+def test_key_uses_file_content_across_sessions(cache, tmp_path):
+    _write(tmp_path / SESSION_A / "in.cif", "structure")
+    _write(tmp_path / SESSION_B / "in.cif", "structure")
+    # 相对路径按会话目录解析，内容相同的输入文件得到相同的键
+    key_a = cache.make_key("relax", {"path": "in.cif"}, SESSION_A)
+    assert key_a == cache.make_key("relax", {"path": str(tmp_path / SESSION_B / "in.cif")})
+
+    _write(tmp_path / SESSION_B / "in.cif", "changed structure")
+    assert key_a != cache.make_key("relax", {"path": "in.cif"}, SESSION_B)
+    # 不存在的文件按原字符串参与计算
+    assert cache.make_key("relax", {"path": "missing.cif"}, SESSION_A) == \
+        cache.make_key("relax", {"path": "missing.cif"}, SESSION_B)
+
+
+def test_session_key_is_per_session(cache):
+    key = cache.make_key("relax", {"a": 1})
+    assert cache.session_key(key, SESSION_A) != cache.session_key(key, SESSION_B)
+
+
+async def _run_twice(cache, result, first, second):
+    """同一参数先后在两个会话中调用，返回实际执行的次数；result 可以是按会话生成结果的函数"""
+    calls = []
+
+    async def run(session_id):
+        async def call():
+            calls.append(session_id)
+            return result(session_id) if callable(result) else result
+        await cache.run("relax", {"x": 1}, call, session_id=session_id)
+
+    await run(first)
+    await run(second)
+    return len(calls)
+
+
+def test_shared_result_hits_across_sessions(cache):
+    assert asyncio.run(_run_twice(cache, {"energy": -1.0}, SESSION_A, SESSION_B)) == 1
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_result_pointing_into_session_is_not_shared(cache, tmp_path):
+    def result(session_id):
+        return {"output": str(tmp_path / session_id / "out.cif")}
+
+    assert asyncio.run(_run_twice(cache, result, SESSION_A, SESSION_B)) == 2
+    assert cache.stats()["session_scoped"] == 2
+    assert asyncio.run(_run_twice(cache, result, SESSION_A, SESSION_B)) == 0
+
+
+def test_error_results_are_not_cached(cache):
+    assert asyncio.run(_run_twice(cache, {"isError": True}, SESSION_A, SESSION_A)) == 2
+    assert cache.stats()["uncacheable"] == 2
+
+
+def test_disk_cache_survives_restart(cache, tmp_path):
+    asyncio.run(_run_twice(cache, {"energy": -1.0}, SESSION_A, SESSION_A))
+    restarted = ToolResultCache(tools=["relax"], work_path=str(tmp_path), cache_dir=cache.cache_dir)
+    assert asyncio.run(_run_twice(restarted, {"energy": -1.0}, SESSION_B, SESSION_B)) == 0
+    assert restarted.stats()["disk_hits"] == 1
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from better_aim.uploads import ChunkedUploadManager, UploadError, UploadSizeLimitMiddleware, UploadTooLargeError, \
+    save_upload_stream
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+async def _call_middleware(messages, headers=(), limit=100):
+    received = []
+    sent = []
+
+    async def app(scope, receive, send):
+        # 模拟框架读取整个请求体后再响应
+        while True:
+            message = await receive()
+            received.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/api/upload/" + "a" * 32, "headers": list(headers)}
+    middleware = UploadSizeLimitMiddleware(app, max_bytes=lambda: limit, overhead=0)
+    await middleware(scope, receive, send)
+    return received, sent
+
+
+def _body(size, more=False):
+    return {"type": "http.request", "body": b"x" * size, "more_body": more}
+
+
+def test_middleware_stops_reading_chunked_body_over_limit():
+    messages = [_body(60, more=True), _body(60, more=True), _body(60)]
+    received, sent = asyncio.run(_call_middleware(messages))
+    assert sent[0]["status"] == 413
+    assert "detail" in json.loads(sent[1]["body"])
+    # 第二块超限后不再继续读取
+    assert len(received) == 1 and len(messages) == 1
+
+
+def test_middleware_rejects_by_content_length():
+    messages = [_body(10)]
+    received, sent = asyncio.run(_call_middleware(messages, headers=[(b"content-length", b"500")]))
+    assert sent[0]["status"] == 413
+    assert received == [] and len(messages) == 1
+
+
+def test_middleware_passes_small_body():
+    received, sent = asyncio.run(_call_middleware([_body(60, more=True), _body(40)]))
+    assert sent[0]["status"] == 200
+    assert sum(len(body) for body in received) == 100
+
+
+def test_save_upload_stream_discards_oversized_file(tmp_path):
+    dest = os.path.join(tmp_path, "f.bin")
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(save_upload_stream(_chunks(b"x" * 6, b"x" * 6), dest, max_bytes=10))
+    assert os.listdir(tmp_path) == []
+
+    assert asyncio.run(save_upload_stream(_chunks(b"ab", b"cd"), dest, max_bytes=10)) == 4
+    assert open(dest, "rb").read() == b"abcd"
+
+
+async def _resume(session_dir):
+    uploads = ChunkedUploadManager(max_bytes=100, max_chunk_bytes=4)
+    upload = await uploads.create(session_dir, "../data.bin", 10)
+    upload_id = upload["upload_id"]
+    assert upload["filename"] == "data.bin"
+
+    await uploads.append(session_dir, upload_id, 0, _chunks(b"0123"))
+    # 超过分块上限的一块被丢弃，偏移量保持不变
+    with pytest.raises(UploadError) as exc:
+        await uploads.append(session_dir, upload_id, 4, _chunks(b"45", b"678"))
+    assert exc.value.status_code == 413
+
+    # 新的管理器（模拟重启）从 .part 文件大小恢复偏移量
+    uploads = ChunkedUploadManager(max_bytes=100, max_chunk_bytes=4)
+    assert (await uploads.status(session_dir, upload_id))["offset"] == 4
+    with pytest.raises(UploadError) as exc:
+        await uploads.append(session_dir, upload_id, 0, _chunks(b"0123"))
+    assert exc.value.status_code == 409
+    with pytest.raises(UploadError) as exc:
+        await uploads.complete(session_dir, upload_id)
+    assert exc.value.status_code == 409
+
+    await uploads.append(session_dir, upload_id, 4, _chunks(b"4567"))
+    await uploads.append(session_dir, upload_id, 8, _chunks(b"89"))
+    return await uploads.complete(session_dir, upload_id)
+
+
+def test_chunked_upload_resumes_from_part_file(tmp_path):
+    uploaded = asyncio.run(_resume(str(tmp_path)))
+    assert uploaded["size"] == 10
+    assert open(os.path.join(tmp_path, "data.bin"), "rb").read() == b"0123456789"
+    assert os.listdir(os.path.join(tmp_path, ".uploads")) == []
+
+
+async def _create_and_abort(session_dir):
+    uploads = ChunkedUploadManager(max_bytes=100)
+    with pytest.raises(UploadTooLargeError):
+        await uploads.create(session_dir, "big.bin", 101)
+    upload = await uploads.create(session_dir, "a.bin", 10)
+    await uploads.abort(session_dir, upload["upload_id"])
+    with pytest.raises(UploadError) as exc:
+        await uploads.status(session_dir, upload["upload_id"])
+    return exc.value.status_code
+
+
+def test_chunked_upload_abort_removes_files(tmp_path):
+    assert asyncio.run(_create_and_abort(str(tmp_path))) == 404
+    assert os.listdir(os.path.join(tmp_path, ".uploads")) == []
@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from better_aim.ws_stream import CoalescingSender
+
+
+class _SlowWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.release = asyncio.Event()
+
+    async def send_text(self, data):
+        await self.release.wait()
+        self.sent.append(json.loads(data))
+
+
+async def _coalesce():
+    websocket = _SlowWebSocket()
+    websocket.release.set()
+    sender = CoalescingSender(websocket, flush_interval=10, flush_bytes=1024)
+    for part in ("a", "b", "c"):
+        await sender.send({"type": "delta", "content": part})
+    await sender.send({"type": "final_response", "content": "abc"})
+    await sender.close()
+    return websocket.sent
+
+
+def test_deltas_are_coalesced_before_other_messages():
+    assert asyncio.run(_coalesce()) == [{"type": "delta", "content": "abc"},
+                                        {"type": "final_response", "content": "abc"}]
+
+
+async def _abort_replaced():
+    websocket = _SlowWebSocket()
+    sender = CoalescingSender(websocket, flush_interval=0, max_queued_frames=4)
+    for i in range(3):
+        await sender.send({"type": "event", "n": i})
+    await sender.abort()
+    websocket.release.set()
+    await asyncio.sleep(0)
+    with pytest.raises(ConnectionError):
+        await sender.send({"type": "event", "n": 3})
+    return websocket.sent
+
+
+def test_abort_drops_queued_frames_and_rejects_new_ones():
+    assert asyncio.run(_abort_replaced()) == []